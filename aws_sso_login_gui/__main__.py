@@ -1,5 +1,8 @@
 import sys
 
+# first, so --startup-profile times include the imports below
+from . import startup
+
 from .app import main
 
 sys.exit(main())
@@ -1,84 +1,291 @@
+import sys
 import logging
 import time
+import datetime
 import os
 import argparse
+import functools
+import threading
 
-from PyQt5 import QtCore, QtWidgets, QtGui
+# QtWidgets and QtGui are imported where the GUI is set up, so that the
+# headless mode doesn't load them
+from PyQt5 import QtCore
 
-from . import fakes, widgets, token_fetcher
+# botocore, and the token fetchers and fakes that use it, are imported
+# when they're first needed, on the worker thread; see lazy_creator()
+from . import startup
 from .config import Config
+from .paths import get_token_dir, get_snapshot_path
+from .watcher import ConfigWatcher
+from .profile_scanner import ProfileScanner
 
 LOGGER = logging.getLogger("app")
 
 logging.basicConfig(level=logging.DEBUG)
 
+def get_config_paths(home_dir=None):
+    if home_dir:
+        config_file = os.path.join(home_dir, '.aws', 'config')
+        credentials_file = os.path.join(home_dir, '.aws', 'credentials')
+    else:
+        config_file = os.environ.get('AWS_CONFIG_FILE', os.path.join('~', '.aws', 'config'))
+        credentials_file = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', os.path.join('~', '.aws', 'credentials'))
+    return os.path.expanduser(config_file), os.path.expanduser(credentials_file)
+
 def get_session_vars(home_dir=None):
     if home_dir:
+        config_file, credentials_file = get_config_paths(home_dir)
         return {
-            'config_file': (None, None, os.path.expanduser(os.path.join(home_dir, '.aws.', 'config')), None),
-            'credentials_file': (None, None, os.path.expanduser(os.path.join(home_dir, '.aws.', 'credentials')), None),
+            'config_file': (None, None, config_file, None),
+            'credentials_file': (None, None, credentials_file, None),
         }
 
-SESSION = None
+SESSIONS = {}
 def get_session(refresh=False, home_dir=None):
-    global SESSION
-    if not SESSION or refresh:
+    # one session per home dir, so that --home-dir and --wsl are honored
+    if home_dir not in SESSIONS or refresh:
         import botocore.session
-        SESSION = botocore.session.Session(session_vars=get_session_vars(home_dir=home_dir))
-    return SESSION
+        SESSIONS[home_dir] = botocore.session.Session(session_vars=get_session_vars(home_dir=home_dir))
+    return SESSIONS[home_dir]
 
 def get_config_loader(parser, args):
     # if args.test_config:
     #     import botocore.configloader
     #     config_data = botocore.configloader.load_config(args.test_config)
     #     return fakes.get_config_loader(config_data['profiles'])
+    # Reloading only needs the SSO settings, so rather than building a new
+    # botocore session each time, scan the config file for them.
+    scanner = ProfileScanner()
+    config_file, _ = get_config_paths(args.home_dir)
     def config_loader():
-        session = get_session(refresh=True, home_dir=args.home_dir)
-        return session.full_config['profiles']
+        return scanner.scan(config_file)
     return config_loader
 
 def get_token_fetcher_kwargs(parser, args):
     kwargs = {}
     if args.test_controls:
-        controls = fakes.ControlsWidget(args.test_token_fetcher)
+        from .controls import ControlsWidget
+        controls = ControlsWidget(args.test_token_fetcher)
         if args.test_token_fetcher:
             kwargs['delay'] = controls.delay
     else:
         controls = None
         if args.test_token_fetcher:
             kwargs['delay'] = 20
-    kwargs['on_pending_authorization'] = token_fetcher.on_pending_authorization
     if args.home_dir:
         kwargs['home_dir'] = args.home_dir
     return kwargs, controls
 
-def get_token_fetcher_creator(parser, args):
-    kwargs, controls = get_token_fetcher_kwargs(parser, args)
-    if args.test_token_fetcher:
-        token_fetcher_creator = fakes.get_token_fetcher_creator(**kwargs)
+def get_on_pending_authorization(parser, args):
+    from . import token_fetcher
+    if args.headless:
+        return token_fetcher.log_pending_authorization
     else:
-        kwargs['session'] = get_session()
-        token_fetcher_creator = token_fetcher.get_token_fetcher_creator(**kwargs)
-    return token_fetcher_creator, controls
-
-def initialize(parser, app, config_loader, token_fetcher_creator, time_fetcher=None):
-    icon = QtGui.QIcon("sso-icon.ico")
-
-    # app.setWindowIcon(icon)
+        return token_fetcher.on_pending_authorization
+
+def lazy_creator(factory, phase=None):
+    """A fetcher creator that gets the real one from factory() when it's first called.
+
+    Building the real creators imports botocore and creates a session,
+    which takes longer than everything else at startup put together. Config
+    only calls its creators on the worker thread, so this keeps that off the
+    main thread, and the window shows up without waiting for it."""
+    creator = None
+    lock = threading.Lock()
+    def lazy(region):
+        nonlocal creator
+        with lock:
+            if creator is None:
+                creator = factory()
+                if phase:
+                    startup.mark(phase)
+        return creator(region)
+    return lazy
 
+def get_token_fetcher_creator(parser, args):
+    kwargs, controls = get_token_fetcher_kwargs(parser, args)
+    def factory():
+        kwargs['on_pending_authorization'] = get_on_pending_authorization(parser, args)
+        if args.test_token_fetcher:
+            from . import fakes
+            return fakes.get_token_fetcher_creator(**kwargs)
+        from . import token_fetcher
+        kwargs['session'] = get_session(home_dir=args.home_dir)
+        if args.async_fetcher:
+            from .async_token_fetcher import get_loop
+            kwargs['loop'] = get_loop()
+        return token_fetcher.get_token_fetcher_creator(**kwargs)
+    return lazy_creator(factory, phase='load token fetcher'), controls
+
+def get_config_kwargs(parser, args):
+    kwargs = {}
+    # imports write to the config file in the home dir; this is the same
+    # long-lived session the fetchers' clients come from
+    kwargs['session_fetcher'] = functools.partial(get_session, home_dir=args.home_dir)
+    if not args.test_token_fetcher:
+        def factory():
+            from .role_credentials import get_role_credentials_fetcher_creator
+            return get_role_credentials_fetcher_creator(get_session(home_dir=args.home_dir))
+        kwargs['role_credentials_fetcher_creator'] = lazy_creator(factory)
+    # the fake tokens are only in memory, so their statuses aren't worth keeping
+    if not (args.no_snapshot or args.test_token_fetcher):
+        kwargs['snapshot_path'] = get_snapshot_path(args.home_dir)
+    if args.refresh_workers:
+        kwargs['max_refresh_workers'] = args.refresh_workers
+    if args.no_proactive_renewal:
+        kwargs['proactive_renewal'] = False
+    if args.renewal_lead_time is not None:
+        kwargs['renewal_lead_time'] = datetime.timedelta(minutes=args.renewal_lead_time)
+    return kwargs
+
+def initialize_config(parser, config_loader, token_fetcher_creator, time_fetcher=None,
+        restore_snapshot=False, **config_kwargs):
     thread = QtCore.QThread()
 
-    config = Config(config_loader, token_fetcher_creator, time_fetcher=time_fetcher, session_fetcher=get_session)
+    config_kwargs.setdefault('session_fetcher', get_session)
+    config = Config(config_loader, token_fetcher_creator,
+        time_fetcher=time_fetcher,
+        **config_kwargs)
 
     config.moveToThread(thread)
 
+    # ahead of the reload, which only emits what's changed since
+    if restore_snapshot:
+        thread.started.connect(config.restore_snapshot)
     thread.started.connect(config.reload)
 
+    return config, thread
+
+def initialize(parser, app, config_loader, token_fetcher_creator, time_fetcher=None, **config_kwargs):
+    from PyQt5 import QtGui
+    from . import widgets
+
+    icon = QtGui.QIcon("sso-icon.ico")
+
+    # app.setWindowIcon(icon)
+
+    config, thread = initialize_config(parser, config_loader, token_fetcher_creator,
+        time_fetcher=time_fetcher,
+        restore_snapshot=True,
+        **config_kwargs)
+
     window = widgets.AWSSSOLoginWindow(icon, config)
     tray_icon = widgets.AWSSSOLoginTrayIcon(icon, config)
 
     return config, thread, window, tray_icon
 
+def initialize_watcher(parser, args, config, thread):
+    watcher = ConfigWatcher(
+        get_config_paths(args.home_dir),
+        get_token_dir(args.home_dir or '~'),
+    )
+    watcher.moveToThread(thread)
+    thread.started.connect(watcher.start)
+    watcher.config_changed.connect(config.reload)
+    watcher.tokens_changed.connect(config.update_token_status)
+    return watcher
+
+def initialize_metrics_server(parser, args, config):
+    from .metrics import MetricsServer
+    return MetricsServer(port=args.metrics_port, stats_fetcher=config.stats).start()
+
+def initialize_ipc(parser, args, config, thread):
+    from .ipc_server import IPCServer
+    server = IPCServer(config)
+    server.moveToThread(thread)
+    thread.started.connect(server.start)
+
+    # launched at the same time as another instance, which got there first
+    def on_already_running():
+        exit_code = forward_to_running_instance(parser, args)
+        QtCore.QCoreApplication.instance().exit(1 if exit_code is None else exit_code)
+
+    server.already_running.connect(on_already_running)
+    return server
+
+def initialize_import(parser, args, config, thread, ipc_server=None):
+    import_config = functools.partial(config.import_config, os.path.abspath(args.import_file))
+    # if another instance is running, the import is forwarded to it instead
+    if ipc_server is None:
+        thread.started.connect(import_config)
+    else:
+        ipc_server.started.connect(import_config)
+
+SHUTDOWN_TIMEOUT = 5
+# of the timeout, what's kept back for the thread to stop after the fetches
+THREAD_STOP_TIME = 0.5
+
+def stop_worker_thread(config, thread, components=(), timeout=SHUTDOWN_TIMEOUT):
+    """Stop the worker thread cleanly, in about timeout seconds at most.
+
+    components are objects living in the worker thread with a stop slot,
+    like the watcher and the IPC server. Logins in progress are cancelled,
+    and fetches writing to the token cache are waited for, rather than
+    killing the thread under them. Returns whether everything stopped."""
+    deadline = time.monotonic() + timeout
+    if not thread.isRunning():
+        return True
+    # these run in the worker thread, which blocks us until they're done
+    for component in components:
+        QtCore.QMetaObject.invokeMethod(component, 'stop', QtCore.Qt.BlockingQueuedConnection)
+    # what's left of the timeout, less enough for the thread to stop once
+    # the fetches are done, so it isn't terminated just for running late
+    fetch_timeout = max(0, deadline - time.monotonic() - min(THREAD_STOP_TIME, timeout / 2))
+    finished = QtCore.QMetaObject.invokeMethod(config, 'shutdown', QtCore.Qt.BlockingQueuedConnection,
+        QtCore.Q_RETURN_ARG(bool), QtCore.Q_ARG(float, fetch_timeout))
+    thread.quit()
+    if not thread.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+        # a last resort, e.g. a fetch stuck on the network
+        LOGGER.warning("Worker thread didn't stop within %s seconds, terminating it", timeout)
+        thread.terminate()
+        thread.wait()
+        return False
+    LOGGER.debug("Worker thread stopped in %.3f seconds", timeout - (deadline - time.monotonic()))
+    return finished
+
+def shutdown(parser, args, config, thread, components=(), metrics_server=None):
+    stop_worker_thread(config, thread, components)
+    if args.async_fetcher:
+        from .async_token_fetcher import stop_loop
+        stop_loop(timeout=1)
+    if metrics_server:
+        metrics_server.stop()
+    # if no fetcher was ever created, there's no session and nothing to close
+    if not args.test_token_fetcher and args.home_dir in SESSIONS:
+        from .clients import get_client_registry
+        get_client_registry(SESSIONS[args.home_dir]).close()
+
+def forward_to_running_instance(parser, args):
+    """Pass this launch's command on to an instance that's already running.
+
+    Returns None if there's no running instance, otherwise the exit code.
+    Connecting checks that the instance is this user's, so the command,
+    which can include a file name, is never sent to anyone else."""
+    from . import ipc
+    client = ipc.IPCClient(timeout=30)
+    try:
+        client.connect()
+    except ipc.ServerNotRunning:
+        return None
+    except ipc.UntrustedServer as e:
+        # run as the only instance; the IPC server won't listen there either
+        LOGGER.error("Not forwarding to the process on the socket: %s", e)
+        return None
+    with client:
+        try:
+            if args.import_file:
+                profile_names = client.request('import_config', {'filename': os.path.abspath(args.import_file)})
+                LOGGER.info("Imported profiles %s", profile_names)
+            if args.reload:
+                client.request('reload')
+            if not (args.import_file or args.reload):
+                client.request('show')
+        except ipc.IPCError as e:
+            LOGGER.error("Running instance returned an error: %s", e)
+            return 1
+    LOGGER.info("Forwarded to the running instance")
+    return 0
+
 class ThreadIdLogger(QtCore.QObject):
     def __init__(self, thread_name):
         super().__init__()
@@ -87,7 +294,33 @@ class ThreadIdLogger(QtCore.QObject):
     def log_id(self):
         LOGGER.debug('%s thread id: %i', self.thread_name, int(QtCore.QThread.currentThreadId()))
 
+class StartupProfiler(QtCore.QObject):
+    """For --startup-profile: once the first statuses are shown, prints
+    where the time went since the process started, and quits."""
+    def __init__(self, app, config):
+        super().__init__()
+        self.app = app
+        QtCore.QTimer.singleShot(0, self.on_event_loop_started)
+        config.snapshot_restored.connect(self.on_snapshot_restored)
+        # queued behind the status updates from the reload
+        config.reload_status_update_finished.connect(self.on_first_status)
+
+    def on_event_loop_started(self):
+        startup.mark('event loop started')
+
+    @QtCore.pyqtSlot()
+    def on_snapshot_restored(self):
+        startup.mark('snapshot shown')
+
+    @QtCore.pyqtSlot()
+    def on_first_status(self):
+        startup.mark('first status shown')
+        sys.stderr.write(startup.report() + '\n')
+        self.app.quit()
+
 def main():
+    startup.mark('import app')
+
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--log-level', '-l', choices=['DEBUG', 'INFO'])
@@ -96,6 +329,42 @@ def main():
 
     parser.add_argument('--wsl', nargs=2, metavar=('DISTRO', 'USER'))
 
+    parser.add_argument('--refresh-workers', type=int, metavar='N',
+        help='maximum number of logins to run concurrently')
+
+    parser.add_argument('--no-proactive-renewal', action='store_true',
+        help="don't renew tokens ahead of expiration")
+
+    parser.add_argument('--renewal-lead-time', type=float, metavar='MINUTES',
+        help='how long before expiration to renew tokens')
+
+    parser.add_argument('--async-fetcher', action='store_true',
+        help='poll for logins on an asyncio loop rather than a thread each')
+
+    parser.add_argument('--no-watch', action='store_true',
+        help="don't watch the config files and token cache for changes")
+
+    parser.add_argument('--no-ipc', action='store_true',
+        help="don't listen for requests from other apps on a local socket")
+
+    parser.add_argument('--no-snapshot', action='store_true',
+        help="don't show the state from the last run at startup, or save it")
+
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+        help='serve metrics for Prometheus on localhost:PORT/metrics')
+
+    parser.add_argument('--reload', action='store_true',
+        help='reload the settings of the running instance')
+
+    parser.add_argument('--import', dest='import_file', metavar='FILE',
+        help='import settings from FILE')
+
+    parser.add_argument('--headless', action='store_true',
+        help='run without any UI, logging login instructions instead')
+
+    parser.add_argument('--startup-profile', action='store_true',
+        help='print how long each part of startup took once the first statuses are shown, and exit')
+
     parser.add_argument('--test-controls', action='store_true')
 
     parser.add_argument('--test-token-fetcher', action='store_true')
@@ -110,7 +379,22 @@ def main():
     if args.wsl:
         args.home_dir = os.path.join(r"\\wsl$", args.wsl[0], 'home', args.wsl[1])
 
+    # Only one instance runs at a time; a second launch hands its command
+    # to the first and exits.
+    if not args.no_ipc:
+        exit_code = forward_to_running_instance(parser, args)
+        if exit_code is not None:
+            return exit_code
+        startup.mark('check for running instance')
+
+    if args.headless:
+        from . import headless
+        return headless.main(parser, args)
+
+    from PyQt5 import QtWidgets
+
     app = QtWidgets.QApplication([])
+    startup.mark('create application')
 
     config_loader = get_config_loader(parser, args)
 
@@ -120,10 +404,33 @@ def main():
     if controls:
         time_fetcher = controls.get_time
 
-    config, thread, window, tray_icon = initialize(parser, app, config_loader, token_fetcher_creator, time_fetcher=time_fetcher)
+    config, thread, window, tray_icon = initialize(parser, app, config_loader, token_fetcher_creator,
+        time_fetcher=time_fetcher,
+        **get_config_kwargs(parser, args))
+    startup.mark('create window and tray icon')
+
+    components = []
+    if not args.no_watch:
+        watcher = initialize_watcher(parser, args, config, thread)
+        components.append(watcher)
+
+    ipc_server = None
+    if not args.no_ipc:
+        ipc_server = initialize_ipc(parser, args, config, thread)
+        ipc_server.show_requested.connect(window.bring_to_front)
+        components.append(ipc_server)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = initialize_metrics_server(parser, args, config)
+
+    if args.import_file:
+        initialize_import(parser, args, config, thread, ipc_server)
+    startup.mark('set up watcher and servers')
 
     window.show()
     tray_icon.show()
+    startup.mark('show window and tray icon')
 
     if controls:
         controls.time_changed.connect(config.update_timers)
@@ -138,10 +445,13 @@ def main():
 
     thread.start()
 
-    def on_close():
-        LOGGER.debug('on_close')
-        thread.terminate()
+    def on_quit():
+        LOGGER.debug('on_quit')
+        shutdown(parser, args, config, thread, components, metrics_server)
+
+    app.aboutToQuit.connect(on_quit)
 
-    app.lastWindowClosed.connect(on_close)
+    if args.startup_profile:
+        profiler = StartupProfiler(app, config)
 
     return app.exec_()
@@ -0,0 +1,196 @@
+"""A token fetcher whose device flow polling runs as a coroutine.
+
+SSOTokenFetcher blocks a thread for the whole device flow, most of it asleep
+between polls. AsyncSSOTokenFetcher runs fetches as tasks on an AsyncLoop
+instead: waiting between polls holds no thread, so any number of pending
+logins share the loop's thread, and the botocore calls themselves run
+briefly on the loop's executor. A fetch can be cancelled at any await,
+which stops its polling right away. The fetch itself is SSOTokenFetcher's
+_fetch_steps; only how each step is run differs.
+
+submit_fetch() returns a concurrent.futures.Future, which RefreshEngine.submit_future
+brings back into the Qt event loop; cancelling that future cancels the task.
+"""
+import asyncio
+import logging
+import threading
+import functools
+import concurrent.futures
+
+from .file_lock import FileLock
+from .token_fetcher import (
+    SSOTokenFetcher,
+    FetchCancelledError,
+    _SLEEP,
+    _LOCK,
+    _WRITE,
+)
+
+LOGGER = logging.getLogger("async_token_fetcher")
+
+class AsyncLoop(object):
+    """An asyncio event loop running on its own daemon thread."""
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, max_workers=None, name='asyncio'):
+        if max_workers is None:
+            max_workers = self.DEFAULT_MAX_WORKERS
+        self._loop = asyncio.new_event_loop()
+        # for the blocking botocore and cache calls
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers,
+            thread_name_prefix=name + '-executor')
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        self.logger = LOGGER.getChild("AsyncLoop")
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro):
+        """Run a coroutine on the loop, returning a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def stop(self, timeout=None):
+        """Cancel all tasks, wait up to timeout for them to finish, and stop.
+
+        Returns True if everything finished in time."""
+        if not self._thread.is_alive():
+            return True
+        async def cancel_tasks():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finished = True
+        try:
+            self.submit(cancel_tasks()).result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.logger.warning("Tasks didn't finish within %s seconds", timeout)
+            finished = False
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+        return finished and not self._thread.is_alive()
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+def get_loop():
+    """The process-wide AsyncLoop, started on first use."""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = AsyncLoop().start()
+        return _LOOP
+
+def stop_loop(timeout=None):
+    """Stop the process-wide AsyncLoop, if it was started."""
+    global _LOOP
+    with _LOOP_LOCK:
+        loop, _LOOP = _LOOP, None
+    if loop is None:
+        return True
+    return loop.stop(timeout)
+
+class AsyncSSOTokenFetcher(SSOTokenFetcher):
+    def __init__(self, *args, loop=None, sleep=None, **kwargs):
+        # sleep is a coroutine function here
+        if sleep is None:
+            sleep = asyncio.sleep
+        super().__init__(*args, sleep=sleep, **kwargs)
+        if loop is None:
+            loop = get_loop()
+        self._loop = loop
+        self._futures = set()
+
+    def _call(self, fn, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def _write(self, fn, *args):
+        # If we're cancelled during a write, let it finish before letting go
+        # of the lock, so nobody else writes the entry at the same time.
+        write = self._call(fn, *args)
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await asyncio.gather(write, return_exceptions=True)
+            raise
+
+    async def _acquire(self, lock):
+        if not isinstance(lock, FileLock):
+            lock.__enter__()
+            return
+        # Waiting in the executor would tie up one of its threads for as
+        # long as another process holds the lock, e.g. for its own device
+        # flow, so poll on the loop instead.
+        while not lock.try_acquire():
+            if self._cancelled.is_set():
+                raise FetchCancelledError()
+            await asyncio.sleep(lock.poll_interval)
+
+    async def _run_step_async(self, kind, *args):
+        if kind == _SLEEP:
+            await self._sleep(*args)
+        elif kind == _LOCK:
+            await self._acquire(*args)
+        elif kind == _WRITE:
+            fn, fn_args = args
+            await self._write(fn, *fn_args)
+        else:
+            fn, fn_args = args
+            return await self._call(fn, *fn_args)
+
+    async def _run_steps_async(self, steps):
+        # the same steps as SSOTokenFetcher._run_steps, awaiting each one
+        result = error = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            result = error = None
+            try:
+                result = await self._run_step_async(*step)
+            except asyncio.CancelledError:
+                # let the steps clean up, e.g. release the lock and count
+                # the device flow as cancelled
+                try:
+                    steps.throw(FetchCancelledError())
+                except FetchCancelledError:
+                    pass
+                finally:
+                    steps.close()
+                raise
+            except Exception as e:
+                error = e
+
+    async def fetch_token_async(self, start_url, force_refresh=False, renew=False):
+        return await self._run_steps_async(self._fetch_steps(start_url, force_refresh, renew))
+
+    def submit_fetch(self, start_url, force_refresh=False, renew=False):
+        """Start a fetch on the loop, returning a concurrent future."""
+        if self._cancelled.is_set():
+            raise FetchCancelledError()
+        future = self._loop.submit(self.fetch_token_async(start_url,
+            force_refresh=force_refresh, renew=renew))
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def shutdown(self):
+        super().shutdown()
+        for future in list(self._futures):
+            future.cancel()
+
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        return self.submit_fetch(start_url, force_refresh=force_refresh, renew=renew).result()
@@ -0,0 +1,93 @@
+"""Shared botocore clients.
+
+The token fetchers and role credentials fetchers each need a client per
+region, and are created lazily on whatever thread first needs them. A
+ClientRegistry hands out one client per service, region, and config for
+the life of a session instead, so fetchers created concurrently or after a
+reload reuse clients, and their connection pools, rather than building
+more. Creating a client also happens once under a lock, so two threads
+asking at once don't both pay for it.
+"""
+import logging
+import threading
+
+from botocore.config import Config
+
+LOGGER = logging.getLogger("clients")
+
+class ClientRegistry(object):
+    # Idle connections aren't kept open, so this only caps how many
+    # concurrent logins in one region get their own connection.
+    DEFAULT_MAX_POOL_CONNECTIONS = 32
+
+    def __init__(self, session, max_pool_connections=None):
+        self._session = session
+        if max_pool_connections is None:
+            max_pool_connections = self.DEFAULT_MAX_POOL_CONNECTIONS
+        self._max_pool_connections = max_pool_connections
+        self._clients = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+
+        self.logger = LOGGER.getChild("ClientRegistry")
+
+    @property
+    def session(self):
+        return self._session
+
+    def create_client(self, service_name, config=None, endpoint_url=None):
+        """Session.create_client, returning the existing client if there is one."""
+        key = (service_name, _config_key(config), endpoint_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            pool_config = Config(max_pool_connections=self._max_pool_connections)
+            config = config.merge(pool_config) if config else pool_config
+            kwargs = {'config': config}
+            if endpoint_url is not None:
+                kwargs['endpoint_url'] = endpoint_url
+            self.logger.debug("Creating %s client for %s", service_name, config.region_name)
+            client = self._session.create_client(service_name, **kwargs)
+            self._clients[key] = client
+            self.created += 1
+            return client
+
+    def close(self):
+        """Close the clients' connections."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            # only in newer versions of botocore
+            if hasattr(client, 'close'):
+                client.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+def _config_key(config):
+    if config is None:
+        return None
+    # the options that were given, which is what Config.merge goes by
+    return tuple(sorted((name, repr(value)) for name, value in config._user_provided_options.items()))
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+def get_client_registry(session):
+    """The registry for a session, so that everything using it shares clients."""
+    with _REGISTRIES_LOCK:
+        entry = _REGISTRIES.get(id(session))
+        # keyed by id, so hold on to the session to keep the id from being reused
+        if entry is None or entry[0] is not session:
+            entry = _REGISTRIES[id(session)] = (session, ClientRegistry(session))
+        return entry[1]
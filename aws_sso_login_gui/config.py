@@ -1,18 +1,21 @@
 import datetime
-import collections
 import re
-import os
 import logging
 import configparser
 import traceback
+import functools
+import heapq
+import itertools
+import random
+import time
+import concurrent.futures
 
-import botocore.session
-from botocore.utils import tzutc
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QTimer
 
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QTimer, QThread
-
-from .token_fetcher import SSOTokenFetcher
-from .config_file_writer import write_values as write_config_profile_values
+from .refresh import RefreshEngine, RENEW, REFRESH, FORCE_REFRESH
+from .metrics import get_registry
+from .config_file_writer import write_profiles as write_config_profiles
+from .snapshot import load_snapshot, save_snapshot
 
 LOGGER = logging.getLogger("config")
 
@@ -24,17 +27,168 @@ STATUS_DISABLED = 'disabled'
 def _status_from_expired(expired):
     return STATUS_EXPIRED if expired else STATUS_VALID
 
+def _get_emitted_status(status, enabled, expiration):
+    if expiration is None:
+        expiration = ''
+    else:
+        expiration = expiration.isoformat()
+    if not enabled:
+        status = STATUS_DISABLED
+    return status, expiration
+
+def get_sso_id(start_url):
+    sso_id = start_url
+
+    https_prefix = 'https://'
+    if sso_id.startswith(https_prefix):
+        sso_id = sso_id[len(https_prefix):]
+
+    start_url_suffix = '/start'
+    if sso_id.endswith(start_url_suffix):
+        sso_id = sso_id[:-len(start_url_suffix)]
+
+    awsapps_domain = '.awsapps.com'
+    if sso_id.endswith(awsapps_domain):
+        sso_id = sso_id[:-len(awsapps_domain)]
+
+    return sso_id
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+_MAX_JITTER_FRACTION = 0.5
+
+def get_renewal_time(now, expiration, refresh_deadline, lead_time=None, jitter=None,
+        last_renewal=None, min_interval=None, rng=random):
+    """Get the time at which a token should be renewed ahead of expiration.
+
+    Without a lead time, renewal happens at the token fetcher's refresh
+    deadline. A random jitter of up to ``jitter`` is subtracted so that
+    instances that logged in together don't all renew at once; it's capped
+    at half the time left until then, so it never moves renewal into the
+    past. A token is not renewed again within ``min_interval`` of its last
+    renewal, so a lead time that is long compared to the token lifetime
+    can't cause back-to-back renewals.
+    """
+    if lead_time is None:
+        renewal_time = refresh_deadline
+    else:
+        renewal_time = expiration - lead_time
+    if jitter:
+        max_jitter = min(jitter.total_seconds(), _MAX_JITTER_FRACTION * (renewal_time - now).total_seconds())
+        if max_jitter > 0:
+            renewal_time -= datetime.timedelta(seconds=rng.uniform(0, max_jitter))
+    earliest = now
+    if last_renewal and min_interval:
+        earliest = max(earliest, last_renewal + min_interval)
+    return max(renewal_time, earliest)
+
+class DeadlineScheduler(QObject):
+    """Calls back with keys at their deadlines, using a single timer.
+
+    Deadlines are kept in a min-heap of (deadline, sequence, key) and only
+    the earliest is armed on the timer, so scheduling and cancelling are
+    O(log n). Rescheduling or cancelling a key marks its old heap entry as
+    dead; dead entries are dropped when they reach the top of the heap.
+    """
+    # Deadlines are wall-clock times, but QTimer runs on a monotonic clock
+    # that stops while the system is asleep. Re-arming at least this often
+    # bounds how late a deadline can fire after resuming.
+    _MAX_INTERVAL_MS = 60 * 1000
+
+    def __init__(self, callback, time_fetcher=None, parent=None):
+        super().__init__(parent)
+        self._callback = callback
+
+        if not time_fetcher:
+            time_fetcher = _utc_now
+        self._time_fetcher = time_fetcher
+
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.rescan)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def deadline(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key, deadline):
+        old_entry = self._entries.pop(key, None)
+        if old_entry:
+            old_entry[-1] = None
+        entry = [deadline, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._arm()
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            entry[-1] = None
+
+    def next_deadline(self):
+        """The earliest deadline, or None if nothing is scheduled."""
+        self._pop_dead()
+        return self._heap[0][0] if self._heap else None
+
+    def clear(self):
+        self._entries.clear()
+        self._heap.clear()
+        self._timer.stop()
+
+    def _pop_dead(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+
+    def _arm(self):
+        self._pop_dead()
+        if not self._heap:
+            self._timer.stop()
+            return
+        time_remaining = (self._heap[0][0] - self._time_fetcher()).total_seconds()
+        self._timer.start(max(0, min(int(time_remaining * 1000), self._MAX_INTERVAL_MS)))
+
+    @pyqtSlot()
+    def rescan(self):
+        """Fire everything that is due and re-arm the timer.
+
+        This is also the way to handle the clock jumping."""
+        now = self._time_fetcher()
+        due = []
+        self._pop_dead()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if key is not None:
+                del self._entries[key]
+                due.append(key)
+            self._pop_dead()
+        for key in due:
+            self._callback(key)
+        self._arm()
+
 class SSOInstance(QObject):
     status_changed = pyqtSignal(str, str, str)
 
     def __init__(self, sso_id, start_url, region, token_fetcher,
-                time_fetcher=None):
+                time_fetcher=None, refresh_engine=None, expiration_scheduler=None,
+                metrics=None, enabled=True):
         super().__init__()
         self._sso_id = sso_id
         self._start_url = start_url
         self._region = region
         self.profile_names = []
-        self._enabled = True
+        self._enabled = enabled
         self._status = STATUS_EXPIRED
         self._expiration = None
 
@@ -44,19 +198,59 @@ class SSOInstance(QObject):
 
         self._token_fetcher = token_fetcher
 
-        self._timer = QTimer()
-        self._timer.setSingleShot(True)
-
-        self._timer.timeout.connect(self._timer_event)
+        # if there's no engine, refreshes run synchronously
+        self._refresh_engine = refresh_engine
+
+        # Config shares one scheduler across all instances
+        if expiration_scheduler is None:
+            expiration_scheduler = DeadlineScheduler(lambda sso_id: self.on_expiration_reached(),
+                time_fetcher=time_fetcher, parent=self)
+        self._expiration_scheduler = expiration_scheduler
+
+        if metrics is None:
+            metrics = get_registry()
+        self._status_seconds = metrics.counter('sso_instance_status_seconds_total',
+            'Time instances have spent in each status, added when they leave it', ['status'])
+        self._status_transitions = metrics.counter('sso_instance_status_transitions_total',
+            'Status changes, by the new status', ['status'])
+        self._status_gauge = metrics.gauge('sso_instances',
+            'Instances currently in each status', ['status'])
+        self._recorded_status = None
+        self._recorded_since = None
+        self._record_status()
 
         self.logger = LOGGER.getChild("SSOInstance[{}]".format(sso_id))
 
     def _utc_now(self):
-        return datetime.datetime.now(tzutc())
+        return datetime.datetime.now(datetime.timezone.utc)
 
     def decommision(self):
         self._enabled = False
-        self._timer.stop()
+        self._expiration_scheduler.cancel(self.sso_id)
+        self._stop_recording_status()
+
+    def _set_status(self, status):
+        self._status = status
+        self._record_status()
+
+    def _record_status(self):
+        status = STATUS_DISABLED if not self._enabled else self._status
+        if status == self._recorded_status:
+            return
+        self._stop_recording_status()
+        self._status_gauge.inc(status=status)
+        self._status_transitions.inc(status=status)
+        self._recorded_status = status
+        self._recorded_since = self._time_fetcher()
+
+    def _stop_recording_status(self):
+        if self._recorded_status is None:
+            return
+        # the clock can be set backwards with the test controls
+        seconds = max(0, (self._time_fetcher() - self._recorded_since).total_seconds())
+        self._status_seconds.inc(seconds, status=self._recorded_status)
+        self._status_gauge.dec(status=self._recorded_status)
+        self._recorded_status = None
 
     @property
     def sso_id(self):
@@ -70,6 +264,20 @@ class SSOInstance(QObject):
     def region(self):
         return self._region
 
+    def reconfigure(self, start_url, region, token_fetcher):
+        if start_url == self._start_url and region == self._region:
+            return
+        self.logger.info("Reconfiguring with start URL %s in %s", start_url, region)
+        self._start_url = start_url
+        self._region = region
+        self._token_fetcher = token_fetcher
+        # the token comes from a different cache entry now; the next status
+        # update will load it
+        self._expiration = None
+        self._expiration_scheduler.cancel(self.sso_id)
+        if self._status != STATUS_REFRESHING:
+            self._set_status(STATUS_EXPIRED)
+
     @property
     def enabled(self):
         return self._enabled
@@ -79,6 +287,7 @@ class SSOInstance(QObject):
         old_value = self._enabled
         if value != old_value:
             self._enabled = value
+            self._record_status()
             self.update_timer()
             self._emit()
 
@@ -90,28 +299,80 @@ class SSOInstance(QObject):
             return self._status
         if self._status in [STATUS_REFRESHING, STATUS_DISABLED]:
             return self._status
-        expired = self._token_fetcher.needs_refresh(self.start_url)
-        if not expired and not self._expiration:
-            self._expiration = self._token_fetcher.get_expiration(self.start_url)
-            changed = True
+        # one cache lookup, which for the file cache is a stat
+        expired, expiration = self._token_fetcher.get_refresh_status(self.start_url)
+        if not expired:
+            # This also picks up tokens from logins done by other tools. Like
+            # the result of a refresh, the expiration is the refresh deadline.
+            if expiration != self._expiration:
+                self._expiration = expiration
+                self.update_timer()
+                changed = True
         new_status = _status_from_expired(expired)
         old_status = self._status
         if new_status != old_status:
-            self._status = new_status
+            self._set_status(new_status)
             changed = True
         if changed and _emit:
             self._emit()
         return self._status
 
-    def refresh(self, force_refresh=False):
+    @property
+    def token_fetcher(self):
+        return self._token_fetcher
+
+    def refresh(self, force_refresh=False, renew=False):
         self.logger.info('Refreshing')
         if not self._enabled:
             return
-        self._status = STATUS_REFRESHING
-        self._emit()
-        expiration = self._token_fetcher.fetch_token(self.start_url, force_refresh=force_refresh)
-        #TODO: error handling
-        self._status = STATUS_VALID
+        if self._status != STATUS_REFRESHING:
+            self._set_status(STATUS_REFRESHING)
+            self._emit()
+        fetch = functools.partial(self._token_fetcher.fetch_token, self.start_url,
+            force_refresh=force_refresh, renew=renew)
+        if self._refresh_engine:
+            # If a refresh is already in flight, this attaches to it, unless
+            # it asks for more, like a click during a renewal, which would
+            # otherwise be lost if the renewal can't be done.
+            strength = FORCE_REFRESH if force_refresh else RENEW if renew else REFRESH
+            if hasattr(self._token_fetcher, 'submit_fetch'):
+                # the fetch runs on the fetcher's own loop
+                start = functools.partial(self._token_fetcher.submit_fetch, self.start_url,
+                    force_refresh=force_refresh, renew=renew)
+                return self._refresh_engine.submit_future(self.sso_id, start, self._on_refresh_finished,
+                    strength=strength)
+            return self._refresh_engine.submit(self.sso_id, fetch, self._on_refresh_finished,
+                strength=strength)
+        try:
+            expiration = fetch()
+        except Exception as e:
+            self._on_refresh_finished(None, e)
+        else:
+            self._on_refresh_finished(expiration, None)
+
+    def _on_refresh_finished(self, expiration, exception):
+        # imported here so that botocore is only loaded once it's needed
+        from .token_fetcher import FetchCancelledError, RenewalUnavailableError
+        if isinstance(exception, RenewalUnavailableError):
+            # the token is left as it is, until someone logs in
+            self.logger.info("Can't renew without logging in")
+            self._set_status(STATUS_EXPIRED)
+            self.get_status(update=True, _emit=False)
+            self._emit()
+            return
+        if isinstance(exception, (concurrent.futures.CancelledError, FetchCancelledError)):
+            self.logger.info("Refresh cancelled")
+            # back to whatever the token cache says
+            self._set_status(STATUS_EXPIRED)
+            self.get_status(update=True, _emit=False)
+            self._emit()
+            return
+        if exception:
+            self.logger.error("Refresh failed: %s", exception)
+            self._set_status(STATUS_REFRESH_FAILED)
+            self._emit()
+            return
+        self._set_status(STATUS_VALID)
         self._expiration = expiration
         self.logger.info("Refreshed with expiration %s", self._expiration)
         self.update_timer()
@@ -129,7 +390,7 @@ class SSOInstance(QObject):
     def update_timer(self, emit_on_expired=False):
         if not self._enabled:
             self.logger.debug("disabled, stopping timer")
-            self._timer.stop()
+            self._expiration_scheduler.cancel(self.sso_id)
             return
         if not self._expiration:
             return
@@ -137,89 +398,429 @@ class SSOInstance(QObject):
         if time_remaining <= 0:
             if self._status != STATUS_REFRESHING:
                 self.logger.debug("no time remaining, setting status to expired")
-                self._status = STATUS_EXPIRED
+                self._set_status(STATUS_EXPIRED)
                 self._expiration = None
                 if emit_on_expired:
                     self._emit()
             else:
                 self.logger.debug("no time remaining, but refresh in progress")
         else:
-            self._timer.start(time_remaining*1000)
+            self._expiration_scheduler.schedule(self.sso_id, self._expiration)
             self.logger.debug("timer started %s", time_remaining)
 
-    def _timer_event(self):
+    def on_expiration_reached(self):
         self.logger.debug("Timer expired")
         if self._status in [STATUS_VALID, STATUS_REFRESH_FAILED]:
-            self._status = STATUS_EXPIRED
+            self._set_status(STATUS_EXPIRED)
             self._emit()
 
+    def get_emitted_status(self):
+        """The (status, expiration) that status_changed is emitted with."""
+        return _get_emitted_status(self._status, self._enabled, self.expiration)
+
     def _emit(self):
-        expiration = self.expiration
-        if expiration is None:
-            expiration = ''
-        else:
-            expiration = expiration.isoformat()
-        status = STATUS_DISABLED if not self._enabled else self._status
-        self.status_changed.emit(self.sso_id, status, expiration)
+        self.status_changed.emit(self.sso_id, *self.get_emitted_status())
 
 class Config(QObject):
 
     status_changed = pyqtSignal(str, str, str)
     reloaded = pyqtSignal(list)
+    # added, removed, changed sso ids
+    instances_changed = pyqtSignal(list, list, list)
     reload_status_update_finished = pyqtSignal()
+    # the instances from the snapshot have all been emitted
+    snapshot_restored = pyqtSignal()
 
     import_finished = pyqtSignal(list, str)
 
+    # emitted with the sso id once a refresh, and any status change from it,
+    # has finished
+    refresh_finished = pyqtSignal(str)
+
+    DEFAULT_RENEWAL_JITTER = datetime.timedelta(minutes=2)
+    MIN_RENEWAL_INTERVAL = datetime.timedelta(minutes=1)
+
+    # GetRoleCredentials calls are short, and run on their own workers so
+    # they never wait behind device flows
+    ROLE_CREDENTIALS_WORKERS = 4
+
+    # status changes come in bunches, e.g. on reload; write once they settle
+    SNAPSHOT_SAVE_DELAY_MS = 1000
+
     def __init__(self, config_loader, token_fetcher_creator,
-                session_fetcher=None, time_fetcher=None):
+                session_fetcher=None, time_fetcher=None,
+                max_refresh_workers=None,
+                proactive_renewal=True,
+                renewal_lead_time=None,
+                renewal_jitter=None,
+                role_credentials_fetcher_creator=None,
+                metrics=None,
+                snapshot_path=None,
+                refresh_engine=None,
+                rng=None):
         super().__init__()
         self.config_loader = config_loader
         self._token_fetcher_creator = token_fetcher_creator
+        self._role_credentials_fetcher_creator = role_credentials_fetcher_creator
+        self._role_credentials_fetchers = {}
         self.ignore_list = []
         self.sso_instances = {}
         self.misconfigured_profiles = []
+        self._profile_sso_ids = {}
+        self._sso_profiles = {}
         self._token_fetchers = {}
 
         self._session_fetcher = session_fetcher
         self._time_fetcher = time_fetcher
 
+        # parented so that it moves to the worker thread along with us
+        if refresh_engine is None:
+            refresh_engine = RefreshEngine(max_workers=max_refresh_workers, parent=self)
+        self._refresh_engine = refresh_engine
+        self._refresh_engine.finished.connect(self.refresh_finished)
+        self._role_credentials_engine = RefreshEngine(max_workers=self.ROLE_CREDENTIALS_WORKERS, parent=self)
+
+        # Renew tokens ahead of expiration rather than waiting for someone
+        # to click on an expired instance. A lead time of None means
+        # renewing at the token fetcher's refresh deadline.
+        self._proactive_renewal = proactive_renewal
+        self._renewal_lead_time = renewal_lead_time
+        if renewal_jitter is None:
+            renewal_jitter = self.DEFAULT_RENEWAL_JITTER
+        self._renewal_jitter = renewal_jitter
+        if rng is None:
+            rng = random
+        self._rng = rng
+        self._renewal_scheduler = DeadlineScheduler(self._on_renewal_due,
+            time_fetcher=time_fetcher, parent=self)
+        self._last_renewals = {}
+        # the expiration of the token each instance last tried to renew
+        self._renewed_expirations = {}
+
+        self._expiration_scheduler = DeadlineScheduler(self._on_expiration_due,
+            time_fetcher=time_fetcher, parent=self)
+
+        if metrics is None:
+            metrics = get_registry()
+        self._metrics = metrics
+        self._reload_duration = metrics.histogram('sso_config_reload_duration_seconds',
+            'Time to reload the config and update the status of every instance')
+
+        # The state from the last run, and the enabled settings from it,
+        # loaded on first use. Instances shown from it by restore_snapshot()
+        # are kept, with their emitted status, until the first reload.
+        self._snapshot_path = snapshot_path
+        self._snapshot = None
+        self._enabled_settings = {}
+        self._restored = {}
+        self._reloaded = False
+        self._snapshot_timer = QTimer(self)
+        self._snapshot_timer.setSingleShot(True)
+        self._snapshot_timer.setInterval(self.SNAPSHOT_SAVE_DELAY_MS)
+        self._snapshot_timer.timeout.connect(self.save_snapshot)
+
         self.logger = LOGGER.getChild("Config")
 
+    @pyqtSlot()
+    def restore_snapshot(self):
+        """Emit the instances and statuses from the last run, before the first reload.
+
+        Connect this ahead of reload. The reload then only emits where the
+        config and tokens turn out to differ from the snapshot."""
+        if self._reloaded:
+            return
+        now = self._now()
+        self._restored = {}
+        for sso_id, entry in self._load_snapshot().items():
+            expiration = entry['expiration']
+            status = STATUS_VALID
+            if not expiration or expiration <= now:
+                status, expiration = STATUS_EXPIRED, None
+            if not entry['enabled']:
+                # disabled instances don't load their tokens, so the reload
+                # won't have an expiration for them either
+                expiration = None
+            self._restored[sso_id] = (entry['start_url'], entry['region'],
+                _get_emitted_status(status, entry['enabled'], expiration))
+        if not self._restored:
+            return
+        instances = sorted(self._restored.keys())
+        self.logger.info("Restored %s from the snapshot", instances)
+        self.instances_changed.emit(instances, [], [])
+        self.reloaded.emit(instances)
+        for sso_id in instances:
+            self.status_changed.emit(sso_id, *self._restored[sso_id][2])
+        self.snapshot_restored.emit()
+
     @pyqtSlot()
     def reload(self):
         self.logger.info("Reloading")
-        self._load_instances()
+        start = time.perf_counter()
+        added, removed, changed = self._load_instances()
+        restored, self._restored = self._restored, {}
+        if restored:
+            # what's shown is the snapshot, not an empty list
+            removed = sorted(set(removed) | (set(restored) - set(self.sso_instances)))
+            changed = sorted(set(changed) | set(sso_id for sso_id in added
+                if sso_id in restored and restored[sso_id][:2] != (
+                    self.sso_instances[sso_id].start_url, self.sso_instances[sso_id].region)))
+            added = [sso_id for sso_id in added if sso_id not in restored]
+        self.logger.info("Reload added=%s removed=%s changed=%s", added, removed, changed)
+        self.instances_changed.emit(added, removed, changed)
         instances = sorted(self.sso_instances.keys())
         self.reloaded.emit(instances)
+        # Unchanged instances only need to emit if their status changed
+        # underneath us, e.g. from a login with another tool.
+        must_emit = set(added) | set(changed)
         for sso_id, instance in self.sso_instances.items():
+            if sso_id in restored:
+                old_status = restored[sso_id][2]
+            else:
+                old_status = instance.get_emitted_status()
             status = instance.get_status(update=True, _emit=False)
-            self.logger.info("Loaded SSO instance %s (%s) for profiles %s", sso_id, status, instance.profile_names)
-            instance._emit()
+            self.logger.debug("Loaded SSO instance %s (%s) for profiles %s", sso_id, status, instance.profile_names)
+            if sso_id in must_emit or instance.get_emitted_status() != old_status:
+                instance._emit()
+            elif sso_id in restored:
+                # shown from the snapshot, so renewal wasn't scheduled by an emit
+                self._update_renewal(sso_id, instance.get_status())
+        self._reloaded = True
+        self._schedule_save_snapshot()
+        self._reload_duration.observe(time.perf_counter() - start)
         self.reload_status_update_finished.emit()
 
+    def _load_snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = load_snapshot(self._snapshot_path) if self._snapshot_path else {}
+            for sso_id, entry in self._snapshot.items():
+                self._enabled_settings.setdefault(sso_id, entry['enabled'])
+        return self._snapshot
+
+    def _get_snapshot(self):
+        return {
+            sso_id: {
+                'start_url': instance.start_url,
+                'region': instance.region,
+                'enabled': instance.enabled,
+                'expiration': instance.expiration,
+            }
+            for sso_id, instance in self.sso_instances.items()
+        }
+
+    def _schedule_save_snapshot(self):
+        if self._snapshot_path:
+            self._snapshot_timer.start()
+
+    @pyqtSlot()
+    def save_snapshot(self):
+        """Write the snapshot, if it's changed since it was last read or written."""
+        # before the first reload, there's nothing to go on
+        if not self._snapshot_path or not self._reloaded:
+            return
+        snapshot = self._get_snapshot()
+        if snapshot == self._snapshot:
+            return
+        try:
+            save_snapshot(self._snapshot_path, snapshot)
+        except OSError as e:
+            self.logger.warning("Couldn't write the snapshot to %s: %s", self._snapshot_path, e)
+            return
+        self._snapshot = snapshot
+
     @pyqtSlot(str)
     @pyqtSlot(str, bool)
     def refresh(self, sso_id, force_refresh=False):
         instance = self.sso_instances[sso_id]
         instance.refresh(force_refresh=force_refresh)
 
+    @pyqtSlot(str)
+    def cancel_refresh(self, sso_id):
+        """Cancel a refresh in progress, e.g. a login nobody is going to finish."""
+        return self._refresh_engine.cancel(sso_id)
+
+    @pyqtSlot(float, result=bool)
+    def shutdown(self, timeout):
+        """Cancel logins in progress, wait up to timeout seconds for fetches
+        to finish, so none is cut off writing the token cache, and stop the
+        timers. Returns whether the fetches all finished."""
+        self.logger.info("Shutting down")
+        fetchers = list(self._token_fetchers.values()) + list(self._role_credentials_fetchers.values())
+        for fetcher in fetchers:
+            if hasattr(fetcher, 'shutdown'):
+                fetcher.shutdown()
+        deadline = time.monotonic() + timeout
+        finished = self._refresh_engine.shutdown(timeout)
+        finished = self._role_credentials_engine.shutdown(max(0, deadline - time.monotonic())) and finished
+        # after the fetches, whose results can schedule renewals
+        self._renewal_scheduler.clear()
+        self._expiration_scheduler.clear()
+        self._snapshot_timer.stop()
+        self.save_snapshot()
+        return finished
+
+    def get_sso_id_for_profile(self, profile_name):
+        return self._profile_sso_ids.get(profile_name)
+
+    def get_role_credentials(self, profile_name, callback):
+        """Get role credentials for an SSO profile, then call callback(credentials, exception).
+
+        The instance for the profile must have a valid token. Credentials
+        are served from memory when possible; otherwise they're fetched on
+        workers of their own, and callback is called in this thread."""
+        sso_id = self._profile_sso_ids.get(profile_name)
+        if sso_id is None:
+            raise ValueError("Profile {} is not an SSO profile".format(profile_name))
+        profile = self._sso_profiles[profile_name]
+        account_id = profile.get('sso_account_id')
+        role_name = profile.get('sso_role_name')
+        if not account_id or not role_name:
+            raise ValueError("Profile {} has no sso_account_id or sso_role_name".format(profile_name))
+        if not self._role_credentials_fetcher_creator:
+            raise ValueError("Role credentials are not supported")
+        instance = self.sso_instances[sso_id]
+
+        access_token = instance.token_fetcher.get_access_token(instance.start_url)
+        if access_token is None:
+            raise ValueError("SSO instance {} does not have a valid token".format(sso_id))
+        fetcher = self._get_role_credentials_fetcher(instance.region)
+        credentials = fetcher.get_cached_credentials(instance.start_url, account_id, role_name, access_token)
+        if credentials is not None:
+            callback(credentials, None)
+            return
+        fetch = functools.partial(fetcher.fetch_credentials,
+            instance.start_url, account_id, role_name, access_token)
+        # single-flight per account and role, like token fetches
+        key = '{}/{}/{}'.format(sso_id, account_id, role_name)
+        self._role_credentials_engine.submit(key, fetch, callback)
+
+    def _get_role_credentials_fetcher(self, region):
+        if region not in self._role_credentials_fetchers:
+            self._role_credentials_fetchers[region] = self._role_credentials_fetcher_creator(region)
+        return self._role_credentials_fetchers[region]
+
+    def _invalidate_role_credentials(self, instance):
+        fetcher = self._role_credentials_fetchers.get(instance.region)
+        if fetcher is not None:
+            fetcher.invalidate(instance.start_url)
+
+    def is_refreshing(self, sso_id):
+        return self._refresh_engine.is_refreshing(sso_id)
+
+    def refresh_stats(self):
+        return self._refresh_engine.stats()
+
+    def stats(self):
+        return {
+            'refresh': self.refresh_stats(),
+            'role_credentials': self._role_credentials_engine.stats(),
+            'metrics': self._metrics.snapshot(),
+        }
+
+    @pyqtSlot(list)
+    def update_token_status(self, cache_keys):
+        """Update the status of the instances whose token cache entries changed."""
+        cache_keys = set(cache_keys)
+        for sso_id, instance in self.sso_instances.items():
+            if instance.token_fetcher.get_cache_key(instance.start_url) in cache_keys:
+                self.logger.debug("Token for %s changed", sso_id)
+                self._invalidate_role_credentials(instance)
+                instance.get_status(update=True)
+
     @pyqtSlot(str, bool)
     def set_enable(self, sso_id, enable):
         self.sso_instances[sso_id].enabled = enable
+        # kept in the snapshot, and for the instance coming back after a reload
+        self._enabled_settings[sso_id] = enable
 
     @pyqtSlot()
     def update_timers(self):
-        for sso_id, instance in self.sso_instances.items():
-            instance.update_timer(emit_on_expired=True)
+        # the clock has jumped; fire whatever is now due
+        self._expiration_scheduler.rescan()
+        self._renewal_scheduler.rescan()
+
+    def next_deadline(self):
+        """The earliest time an expiration or renewal is due, or None.
+
+        On a virtual clock the timers don't go off by themselves; move the
+        clock here and call update_timers()."""
+        deadlines = [deadline for deadline in (
+            self._expiration_scheduler.next_deadline(),
+            self._renewal_scheduler.next_deadline()) if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def _on_expiration_due(self, sso_id):
+        instance = self.sso_instances.get(sso_id)
+        if instance is not None:
+            instance.on_expiration_reached()
 
     def _on_instance_status_changed(self, sso_id, status, expiration):
         self.logger.debug("Status changed id=%s status=%s exp=%s", sso_id, status, expiration)
+        # Refreshing, including a forced refresh, means the token is about to
+        # be replaced; otherwise it has expired or gone away.
+        if status != STATUS_VALID and sso_id in self.sso_instances:
+            self._invalidate_role_credentials(self.sso_instances[sso_id])
+        self._update_renewal(sso_id, status)
+        self._schedule_save_snapshot()
         self.status_changed.emit(sso_id, status, expiration)
 
+    def _update_renewal(self, sso_id, status):
+        if not self._proactive_renewal:
+            return
+        instance = self.sso_instances.get(sso_id)
+        # Instances in the expiry window of the token fetcher report as
+        # expired, but can still be renewed before the token runs out.
+        # Once it has run out, it's up to the user.
+        if instance is None or status not in [STATUS_VALID, STATUS_EXPIRED]:
+            self._renewal_scheduler.cancel(sso_id)
+            return
+        token_fetcher = instance.token_fetcher
+        expiration = token_fetcher.get_expiration(instance.start_url)
+        now = self._now()
+        if not expiration or expiration <= now:
+            self._renewal_scheduler.cancel(sso_id)
+            return
+        # Renewal only ever uses the refresh token; a new login is up to the
+        # user. If renewing this token already failed, leave it be.
+        if (not token_fetcher.can_renew(instance.start_url)
+                or self._renewed_expirations.get(sso_id) == expiration):
+            self._renewal_scheduler.cancel(sso_id)
+            return
+        renewal_time = get_renewal_time(now, expiration,
+            token_fetcher.refresh_deadline(instance.start_url),
+            lead_time=self._renewal_lead_time,
+            jitter=self._renewal_jitter,
+            last_renewal=self._last_renewals.get(sso_id),
+            min_interval=self.MIN_RENEWAL_INTERVAL,
+            rng=self._rng)
+        self.logger.debug("Scheduling renewal of %s at %s", sso_id, renewal_time)
+        self._renewal_scheduler.schedule(sso_id, renewal_time)
+
+    def _on_renewal_due(self, sso_id):
+        instance = self.sso_instances.get(sso_id)
+        if instance is None or instance.get_status() == STATUS_REFRESHING:
+            return
+        self.logger.info("Renewing %s ahead of expiration", sso_id)
+        self._last_renewals[sso_id] = self._now()
+        self._renewed_expirations[sso_id] = instance.token_fetcher.get_expiration(instance.start_url)
+        instance.refresh(renew=True)
+
+    def _now(self):
+        if self._time_fetcher:
+            return self._time_fetcher()
+        return _utc_now()
+
     def _load_instances(self):
+        """Update the instances from the config, returning the difference.
+
+        Returns sorted lists of the added, removed, and changed sso ids,
+        where changed means the start URL, region, or profiles changed."""
         config = self.config_loader()
         self.misconfigured_profiles.clear()
-        missing_sso_instances = set(self.sso_instances.keys())
+        # for the enabled settings
+        self._load_snapshot()
+
+        instance_configs = {}
+        sso_profiles = {}
         for profile_name, profile_data in config.items():
             self.logger.debug("profile %s: %s", profile_name, profile_data)
             #TODO: warn on misconfigured profiles
@@ -233,45 +834,73 @@ class Config(QObject):
                     self.logger.debug("Ignorning profile")
                     continue
 
-                sso_id = start_url
-
-                https_prefix = 'https://'
-                if sso_id.startswith(https_prefix):
-                    sso_id = sso_id[len(https_prefix):]
-
-                start_url_suffix = '/start'
-                if sso_id.endswith(start_url_suffix):
-                    sso_id = sso_id[:-len(start_url_suffix)]
-
-                awsapps_domain = '.awsapps.com'
-                if sso_id.endswith(awsapps_domain):
-                    sso_id = sso_id[:-len(awsapps_domain)]
-
-                self.logger.info("SSO id %s for start URL %s", sso_id, start_url)
-
-                if sso_id not in self.sso_instances:
-                    self.logger.debug("Creating instance")
-                    token_fetcher = self._get_token_fetcher(region)
-                    self.sso_instances[sso_id] = SSOInstance(sso_id, start_url, region, token_fetcher, time_fetcher=self._time_fetcher)
-                    self.sso_instances[sso_id].status_changed.connect(self._on_instance_status_changed)
-
-                self.sso_instances[sso_id].profile_names.append(profile_name)
-
-                missing_sso_instances.discard(sso_id)
-
-        self.logger.info("Removed SSO instances: %s", list(missing_sso_instances))
-        for sso_id in missing_sso_instances:
-            sso_instance = self.sso_instances.pop(sso_id)
-            sso_instance.decommision()
+                sso_id = get_sso_id(start_url)
+
+                self.logger.debug("SSO id %s for start URL %s", sso_id, start_url)
+
+                # the first profile for an instance determines its settings
+                if sso_id not in instance_configs:
+                    instance_configs[sso_id] = (start_url, region, [])
+                instance_configs[sso_id][2].append(profile_name)
+                sso_profiles[profile_name] = profile_data
+
+        added = []
+        removed = []
+        changed = []
+
+        for sso_id in list(self.sso_instances.keys()):
+            if sso_id not in instance_configs:
+                sso_instance = self.sso_instances.pop(sso_id)
+                self._invalidate_role_credentials(sso_instance)
+                sso_instance.decommision()
+                self._renewal_scheduler.cancel(sso_id)
+                self._last_renewals.pop(sso_id, None)
+                self._renewed_expirations.pop(sso_id, None)
+                removed.append(sso_id)
+
+        for sso_id, (start_url, region, profile_names) in instance_configs.items():
+            instance = self.sso_instances.get(sso_id)
+            if instance is None:
+                self.logger.info("Creating instance %s for start URL %s", sso_id, start_url)
+                token_fetcher = self._get_token_fetcher(region)
+                instance = SSOInstance(sso_id, start_url, region, token_fetcher,
+                        time_fetcher=self._time_fetcher,
+                        refresh_engine=self._refresh_engine,
+                        expiration_scheduler=self._expiration_scheduler,
+                        metrics=self._metrics,
+                        enabled=self._enabled_settings.get(sso_id, True))
+                instance.status_changed.connect(self._on_instance_status_changed)
+                instance.profile_names = profile_names
+                self.sso_instances[sso_id] = instance
+                added.append(sso_id)
+            elif (start_url, region, profile_names) != (instance.start_url, instance.region, instance.profile_names):
+                self._invalidate_role_credentials(instance)
+                instance.reconfigure(start_url, region, self._get_token_fetcher(region))
+                instance.profile_names = profile_names
+                changed.append(sso_id)
+
+        self._profile_sso_ids = {
+            profile_name: sso_id
+            for sso_id, (_, _, profile_names) in instance_configs.items()
+            for profile_name in profile_names
+        }
+        self._sso_profiles = sso_profiles
+
+        return sorted(added), sorted(removed), sorted(changed)
 
     def _get_token_fetcher(self, region):
         if region not in self._token_fetchers:
             self.logger.debug("Creating token fetcher for region %s", region)
-            self._token_fetchers[region] = self._token_fetcher_creator(region)
+            token_fetcher = self._token_fetcher_creator(region)
+            # so the first login doesn't wait on creating a client
+            if hasattr(token_fetcher, 'prewarm'):
+                token_fetcher.prewarm()
+            self._token_fetchers[region] = token_fetcher
         return self._token_fetchers[region]
 
     @pyqtSlot(str)
     def import_config(self, filename):
+        """Import profiles from a config file, returning (profile names, error string)."""
         try:
             parser = configparser.ConfigParser()
             result = parser.read(filename)
@@ -286,12 +915,13 @@ class Config(QObject):
 
             session = self._session_fetcher()
 
-            for profile_name, profile_data in profiles.items():
-                self.logger.info('writing profile %s', profile_name)
-                write_config_profile_values(session, profile_name, profile_data)
+            self.logger.info('writing profiles %s', list(profiles.keys()))
+            write_config_profiles(session, profiles)
 
             self.import_finished.emit(list(profiles.keys()), '')
             self.reload()
+            return list(profiles.keys()), ''
         except Exception as e:
-            logger.error("An error occurred during import: %s\n%s", str(e), traceback.format_exc())
+            self.logger.error("An error occurred during import: %s\n%s", str(e), traceback.format_exc())
             self.import_finished.emit([], str(e))
+            return [], str(e)
@@ -16,13 +16,13 @@
 import os
 import re
 
+from .file_lock import FileLock, atomic_write
+
 class SectionNotFoundError(Exception):
     pass
 
-def write_values(session, profile_name, values, config_file_writer=None):
-    if not config_file_writer:
-        config_file_writer = ConfigFileWriter()
-
+def _split_values(session, profile_name, values):
+    """Split profile values into (credentials file, config file) updates."""
     new_values = values.copy()
 
     # The access_key/secret_key are now *always* written to the shared
@@ -39,19 +39,39 @@ def write_values(session, profile_name, values, config_file_writer=None):
     if credential_file_values:
         if profile_name is not None:
             credential_file_values['__section__'] = profile_name
+
+    section = 'profile {}'.format(profile_name)
+    new_values['__section__'] = section
+    return credential_file_values, new_values
+
+def write_values(session, profile_name, values, config_file_writer=None):
+    write_profiles(session, {profile_name: values}, config_file_writer=config_file_writer)
+
+def write_profiles(session, profiles, config_file_writer=None):
+    """Write the values for many profiles, rewriting each file only once.
+
+    ``profiles`` is a dict of profile name to values."""
+    if not config_file_writer:
+        config_file_writer = ConfigFileWriter()
+
+    credential_file_updates = []
+    config_file_updates = []
+    for profile_name, values in profiles.items():
+        credential_file_values, config_file_values = _split_values(session, profile_name, values)
+        if credential_file_values:
+            credential_file_updates.append(credential_file_values)
+        config_file_updates.append(config_file_values)
+
+    if credential_file_updates:
         shared_credentials_filename = os.path.expanduser(
             session.get_config_variable('credentials_file'))
-        config_file_writer.update_config(
-            credential_file_values,
+        config_file_writer.update_config_batch(
+            credential_file_updates,
             shared_credentials_filename)
 
     config_filename = os.path.expanduser(
         session.get_config_variable('config_file'))
-
-    section = 'profile {}'.format(profile_name)
-    new_values['__section__'] = section
-    config_file_writer.update_config(new_values, config_filename)
-
+    config_file_writer.update_config_batch(config_file_updates, config_filename)
 
 
 class ConfigFileWriter(object):
@@ -73,6 +93,8 @@ class ConfigFileWriter(object):
         * If the ``config_filename`` does not exist, it will
           be created.  Any parent directories will also be created
           if necessary.
+        * The file is replaced atomically, keeping its permissions, and
+          writers hold an advisory lock on ``<config_filename>.lock``.
         * If the section to update does not exist, it will be created.
         * Any existing lines that are specified by ``new_values``
           **will not be touched**.  This ensures that commented out
@@ -89,39 +111,67 @@ class ConfigFileWriter(object):
             written.
 
         """
-        section_name = new_values.pop('__section__', 'default')
-        if not os.path.isfile(config_filename):
-            self._create_file(config_filename)
-            self._write_new_section(section_name, new_values, config_filename)
-            return
-        with open(config_filename, 'r') as f:
-            contents = f.readlines()
-        # We can only update a single section at a time so we first need
-        # to find the section in question
-        try:
-            self._update_section_contents(contents, section_name, new_values)
-            with open(config_filename, 'w') as f:
-                f.write(''.join(contents))
-        except SectionNotFoundError:
-            self._write_new_section(section_name, new_values, config_filename)
-
-    def _create_file(self, config_filename):
-        # Create the file as well as the parent dir if needed.
-        dirname = os.path.split(config_filename)[0]
-        if not os.path.isdir(dirname):
-            os.makedirs(dirname)
-        with os.fdopen(os.open(config_filename,
-                               os.O_WRONLY | os.O_CREAT, 0o600), 'w'):
-            pass
-
-    def _write_new_section(self, section_name, new_values, config_filename):
-        with open(config_filename, 'a') as f:
-            f.write('[%s]\n' % section_name)
+        self.update_config_batch([new_values], config_filename)
+        new_values.pop('__section__', None)
+
+    def update_config_batch(self, new_values_list, config_filename):
+        """Update many sections of a config file, writing it only once.
+
+        This has the same behavior as calling ``update_config`` with each
+        item of ``new_values_list`` in turn, but the file is read and
+        indexed by section once, each update only scans its own section,
+        and the result is written once.
+
+        :type new_values_list: list of dict
+        :param new_values_list: The values to update, each with an optional
+            ``__section__`` key as for ``update_config``.
+
+        :type config_filename: str
+        :param config_filename: The config filename where values will be
+            written.
+
+        """
+        # The lock keeps concurrent writers from losing each other's
+        # updates; the atomic write means readers, who don't take the lock,
+        # only ever see a complete file.
+        with FileLock(self._get_lock_filename(config_filename)):
+            self._update_config_batch(new_values_list, config_filename)
+
+    def _get_lock_filename(self, config_filename):
+        # atomic_write writes through symlinks, so lock next to the real
+        # file, or writers through different links wouldn't exclude each other
+        return os.path.realpath(config_filename) + '.lock'
+
+    def _update_config_batch(self, new_values_list, config_filename):
+        if os.path.isfile(config_filename):
+            with open(config_filename, 'r') as f:
+                contents = f.readlines()
+        else:
             contents = []
-            self._insert_new_values(line_number=0,
-                                    contents=contents,
-                                    new_values=new_values)
-            f.write(''.join(contents))
+        sections = _SectionIndex(contents, self.SECTION_REGEX)
+        for new_values in new_values_list:
+            new_values = new_values.copy()
+            section_name = new_values.pop('__section__', 'default')
+            section_contents = sections.find(section_name)
+            if section_contents is None:
+                section_contents = sections.add(section_name)
+                self._insert_new_values(line_number=0,
+                                        contents=section_contents,
+                                        new_values=new_values)
+            else:
+                # The update logic expects to see where the next section
+                # starts, so that values are inserted in the same place as
+                # when working on the whole file.
+                next_header = sections.next_header(section_contents)
+                if next_header is not None:
+                    section_contents.append(next_header)
+                self._update_section_contents(section_contents, section_name, new_values)
+                if next_header is not None:
+                    section_contents.pop()
+            # new values are inserted as a single multi-line item; split them
+            # so later updates to this section see them as separate lines
+            section_contents[:] = ''.join(section_contents).splitlines(True)
+        atomic_write(config_filename, sections.render())
 
     def _find_section_start(self, contents, section_name):
         for i in range(len(contents)):
@@ -233,3 +283,54 @@ class ConfigFileWriter(object):
                 parts[0], ' '.join(parts[1:]))
             return unquoted_match or quoted_match
         return unquoted_match
+
+
+class _SectionIndex(object):
+    """Config file contents split into sections and indexed by header.
+
+    Each section is a list of lines starting with its header line (the
+    first chunk holds any lines before the first header), so that
+    ConfigFileWriter's single-section update logic can be run on it
+    directly without scanning the rest of the file.
+    """
+    def __init__(self, contents, section_regex):
+        self._chunks = [[]]
+        self._index = {}
+        self._positions = {}
+        for line in contents:
+            match = section_regex.search(line)
+            if match is not None:
+                self._append([])
+                # the first section with a given header is the one updated
+                self._index.setdefault(match.group(0), self._chunks[-1])
+            self._chunks[-1].append(line)
+
+    def _append(self, chunk):
+        self._positions[id(chunk)] = len(self._chunks)
+        self._chunks.append(chunk)
+
+    def find(self, section_name):
+        chunk = self._index.get('[%s]' % section_name)
+        if chunk is None:
+            parts = section_name.split(' ')
+            if len(parts) > 1:
+                chunk = self._index.get('[%s "%s"]' % (parts[0], ' '.join(parts[1:])))
+        return chunk
+
+    def add(self, section_name):
+        last_chunk = self._chunks[-1]
+        if last_chunk and not last_chunk[-1].endswith('\n'):
+            last_chunk[-1] += '\n'
+        chunk = ['[%s]\n' % section_name]
+        self._append(chunk)
+        self._index['[%s]' % section_name] = chunk
+        return chunk
+
+    def next_header(self, chunk):
+        position = self._positions[id(chunk)] + 1
+        if position < len(self._chunks):
+            return self._chunks[position][0]
+        return None
+
+    def render(self):
+        return ''.join(''.join(chunk) for chunk in self._chunks)
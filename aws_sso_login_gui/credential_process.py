@@ -0,0 +1,58 @@
+"""A credential_process that gets role credentials from the running app.
+
+Use it from a profile in ~/.aws/config, pointing at an SSO profile::
+
+    [profile my-app]
+    credential_process = aws-sso-login-gui-credential-process --profile my-sso-profile
+
+The app keeps the credentials in memory until shortly before they expire,
+so repeated invocations don't call the SSO API. If the SSO instance needs a
+login, this waits for it. Like the ipc module, this only uses the standard
+library so that it starts quickly.
+
+The SDK uses whatever this prints, so nothing is printed unless the app
+answering on the socket is run by the same user (see the ipc module), and
+the response has the shape the SDK expects.
+"""
+import os
+import sys
+import json
+import argparse
+
+from .ipc import IPCClient, IPCError
+
+CREDENTIAL_KEYS = ['AccessKeyId', 'SecretAccessKey', 'SessionToken', 'Expiration']
+
+def check_credentials(credentials):
+    if not isinstance(credentials, dict) or credentials.get('Version') != 1:
+        raise IPCError("Unexpected response from the app")
+    missing = [key for key in CREDENTIAL_KEYS if not isinstance(credentials.get(key), str)]
+    if missing:
+        raise IPCError("Response from the app is missing {}".format(', '.join(missing)))
+    return {key: credentials[key] for key in ['Version'] + CREDENTIAL_KEYS}
+
+def main():
+    parser = argparse.ArgumentParser(prog='aws-sso-login-gui-credential-process',
+        description='Get credentials for an SSO profile from the running aws-sso-login-gui')
+    parser.add_argument('--profile', default=os.environ.get('AWS_PROFILE'),
+        help='the SSO profile (defaults to AWS_PROFILE)')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+        help='how long to wait, including for a login')
+
+    args = parser.parse_args()
+
+    if not args.profile:
+        parser.error("A profile is required")
+
+    try:
+        # connecting checks the server is this user's
+        with IPCClient(timeout=args.timeout) as client:
+            credentials = check_credentials(client.role_credentials(args.profile))
+    except IPCError as e:
+        print("Error getting credentials for {}: {}".format(args.profile, e), file=sys.stderr)
+        return 1
+    print(json.dumps(credentials))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,12 +4,13 @@ import datetime
 import hashlib
 import time
 import logging
+import threading
 
 from botocore.utils import tzutc
 from botocore.compat import total_seconds
 
-from PyQt5.QtCore import QThread, Qt, pyqtSignal
-from PyQt5.QtWidgets import QWidget, QDateTimeEdit, QCheckBox, QPushButton, QFormLayout, QLineEdit, QVBoxLayout
+from .token_fetcher import FetchCancelledError, RenewalUnavailableError
+
 
 LOGGER = logging.getLogger("fakes")
 
@@ -22,7 +23,10 @@ def get_token_fetcher_creator(on_pending_authorization,
         token_cache=None,
         time_fetcher=None,
         sleep=None,
-        delay=None):
+        delay=None,
+        home_dir=None):
+    # home_dir is accepted for compatibility with the real creator; the
+    # fake tokens are only cached in memory
     def token_fetcher_creator(region):
         return FakeTokenFetcher(
             region=region,
@@ -53,8 +57,10 @@ class FakeTokenFetcher:
             time_fetcher = self._utc_now
         self._time_fetcher = time_fetcher
 
+        self._cancelled = threading.Event()
+
         if not sleep:
-            sleep = time.sleep
+            sleep = self._wait
         self._sleep = sleep
 
         self._delay = delay
@@ -62,6 +68,13 @@ class FakeTokenFetcher:
     def _utc_now(self):
         return datetime.datetime.now(tzutc())
 
+    def _wait(self, seconds):
+        if self._cancelled.wait(seconds):
+            raise FetchCancelledError()
+
+    def shutdown(self):
+        self._cancelled.set()
+
     def _parse_if_needed(self, value):
         if isinstance(value, datetime.datetime):
             return value
@@ -75,6 +88,9 @@ class FakeTokenFetcher:
     def _get_cache_key(self, start_url):
         return hashlib.sha1(start_url.encode('utf-8')).hexdigest()
 
+    def get_cache_key(self, start_url):
+        return self._get_cache_key(start_url)
+
     def get_expiration(self, start_url):
         cache_key = self._get_cache_key(start_url)
         if cache_key in self._cache:
@@ -91,6 +107,25 @@ class FakeTokenFetcher:
             return end_time - datetime.timedelta(seconds=self._EXPIRY_WINDOW)
         return None
 
+    def get_refresh_status(self, start_url):
+        cache_key = self._get_cache_key(start_url)
+        if cache_key in self._cache:
+            token = self._cache[cache_key]
+            end_time = self._parse_if_needed(token['expiresAt'])
+            return self._is_expired(token), end_time - datetime.timedelta(seconds=self._EXPIRY_WINDOW)
+        return True, None
+
+    def can_renew(self, start_url):
+        return False
+
+    def get_access_token(self, start_url):
+        cache_key = self._get_cache_key(start_url)
+        if cache_key in self._cache:
+            token = self._cache[cache_key]
+            if not self._is_expired(token):
+                return token['accessToken']
+        return None
+
     def needs_refresh(self, start_url):
         cache_key = self._get_cache_key(start_url)
         if cache_key in self._cache:
@@ -98,13 +133,17 @@ class FakeTokenFetcher:
             return self._is_expired(token)
         return True
 
-    def fetch_token(self, start_url, force_refresh=False):
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
         cache_key = self._get_cache_key(start_url)
         # Only obey the token cache if we are not forcing a refresh.
-        if not force_refresh and cache_key in self._cache:
+        if not (force_refresh or renew) and cache_key in self._cache:
             token = self._cache[cache_key]
             if not self._is_expired(token):
-                return token
+                return self.refresh_deadline(start_url)
+
+        # fake tokens have no refresh token, so only a login gets a new one
+        if renew and not force_refresh:
+            raise RenewalUnavailableError()
 
         #user_code = 'user_code_' + ''.join(random.choice(string.ascii_uppercase+string.digits) for _ in range(6))
         user_code = random.choice(USER_CODES)
@@ -144,59 +183,3 @@ USER_CODES = [
     'otter',
     'quokka',
 ]
-
-class ControlsWidget(QWidget):
-    time_changed = pyqtSignal()
-
-    def __init__(self, test_token_fetcher):
-        super().__init__()
-
-        self._time = datetime.datetime.now(tz=tzutc())
-        self._delay = 5
-
-        self._outer_layout = QVBoxLayout()
-
-        self.setLayout(self._outer_layout)
-
-        self._widget = QWidget()
-        self._layout = QFormLayout()
-        self._widget.setLayout(self._layout)
-
-        self._time_fetcher_input = QDateTimeEdit(self._time)
-        self._layout.addRow("Current time", self._time_fetcher_input)
-
-        self._time_fetcher_input.dateTimeChanged.connect(self._on_time_changed)
-
-        self._delay_input = QLineEdit(str(self._delay))
-        if test_token_fetcher:
-            self._layout.addRow("Fake token fetcher login delay", self._delay_input)
-
-        self._outer_layout.addWidget(self._widget)
-
-        self._save_button = QPushButton("Save")
-        self._outer_layout.addWidget(self._save_button)
-
-        self._save_button.clicked.connect(self._on_save)
-
-        self.logger = LOGGER.getChild("ControlsWidget")
-
-    def _utc_now(self):
-        return datetime.datetime.now(tzutc())
-
-    def _on_time_changed(self, qt_datetime):
-        pass
-
-    def _on_save(self):
-        self._delay = float(self._delay_input.text())
-        time_value = self._time_fetcher_input.dateTime()
-        self._time = datetime.datetime.fromtimestamp(time_value.toSecsSinceEpoch(), tz=tzutc())
-        self.logger.debug("delay set: %s", self._delay)
-        self.logger.debug("time set:  %s", self._time.isoformat())
-        self.time_changed.emit()
-
-    def get_time(self):
-        return self._time
-
-    def delay(self):
-        value = float(self._delay_input.text())
-        time.sleep(value)
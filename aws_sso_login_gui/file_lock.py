@@ -0,0 +1,160 @@
+import os
+import time
+import errno
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+LOGGER = logging.getLogger("file_lock")
+
+class LockTimeout(Exception):
+    pass
+
+class LockCancelled(Exception):
+    pass
+
+# Errors from filesystems that don't support locking (some network and
+# WSL mounts); the lock is advisory, so we carry on without it.
+_UNSUPPORTED_ERRNOS = {errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+
+class FileLock(object):
+    """An advisory, interprocess lock held on a separate lock file.
+
+    Uses flock() on POSIX and msvcrt.locking() on Windows. The lock file is
+    left in place after release, since removing it would race with other
+    processes opening it.
+
+    Acquiring polls rather than blocking, so that it can be given up: on a
+    timeout with LockTimeout, or once cancel_event is set with LockCancelled.
+    """
+    def __init__(self, path, timeout=None, poll_interval=0.05, cancel_event=None):
+        self._path = path
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._cancel_event = cancel_event
+        self._fd = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    @property
+    def poll_interval(self):
+        return self._poll_interval
+
+    def acquire(self):
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(self._path)
+            if self._cancel_event is None:
+                time.sleep(self._poll_interval)
+            elif self._cancel_event.wait(self._poll_interval):
+                raise LockCancelled(self._path)
+
+    def try_acquire(self):
+        """Make one attempt at the lock, without waiting; returns whether it's held.
+
+        For callers that wait some other way, like on an asyncio loop."""
+        dirname = os.path.dirname(self._path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError as e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK, errno.EDEADLK):
+                return False
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                LOGGER.warning("Locking not supported for %s, continuing without lock: %s", self._path, e)
+                return True
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def atomic_write(filename, contents, mode=0o600, fsync=True):
+    """Write a file by writing a temp file next to it and renaming it over.
+
+    Readers see either the old or the new contents, never a partial write.
+    The permissions of an existing file are kept; new files get ``mode``.
+    With ``fsync``, the rename is flushed to disk too, by syncing the
+    directory on POSIX, so the new contents survive a crash.
+    """
+    # write through symlinks rather than replacing them
+    filename = os.path.realpath(filename)
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    try:
+        mode = os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        pass
+    temp_filename = os.path.join(dirname, '.{}.{}.{}.tmp'.format(
+        os.path.basename(filename), os.getpid(), threading.get_ident()))
+    fd = os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(contents)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.chmod(temp_filename, mode)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(dirname)
+
+def _fsync_dir(dirname):
+    # Windows can't open a directory as a file, and NTFS journals renames
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError as e:
+        LOGGER.debug("Can't open %s to sync it: %s", dirname, e)
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # some filesystems don't support syncing directories
+        LOGGER.debug("Can't sync %s: %s", dirname, e)
+    finally:
+        os.close(fd)
@@ -0,0 +1,109 @@
+import logging
+import signal
+
+# Only QtCore; this mode must not pull in QtWidgets or QtGui
+from PyQt5 import QtCore
+
+from . import startup
+from .config import STATUS_EXPIRED, STATUS_REFRESHING
+from .app import (
+    get_config_loader,
+    get_token_fetcher_creator,
+    get_config_kwargs,
+    initialize_config,
+    initialize_watcher,
+    initialize_ipc,
+    initialize_import,
+    initialize_metrics_server,
+    shutdown,
+    StartupProfiler,
+)
+
+LOGGER = logging.getLogger("headless")
+
+class HeadlessRunner(QtCore.QObject):
+    """Stands in for the window and tray icon when there's no UI.
+
+    With nobody to click on expired instances, they are refreshed as soon
+    as they expire; the device flow's login instructions are logged. A
+    refresh that ends with the instance still expired, because it was
+    cancelled or couldn't renew, isn't retried; that would go on until
+    shutdown. Those are left for a refresh through the IPC server.
+    """
+    needs_refresh = QtCore.pyqtSignal(str)
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+        self._statuses = {}
+
+        self.config.status_changed.connect(self.on_status_changed)
+        self.config.instances_changed.connect(self.on_instances_changed)
+        self.needs_refresh.connect(self.config.refresh)
+
+        self.logger = LOGGER.getChild("HeadlessRunner")
+
+    def on_status_changed(self, sso_id, status, expiration):
+        self.logger.info("%s is %s%s", sso_id, status, " until {}".format(expiration) if expiration else "")
+        old_status = self._statuses.get(sso_id)
+        self._statuses[sso_id] = status
+        if status == STATUS_EXPIRED and old_status != STATUS_REFRESHING:
+            self.needs_refresh.emit(sso_id)
+
+    def on_instances_changed(self, added, removed, changed):
+        for sso_id in removed:
+            self._statuses.pop(sso_id, None)
+
+def main(parser, args):
+    if args.test_controls:
+        parser.error("--test-controls can't be used with --headless")
+
+    app = QtCore.QCoreApplication([])
+    startup.mark('create application')
+
+    # Let Ctrl-C and SIGTERM stop the event loop. Python only runs signal
+    # handlers between bytecodes, so wake the interpreter up periodically.
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, lambda *args: app.quit())
+    signal_timer = QtCore.QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+
+    config_loader = get_config_loader(parser, args)
+
+    token_fetcher_creator, _ = get_token_fetcher_creator(parser, args)
+
+    config, thread = initialize_config(parser, config_loader, token_fetcher_creator,
+        **get_config_kwargs(parser, args))
+
+    components = []
+    if not args.no_watch:
+        components.append(initialize_watcher(parser, args, config, thread))
+
+    ipc_server = None
+    if not args.no_ipc:
+        ipc_server = initialize_ipc(parser, args, config, thread)
+        components.append(ipc_server)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = initialize_metrics_server(parser, args, config)
+
+    if args.import_file:
+        initialize_import(parser, args, config, thread, ipc_server)
+
+    runner = HeadlessRunner(config)
+    startup.mark('set up config, watcher and servers')
+
+    if args.startup_profile:
+        profiler = StartupProfiler(app, config)
+
+    thread.start()
+
+    LOGGER.info("Running headless")
+    result = app.exec_()
+
+    shutdown(parser, args, config, thread, components, metrics_server)
+
+    return result
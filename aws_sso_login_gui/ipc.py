@@ -0,0 +1,265 @@
+"""Client side of the local API of a running aws-sso-login-gui.
+
+The app listens on a Unix domain socket (a named pipe on Windows). The
+socket is in a directory only the user can get into, and before sending
+anything the client checks that the server is run by the same user, so
+another user can't stand in for the app by taking its socket name. The
+protocol is newline-delimited JSON: each request is an object with a
+``method``, optional ``params``, and an optional ``id`` that is echoed in
+the response. Each response is an object with either a ``result`` or an
+``error``. Requests on one connection may be answered out of order.
+
+This module only uses the standard library, so that clients start quickly.
+"""
+import os
+import sys
+import json
+import socket
+import struct
+import getpass
+import argparse
+import itertools
+
+SERVER_NAME_ENV_VAR = 'AWS_SSO_LOGIN_GUI_SOCKET'
+
+class IPCError(Exception):
+    pass
+
+class ServerNotRunning(IPCError):
+    pass
+
+class UntrustedServer(IPCError):
+    """The server isn't run by this user, or others could have replaced it."""
+    pass
+
+def get_server_name():
+    """The socket path (or pipe name on Windows) of the running app."""
+    server_name = os.environ.get(SERVER_NAME_ENV_VAR)
+    if server_name:
+        return server_name
+    if os.name == 'nt':
+        return 'aws-sso-login-gui-{}'.format(getpass.getuser())
+    # never a shared directory like /tmp, where anyone can take the name
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(runtime_dir, 'aws-sso-login-gui', 'ipc.sock')
+
+def make_server_dir(server_name):
+    """Create the directory for the socket, private to this user, for the server."""
+    if os.name == 'nt':
+        return
+    dirname = os.path.dirname(os.path.abspath(server_name))
+    os.makedirs(dirname, mode=0o700, exist_ok=True)
+    # an existing directory is left as it is, and has to pass the same
+    # check as for clients
+    check_server_dir(server_name)
+
+def check_server_dir(server_name):
+    """Raise UntrustedServer unless only this user can create or replace the socket."""
+    dirname = os.path.dirname(os.path.abspath(server_name))
+    dir_stat = os.stat(dirname)
+    if dir_stat.st_uid != os.getuid() or dir_stat.st_mode & 0o022:
+        raise UntrustedServer("{} can be written to by other users".format(dirname))
+
+def _check_socket_peer(sock, server_name):
+    socket_stat = os.lstat(server_name)
+    if socket_stat.st_uid != os.getuid():
+        raise UntrustedServer("{} is owned by another user".format(server_name))
+    if hasattr(socket, 'SO_PEERCRED'):
+        # the socket file can be left over; this is who's actually answering
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+        if uid != os.getuid():
+            raise UntrustedServer("{} is served by another user".format(server_name))
+
+def _check_pipe_peer(pipe_file, server_name):
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    advapi32 = ctypes.WinDLL('advapi32', use_last_error=True)
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    TOKEN_QUERY = 0x0008
+    TOKEN_USER = 1
+
+    def get_user_sid(process):
+        token = wintypes.HANDLE()
+        if not advapi32.OpenProcessToken(process, TOKEN_QUERY, ctypes.byref(token)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            size = wintypes.DWORD()
+            advapi32.GetTokenInformation(token, TOKEN_USER, None, 0, ctypes.byref(size))
+            buffer = ctypes.create_string_buffer(size.value)
+            if not advapi32.GetTokenInformation(token, TOKEN_USER, buffer, size, ctypes.byref(size)):
+                raise ctypes.WinError(ctypes.get_last_error())
+            # TOKEN_USER starts with a pointer to the SID, which lives in the buffer
+            return buffer, ctypes.c_void_p.from_buffer(buffer).value
+        finally:
+            kernel32.CloseHandle(token)
+
+    pid = wintypes.ULONG()
+    handle = msvcrt.get_osfhandle(pipe_file.fileno())
+    if not kernel32.GetNamedPipeServerProcessId(wintypes.HANDLE(handle), ctypes.byref(pid)):
+        raise ctypes.WinError(ctypes.get_last_error())
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    process = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid.value)
+    if not process:
+        raise UntrustedServer("Can't check the owner of {}".format(server_name))
+    try:
+        server_buffer, server_sid = get_user_sid(process)
+        own_buffer, own_sid = get_user_sid(kernel32.GetCurrentProcess())
+        if not advapi32.EqualSid(ctypes.c_void_p(server_sid), ctypes.c_void_p(own_sid)):
+            raise UntrustedServer("{} is served by another user".format(server_name))
+    finally:
+        kernel32.CloseHandle(process)
+
+class IPCClient(object):
+    """A connection to the running app.
+
+    ``timeout`` applies to each request; the default of None waits for as
+    long as a login takes.
+    """
+    def __init__(self, server_name=None, timeout=None):
+        if server_name is None:
+            server_name = get_server_name()
+        self._server_name = server_name
+        self._timeout = timeout
+        self._ids = itertools.count(1)
+        self._file = None
+        self._socket = None
+
+    def connect(self):
+        try:
+            if os.name == 'nt':
+                self._file = open(r'\\.\pipe\{}'.format(self._server_name), 'r+b', buffering=0)
+            else:
+                check_server_dir(self._server_name)
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.settimeout(self._timeout)
+                self._socket.connect(self._server_name)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            self.close()
+            raise ServerNotRunning(self._server_name) from e
+        except UntrustedServer:
+            self.close()
+            raise
+        # before anything is sent, like an import's file name
+        try:
+            if os.name == 'nt':
+                _check_pipe_peer(self._file, self._server_name)
+            else:
+                _check_socket_peer(self._socket, self._server_name)
+        except UntrustedServer:
+            self.close()
+            raise
+        except OSError as e:
+            self.close()
+            raise UntrustedServer("Can't check who is serving {}: {}".format(self._server_name, e)) from e
+        if self._socket:
+            self._file = self._socket.makefile('rwb', buffering=0)
+        return self
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, method, params=None):
+        if not self._file:
+            self.connect()
+        request_id = next(self._ids)
+        request = {'id': request_id, 'method': method, 'params': params or {}}
+        try:
+            self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+            while True:
+                line = self._file.readline()
+                if not line:
+                    raise IPCError("Connection closed by server")
+                response = json.loads(line.decode('utf-8'))
+                # responses to other requests can only come from other
+                # threads sharing this client, which isn't supported
+                if response.get('id') == request_id:
+                    break
+        except socket.timeout as e:
+            raise IPCError("Timed out waiting for {}".format(method)) from e
+        if 'error' in response:
+            raise IPCError(response['error'])
+        return response['result']
+
+    def status(self, sso_id=None, profile=None):
+        return self.request('status', _target_params(sso_id, profile))
+
+    def ensure_valid(self, sso_id=None, profile=None, force_refresh=False):
+        params = _target_params(sso_id, profile)
+        if force_refresh:
+            params['force_refresh'] = True
+        return self.request('ensure_valid', params)
+
+    def wait(self, sso_id=None, profile=None):
+        return self.request('wait', _target_params(sso_id, profile))
+
+    def cancel(self, sso_id=None, profile=None):
+        return self.request('cancel', _target_params(sso_id, profile))
+
+    def role_credentials(self, profile):
+        return self.request('role_credentials', {'profile': profile})
+
+    def stats(self):
+        return self.request('stats')
+
+def _target_params(sso_id, profile):
+    params = {}
+    if sso_id:
+        params['sso_id'] = sso_id
+    if profile:
+        params['profile'] = profile
+    return params
+
+def is_server_running(server_name=None):
+    """Whether this user's app is listening; raises UntrustedServer for anyone else."""
+    try:
+        with IPCClient(server_name, timeout=1):
+            return True
+    except ServerNotRunning:
+        return False
+    except OSError:
+        return False
+
+def request(method, params=None, server_name=None, timeout=None):
+    with IPCClient(server_name, timeout=timeout) as client:
+        return client.request(method, params)
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m aws_sso_login_gui.ipc',
+        description='Talk to the running aws-sso-login-gui')
+    parser.add_argument('method', choices=['status', 'ensure_valid', 'wait', 'cancel', 'stats'])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--sso-id')
+    target.add_argument('--profile')
+    parser.add_argument('--force-refresh', action='store_true')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS')
+
+    args = parser.parse_args()
+
+    params = _target_params(args.sso_id, args.profile)
+    if args.force_refresh:
+        params['force_refresh'] = True
+    try:
+        result = request(args.method, params, timeout=args.timeout)
+    except IPCError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import json
+import logging
+import functools
+import collections
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtNetwork import QLocalServer
+
+from .config import STATUS_VALID
+from .ipc import IPCError, UntrustedServer, get_server_name, is_server_running, make_server_dir
+
+LOGGER = logging.getLogger("ipc_server")
+
+class IPCServer(QObject):
+    """Serves the local API (see the ipc module) for a Config.
+
+    The server lives in the Config's thread and is event driven: a call
+    that has to wait for a login is parked until the refresh engine reports
+    that the refresh has finished, so any number of clients can be waiting
+    without tying up a thread each, and without blocking the refresh
+    workers.
+    """
+    MAX_REQUEST_SIZE = 64 * 1024
+
+    # another launch of the app asked for the window
+    show_requested = pyqtSignal()
+    # start() is done, and this is the one instance
+    started = pyqtSignal()
+    # another launch of the app started listening first, so this one
+    # should hand its command over and quit
+    already_running = pyqtSignal()
+
+    def __init__(self, config, server_name=None, parent=None):
+        super().__init__(parent)
+        self._config = config
+        if server_name is None:
+            server_name = get_server_name()
+        self._server_name = server_name
+
+        self._server = QLocalServer(self)
+        # only the current user can connect
+        self._server.setSocketOptions(QLocalServer.UserAccessOption)
+        self._server.newConnection.connect(self._on_new_connection)
+
+        self._buffers = {}
+        # sso id -> list of (connection, request id, callback)
+        self._waiters = collections.defaultdict(list)
+
+        self._methods = {
+            'status': self._status,
+            'ensure_valid': self._ensure_valid,
+            'wait': self._wait,
+            'role_credentials': self._role_credentials,
+            'stats': self._stats,
+            # commands forwarded by another launch of the app
+            'reload': self._reload,
+            'import_config': self._import_config,
+            'show': self._show,
+            'cancel': self._cancel,
+        }
+
+        self._config.refresh_finished.connect(self._on_refresh_finished)
+
+        self.logger = LOGGER.getChild("IPCServer")
+
+    @property
+    def server_name(self):
+        return self._server_name
+
+    def add_method(self, name, handler):
+        """Add a method; handler(connection, request_id, params) must call reply()."""
+        self._methods[name] = handler
+
+    @pyqtSlot()
+    def start(self):
+        try:
+            make_server_dir(self._server_name)
+            already_running = self._listen()
+        except (UntrustedServer, OSError) as e:
+            # talking to whoever has the name would be worse than no socket
+            self.logger.error("Not listening on %s: %s", self._server_name, e)
+            already_running = False
+        if already_running:
+            self.logger.warning("Another instance is listening on %s", self._server_name)
+            self.already_running.emit()
+        else:
+            self.started.emit()
+
+    def _listen(self):
+        """Listen unless another instance of the app is; returns whether one is."""
+        # With socket options set, Qt listens on Unix by renaming a new socket
+        # over the name, which would take it from another instance, so check
+        # for one first.
+        if is_server_running(self._server_name):
+            return True
+        if not self._server.listen(self._server_name):
+            # Another instance may have started listening since, or there's
+            # a socket file left by one that crashed; only the latter can
+            # be removed.
+            if is_server_running(self._server_name):
+                return True
+            QLocalServer.removeServer(self._server_name)
+            if not self._server.listen(self._server_name):
+                self.logger.error("Could not listen on %s: %s", self._server_name, self._server.errorString())
+                return False
+        self.logger.info("Listening on %s", self._server_name)
+        return False
+
+    @pyqtSlot()
+    def stop(self):
+        self._server.close()
+        for connection in list(self._buffers.keys()):
+            connection.disconnectFromServer()
+
+    @pyqtSlot()
+    def _on_new_connection(self):
+        while self._server.hasPendingConnections():
+            connection = self._server.nextPendingConnection()
+            self._buffers[connection] = b''
+            connection.readyRead.connect(functools.partial(self._on_ready_read, connection))
+            connection.disconnected.connect(functools.partial(self._on_disconnected, connection))
+
+    def _on_disconnected(self, connection):
+        self._buffers.pop(connection, None)
+        for sso_id in list(self._waiters.keys()):
+            waiters = [w for w in self._waiters[sso_id] if w[0] is not connection]
+            if waiters:
+                self._waiters[sso_id] = waiters
+            else:
+                del self._waiters[sso_id]
+        connection.deleteLater()
+
+    def _on_ready_read(self, connection):
+        if connection not in self._buffers:
+            return
+        buffer = self._buffers[connection] + bytes(connection.readAll())
+        *lines, buffer = buffer.split(b'\n')
+        self._buffers[connection] = buffer
+        for line in lines:
+            if line.strip():
+                self._handle(connection, line)
+        if len(buffer) > self.MAX_REQUEST_SIZE:
+            self.reply(connection, None, error="Request too large")
+            connection.disconnectFromServer()
+
+    def _handle(self, connection, line):
+        request_id = None
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise IPCError("Request must be an object")
+            request_id = request.get('id')
+            method = request.get('method')
+            params = request.get('params') or {}
+            if method not in self._methods:
+                raise IPCError("Unknown method {}".format(method))
+            self.logger.debug("Request %s %s %s", request_id, method, params)
+            self._methods[method](connection, request_id, params)
+        except (ValueError, IPCError) as e:
+            self.reply(connection, request_id, error=str(e))
+        except Exception as e:
+            self.logger.exception("Error handling request %s", request_id)
+            self.reply(connection, request_id, error=str(e))
+
+    def reply(self, connection, request_id, result=None, error=None):
+        if connection not in self._buffers:
+            # the client has gone away
+            return
+        response = {'id': request_id}
+        if error is not None:
+            response['error'] = error
+        else:
+            response['result'] = result
+        connection.write(json.dumps(response).encode('utf-8') + b'\n')
+        connection.flush()
+
+    def get_instance(self, params):
+        sso_id = params.get('sso_id')
+        profile = params.get('profile')
+        if profile:
+            sso_id = self._config.get_sso_id_for_profile(profile)
+            if sso_id is None:
+                raise IPCError("Profile {} is not an SSO profile".format(profile))
+        if not sso_id:
+            raise IPCError("An sso_id or profile is required")
+        instance = self._config.sso_instances.get(sso_id)
+        if instance is None:
+            raise IPCError("Unknown SSO instance {}".format(sso_id))
+        return instance
+
+    def _get_info(self, instance):
+        expiration = instance.expiration
+        return {
+            'sso_id': instance.sso_id,
+            'start_url': instance.start_url,
+            'region': instance.region,
+            'profiles': instance.profile_names,
+            'status': instance.get_status(update=True),
+            'expiration': expiration.isoformat() if expiration else None,
+        }
+
+    def _status(self, connection, request_id, params):
+        if params.get('sso_id') or params.get('profile'):
+            result = self._get_info(self.get_instance(params))
+        else:
+            result = [self._get_info(self._config.sso_instances[sso_id])
+                for sso_id in sorted(self._config.sso_instances.keys())]
+        self.reply(connection, request_id, result)
+
+    def _stats(self, connection, request_id, params):
+        self.reply(connection, request_id, self._config.stats())
+
+    def _cancel(self, connection, request_id, params):
+        instance = self.get_instance(params)
+        self.reply(connection, request_id, self._config.cancel_refresh(instance.sso_id))
+
+    def _reload(self, connection, request_id, params):
+        self._config.reload()
+        self.reply(connection, request_id, sorted(self._config.sso_instances.keys()))
+
+    def _import_config(self, connection, request_id, params):
+        filename = params.get('filename')
+        if not filename:
+            raise IPCError("A filename is required")
+        profile_names, error = self._config.import_config(filename)
+        if error:
+            raise IPCError(error)
+        self.reply(connection, request_id, profile_names)
+
+    def _show(self, connection, request_id, params):
+        self.show_requested.emit()
+        self.reply(connection, request_id, None)
+
+    def _ensure_valid(self, connection, request_id, params):
+        self._when_valid(self.get_instance(params), connection, request_id,
+            lambda instance: self.reply(connection, request_id, self._get_info(instance)),
+            force_refresh=bool(params.get('force_refresh')))
+
+    def _wait(self, connection, request_id, params):
+        instance = self.get_instance(params)
+        self._when_refreshed(instance, connection, request_id,
+            lambda instance: self.reply(connection, request_id, self._get_info(instance)))
+
+    def _role_credentials(self, connection, request_id, params):
+        profile = params.get('profile')
+        if not profile:
+            raise IPCError("A profile is required")
+        def on_credentials(credentials, exception):
+            if exception:
+                self.reply(connection, request_id, error=str(exception))
+            else:
+                self.reply(connection, request_id, credentials)
+        def on_valid(instance):
+            try:
+                self._config.get_role_credentials(profile, on_credentials)
+            except ValueError as e:
+                self.reply(connection, request_id, error=str(e))
+        self._when_valid(self.get_instance(params), connection, request_id, on_valid)
+
+    def _when_valid(self, instance, connection, request_id, callback, force_refresh=False):
+        """Call callback(instance) once the instance has a valid token, logging in if needed."""
+        if not instance.enabled:
+            raise IPCError("SSO instance {} is disabled".format(instance.sso_id))
+        if not force_refresh and instance.get_status(update=True) == STATUS_VALID:
+            callback(instance)
+            return
+        def on_refreshed(instance):
+            status = instance.get_status(update=True)
+            if status == STATUS_VALID:
+                callback(instance)
+            else:
+                self.reply(connection, request_id,
+                    error="Refresh of {} failed ({})".format(instance.sso_id, status))
+        # attaches to the refresh in flight, if there is one
+        instance.refresh(force_refresh=force_refresh)
+        self._when_refreshed(instance, connection, request_id, on_refreshed)
+
+    def _when_refreshed(self, instance, connection, request_id, callback):
+        """Call callback(instance) once any refresh in flight has finished."""
+        if self._config.is_refreshing(instance.sso_id):
+            self._waiters[instance.sso_id].append((connection, request_id, callback))
+        else:
+            callback(instance)
+
+    @pyqtSlot(str)
+    def _on_refresh_finished(self, sso_id):
+        waiters = self._waiters.pop(sso_id, [])
+        if not waiters:
+            return
+        instance = self._config.sso_instances.get(sso_id)
+        for connection, request_id, callback in waiters:
+            if connection not in self._buffers:
+                continue
+            if instance is None:
+                self.reply(connection, request_id, error="SSO instance {} was removed".format(sso_id))
+                continue
+            try:
+                callback(instance)
+            except Exception as e:
+                self.logger.exception("Error handling request %s", request_id)
+                self.reply(connection, request_id, error=str(e))
@@ -0,0 +1,240 @@
+"""Counters, gauges and histograms, exposed in the Prometheus text format.
+
+Components take a ``metrics`` registry, defaulting to the process-wide one
+from get_registry(). Getting a metric that already exists returns it, so
+many token fetchers or instances can share one. Everything is thread safe.
+
+MetricsServer serves the registry on the loopback interface: /metrics in
+the Prometheus text format, and /stats as JSON.
+"""
+import json
+import math
+import logging
+import threading
+
+LOGGER = logging.getLogger("metrics")
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+LOGIN_DURATION_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+class _Metric(object):
+    TYPE = None
+
+    def __init__(self, name, help, labelnames, lock):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = lock
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{} takes labels {}, got {}".format(self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render(self):
+        return ['{}{} {}'.format(self.name, self._format_labels(key), _format_value(value))
+            for key, value in sorted(self._values.items())]
+
+    def _snapshot(self):
+        return {','.join(key): value for key, value in sorted(self._values.items())}
+
+class Gauge(Counter):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labelnames, lock, buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labelnames, lock)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['counts'][i] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def _render(self):
+        lines = []
+        for key, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry['counts']):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name,
+                    self._format_labels(key, [('le', _format_value(bound))]), cumulative))
+            lines.append('{}_bucket{} {}'.format(self.name,
+                self._format_labels(key, [('le', '+Inf')]), entry['count']))
+            lines.append('{}_sum{} {}'.format(self.name, self._format_labels(key), _format_value(entry['sum'])))
+            lines.append('{}_count{} {}'.format(self.name, self._format_labels(key), entry['count']))
+        return lines
+
+    def _snapshot(self):
+        snapshot = {}
+        for key, entry in sorted(self._values.items()):
+            snapshot[','.join(key)] = {
+                'count': entry['count'],
+                'sum': entry['sum'],
+                'mean': entry['sum'] / entry['count'] if entry['count'] else None,
+                'buckets': dict(zip([_format_value(bound) for bound in self.buckets], entry['counts'])),
+            }
+        return snapshot
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, self._lock, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError("{} is already registered as a {}".format(name, metric.TYPE))
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                lines.append('# HELP {} {}'.format(name, metric.help))
+                lines.append('# TYPE {} {}'.format(name, metric.TYPE))
+                lines.extend(metric._render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """The metrics as a JSON-serializable dict."""
+        with self._lock:
+            return {name: metric._snapshot() for name, metric in sorted(self._metrics.items())}
+
+_REGISTRY = MetricsRegistry()
+
+def get_registry():
+    return _REGISTRY
+
+class MetricsServer(object):
+    """Serves a registry over HTTP on the loopback interface only."""
+    def __init__(self, registry=None, port=0, stats_fetcher=None):
+        if registry is None:
+            registry = get_registry()
+        self._registry = registry
+        self._port = port
+        # extra stats for /stats, e.g. from the refresh engine
+        self._stats_fetcher = stats_fetcher
+        self._server = None
+        self._thread = None
+
+        self.logger = LOGGER.getChild("MetricsServer")
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        # http.server is slow to import, and only needed with --metrics-port
+        from http.server import ThreadingHTTPServer
+        Handler = _get_handler_class()
+        Handler.metrics_server = self
+        self._server = ThreadingHTTPServer(('127.0.0.1', self._port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+            name='metrics-server', daemon=True)
+        self._thread.start()
+        self.logger.info("Serving metrics on %s/metrics", self.url)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        stats = {'metrics': self._registry.snapshot()}
+        if self._stats_fetcher:
+            stats.update(self._stats_fetcher())
+        return stats
+
+def _get_handler_class():
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        metrics_server = None
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = self.metrics_server._registry.render().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path == '/stats':
+                body = json.dumps(self.metrics_server.stats(), indent=2, sort_keys=True).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            LOGGER.debug(format, *args)
+
+    return Handler
@@ -0,0 +1,25 @@
+import os
+import hashlib
+
+APP_NAME = 'aws-sso-login-gui'
+
+# Here rather than in token_fetcher, so the watcher can find the token cache
+# without importing botocore at startup.
+def get_token_dir(home_dir):
+    return os.path.expanduser(os.path.join(home_dir, '.aws', 'sso', 'cache'))
+
+def get_data_dir():
+    """The directory for the app's own state, as opposed to the AWS files it uses."""
+    from PyQt5.QtCore import QStandardPaths
+    # what AppDataLocation is once the application name is set, without
+    # depending on it being set
+    return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation), APP_NAME)
+
+def get_snapshot_path(home_dir=None):
+    # instances from another home dir (e.g. --wsl) get a snapshot of their own
+    name = 'snapshot.json'
+    if home_dir:
+        home_dir = os.path.abspath(os.path.expanduser(home_dir))
+        if home_dir != os.path.expanduser('~'):
+            name = 'snapshot-{}.json'.format(hashlib.sha1(home_dir.encode('utf-8')).hexdigest()[:12])
+    return os.path.join(get_data_dir(), name)
@@ -0,0 +1,131 @@
+import os
+import re
+import shlex
+import logging
+import threading
+
+LOGGER = logging.getLogger("profile_scanner")
+
+SSO_KEYS = (
+    'sso_start_url',
+    'sso_region',
+    'sso_account_id',
+    'sso_role_name',
+)
+
+class ProfileScanner(object):
+    """Reads only the SSO settings of the profiles in a config file.
+
+    This is a replacement for building a botocore session just to get at
+    ``full_config['profiles']``. The file is scanned line by line, following
+    the section and option rules of the ConfigParser that botocore uses, and
+    only the keys in ``keys`` are kept. The result is cached on the file's
+    inode, mtime and size, so scanning an unchanged file costs one stat.
+
+    The scan returns a dict of profile name to a dict of the SSO keys set in
+    that profile (which may be empty). The returned dicts are shared with
+    the cache and must not be modified.
+    """
+    SECTION_REGEX = re.compile(r'^\[(?P<header>.+)\]')
+
+    def __init__(self, keys=SSO_KEYS):
+        self._keys = frozenset(keys)
+        self._key_prefixes = frozenset(key[:4] for key in keys)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        self.logger = LOGGER.getChild("ProfileScanner")
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def scan(self, config_filename):
+        path = os.path.expanduser(os.path.expandvars(config_filename))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}
+        cache_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == cache_key:
+            return cached[1]
+        self.logger.debug("Scanning %s", path)
+        with open(path) as f:
+            profiles = self.scan_lines(f)
+        with self._lock:
+            self._cache[path] = (cache_key, profiles)
+        return profiles
+
+    def scan_lines(self, lines):
+        profiles = {}
+        section = None
+        option_indent = None
+        # the SSO key whose value continuation lines are added to, and the
+        # blank lines since its last line, which are kept inside a value
+        key = None
+        blank_lines = 0
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                blank_lines += 1
+                continue
+            if stripped[0] in '#;':
+                continue
+            indent = len(line) - len(line.lstrip())
+            if option_indent is not None and indent > option_indent:
+                # a continuation line (e.g. a nested s3 block), not an option
+                if key is not None:
+                    section[key] += '\n' * (blank_lines + 1) + stripped
+                blank_lines = 0
+                continue
+            option_indent = None
+            key = None
+            blank_lines = 0
+            if stripped[0] == '[':
+                match = self.SECTION_REGEX.match(stripped)
+                if match:
+                    # not stripped, like botocore, so '[ profile a]' isn't a profile
+                    section = self._get_profile(match.group('header'), profiles)
+                    continue
+            if section is None:
+                continue
+            option_indent = indent
+            # Most lines aren't SSO settings; skip them before splitting
+            if stripped[:4].lower() not in self._key_prefixes:
+                continue
+            option, value = self._split_option(stripped)
+            if option in self._keys:
+                section[option] = value
+                # an empty value followed by indented lines is a nested block
+                if value:
+                    key = option
+        return profiles
+
+    def _get_profile(self, header, profiles):
+        # mirrors botocore.configloader.build_profile_map
+        if header == 'default':
+            name = header
+        elif header.startswith('profile'):
+            if '"' in header or "'" in header:
+                try:
+                    parts = shlex.split(header)
+                except ValueError:
+                    return None
+            else:
+                parts = header.split()
+            if len(parts) != 2:
+                return None
+            name = parts[1]
+        else:
+            return None
+        return profiles.setdefault(name, {})
+
+    def _split_option(self, line):
+        # ConfigParser splits on the first delimiter of either kind
+        positions = [i for i in (line.find('='), line.find(':')) if i >= 0]
+        if not positions:
+            return line.lower(), ''
+        i = min(positions)
+        return line[:i].strip().lower(), line[i+1:].strip()
@@ -0,0 +1,274 @@
+import time
+import logging
+import queue
+import threading
+import concurrent.futures
+from concurrent.futures import Future, CancelledError
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+LOGGER = logging.getLogger("refresh")
+
+class WorkerPool(object):
+    """A pool of daemon worker threads returning futures.
+
+    Idle workers are reused; otherwise a new one is started, up to
+    max_workers if it isn't None. The workers are daemon threads so that a
+    device flow that is still polling does not keep the process alive when
+    the app exits.
+    """
+    def __init__(self, max_workers, thread_name_prefix='worker'):
+        self._max_workers = max_workers
+        self._thread_name_prefix = thread_name_prefix
+        self._queue = queue.Queue()
+        self._idle = threading.Semaphore(0)
+        self._threads = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        self._adjust_thread_count()
+        return future
+
+    def _adjust_thread_count(self):
+        if self._idle.acquire(timeout=0):
+            return
+        if self._max_workers is None or len(self._threads) < self._max_workers:
+            thread = threading.Thread(
+                name='{}_{}'.format(self._thread_name_prefix, len(self._threads)),
+                target=self._work,
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, timeout=None):
+        """Stop the workers once the queue is drained, waiting up to timeout
+        seconds for them, and return whether they all stopped."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            self._idle.release()
+
+# How much a fetch is asked to do, weakest first. A request attaches to a
+# fetch in flight that does at least as much; a stronger one runs after it.
+RENEW = 0
+REFRESH = 1
+FORCE_REFRESH = 2
+
+class _InFlight(object):
+    __slots__ = ['future', 'strength', 'callbacks', 'next_start', 'next_strength', 'next_callbacks']
+
+    def __init__(self, future, strength, callbacks):
+        self.future = future
+        self.strength = strength
+        self.callbacks = callbacks
+        # a stronger request that came in while this fetch was running
+        self.next_start = None
+        self.next_strength = None
+        self.next_callbacks = []
+
+    def drop_next(self):
+        """Forget the follow-up fetch; its callbacks get this fetch's result instead."""
+        for callback in self.next_callbacks:
+            if callback not in self.callbacks:
+                self.callbacks.append(callback)
+        self.next_start = self.next_strength = None
+        self.next_callbacks = []
+
+class RefreshEngine(QObject):
+    """Runs token fetches for SSO instances on a worker pool.
+
+    Fetches for different sso ids run concurrently, so a device flow waiting
+    on the user for one instance does not hold up any other. Fetches are
+    single-flight per sso id: a request for an id that already has a fetch
+    in flight attaches to that fetch instead of starting another one, so
+    repeated clicks don't start extra device flows. A request that asks for
+    more than the fetch in flight (see RENEW, REFRESH and FORCE_REFRESH),
+    like a click while a renewal is running, instead gets a fetch of its own
+    once that one is done; the id counts as refreshing until then.
+
+    The engine is not thread safe and must only be used from the thread it
+    lives in. Callbacks are invoked in that thread.
+    """
+    # A device flow holds its worker until the user finishes logging in, so
+    # any cap would make the logins past it wait on the ones ahead of them.
+    # Single-flight already means at most one fetch per sso id, which
+    # bounds the number of workers by the number of instances.
+    DEFAULT_MAX_WORKERS = None
+
+    finished = pyqtSignal(str)
+
+    _future_done = pyqtSignal(str, object)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        if max_workers is None:
+            max_workers = self.DEFAULT_MAX_WORKERS
+        self._pool = WorkerPool(max_workers, thread_name_prefix='refresh')
+
+        self._in_flight = {}
+
+        self.requests = 0
+        self.started = 0
+        self.coalesced = 0
+        self.queued = 0
+
+        self._future_done.connect(self._on_future_done)
+
+        self.logger = LOGGER.getChild("RefreshEngine")
+
+    def is_refreshing(self, sso_id):
+        return sso_id in self._in_flight
+
+    def get_future(self, sso_id):
+        entry = self._in_flight.get(sso_id)
+        return entry.future if entry else None
+
+    def submit(self, sso_id, fn, callback=None, strength=REFRESH):
+        """Run fn() on the pool, then call callback(result, exception).
+
+        If a fetch for sso_id of at least the same strength is already in
+        flight, fn is not run, and the callback is instead called with the
+        result of the in-flight fetch. If the fetch in flight is weaker, fn
+        runs once it's done. Returns the future for the fetch in flight."""
+        return self.submit_future(sso_id, lambda: self._pool.submit(fn), callback, strength=strength)
+
+    def submit_future(self, sso_id, start, callback=None, strength=REFRESH):
+        """Like submit, for fetches that run elsewhere, e.g. on an asyncio
+        loop: start() starts the fetch and returns a concurrent future."""
+        self.requests += 1
+        entry = self._in_flight.get(sso_id)
+        if entry and strength <= entry.strength:
+            self.coalesced += 1
+            self.logger.debug("Fetch for %s in flight, coalescing (%i coalesced)", sso_id, self.coalesced)
+            if callback and callback not in entry.callbacks and callback not in entry.next_callbacks:
+                entry.callbacks.append(callback)
+            return entry.future
+        if entry:
+            self.queued += 1
+            self.logger.debug("Weaker fetch for %s in flight, queueing this one after it", sso_id)
+            if entry.next_start is None or strength > entry.next_strength:
+                entry.next_start, entry.next_strength = start, strength
+            if callback:
+                # it gets the result of the fetch it asked for
+                if callback in entry.callbacks:
+                    entry.callbacks.remove(callback)
+                if callback not in entry.next_callbacks:
+                    entry.next_callbacks.append(callback)
+            return entry.future
+        self.started += 1
+        self.logger.debug("Starting fetch for %s", sso_id)
+        future = start()
+        self._in_flight[sso_id] = _InFlight(future, strength, [callback] if callback else [])
+        self._watch(sso_id, future)
+        return future
+
+    def _watch(self, sso_id, future):
+        # The done callback runs on the worker thread; the signal queues the
+        # result back onto this object's thread. It runs right away if the
+        # future is already done, so the fetch must be in _in_flight first.
+        future.add_done_callback(lambda f, sso_id=sso_id: self._future_done.emit(sso_id, f))
+
+    def cancel(self, sso_id):
+        """Cancel the fetch for sso_id, and any queued after it, returning
+        whether the fetch was cancelled.
+
+        Fetches on the pool can only be cancelled before they start."""
+        entry = self._in_flight.get(sso_id)
+        if not entry:
+            return False
+        entry.drop_next()
+        cancelled = entry.future.cancel()
+        self.logger.debug("Cancelling fetch for %s (cancelled=%s)", sso_id, cancelled)
+        return cancelled
+
+    def shutdown(self, timeout=None):
+        """Cancel fetches that haven't started, and wait up to timeout
+        seconds for the rest to finish, returning whether they did.
+
+        Running fetches have to be told to stop some other way, e.g. by
+        shutting down their token fetcher."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for entry in self._in_flight.values():
+            entry.drop_next()
+        futures = [entry.future for entry in self._in_flight.values()]
+        for future in futures:
+            future.cancel()
+        _, not_done = concurrent.futures.wait(futures, timeout)
+        if not_done:
+            self.logger.warning("%i fetches didn't finish within %s seconds", len(not_done), timeout)
+        # deliver the results now, rather than through the event loop that's
+        # about to stop
+        for sso_id, entry in list(self._in_flight.items()):
+            if entry.future.done():
+                self._on_future_done(sso_id, entry.future)
+        stopped = self._pool.shutdown(None if deadline is None else max(0, deadline - time.monotonic()))
+        return stopped and not not_done
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'started': self.started,
+            'coalesced': self.coalesced,
+            'queued': self.queued,
+            'in_flight': len(self._in_flight),
+        }
+
+    @pyqtSlot(str, object)
+    def _on_future_done(self, sso_id, future):
+        entry = self._in_flight.get(sso_id)
+        if entry is None or entry.future is not future:
+            # already delivered by shutdown
+            return
+        if future.cancelled():
+            exception = CancelledError()
+        else:
+            exception = future.exception()
+        result = None if exception else future.result()
+        self.logger.debug("Fetch for %s finished (error=%s)", sso_id, exception)
+        if entry.next_start is None:
+            del self._in_flight[sso_id]
+            self._deliver(sso_id, entry.callbacks, result, exception)
+            return
+        # Start the fetch queued behind this one before delivering, so the
+        # id stays in flight and nobody sees it as done in between.
+        self.started += 1
+        self.logger.debug("Starting fetch queued for %s", sso_id)
+        try:
+            next_future = entry.next_start()
+        except Exception as e:
+            del self._in_flight[sso_id]
+            self._deliver(sso_id, entry.callbacks, result, exception, finished=False)
+            self._deliver(sso_id, entry.next_callbacks, None, e)
+            return
+        self._in_flight[sso_id] = _InFlight(next_future, entry.next_strength, entry.next_callbacks)
+        try:
+            self._deliver(sso_id, entry.callbacks, result, exception, finished=False)
+        finally:
+            self._watch(sso_id, next_future)
+
+    def _deliver(self, sso_id, callbacks, result, exception, finished=True):
+        try:
+            for callback in callbacks:
+                callback(result, exception)
+        finally:
+            if finished:
+                self.finished.emit(sso_id)
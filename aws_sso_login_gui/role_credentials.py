@@ -0,0 +1,130 @@
+import datetime
+import logging
+import threading
+
+import botocore
+from botocore.config import Config
+from botocore.utils import CachedProperty, tzutc
+
+from .clients import get_client_registry
+
+LOGGER = logging.getLogger("role_credentials")
+
+def get_role_credentials_fetcher_creator(session):
+    client_creator = get_client_registry(session).create_client
+    def role_credentials_fetcher_creator(region):
+        return RoleCredentialsFetcher(
+            sso_region=region,
+            client_creator=client_creator,
+        )
+    return role_credentials_fetcher_creator
+
+class RoleCredentialsFetcher(object):
+    """Gets role credentials with an SSO access token, caching them in memory.
+
+    Credentials are cached per start URL, account, and role, and are handed
+    out until they are within the expiry window of expiring. The window is
+    longer than the 15 minute advisory refresh window of the SDKs' refreshable
+    credentials, so that credentials handed out from the cache aren't
+    immediately refreshed by the SDK that asked for them.
+
+    Cached credentials are only handed out for the access token they were
+    got with, so a token replaced by a new login isn't used by way of the
+    cache; Config also invalidates an instance's credentials when its token
+    changes or goes away.
+
+    Credentials are returned in the credential_process format.
+    """
+    _EXPIRY_WINDOW = 20 * 60
+
+    def __init__(self, sso_region, client_creator, time_fetcher=None):
+        self._sso_region = sso_region
+        self._client_creator = client_creator
+
+        if time_fetcher is None:
+            time_fetcher = self._utc_now
+        self._time_fetcher = time_fetcher
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.logger = LOGGER.getChild("RoleCredentialsFetcher[{}]".format(sso_region))
+
+    def _utc_now(self):
+        return datetime.datetime.now(tzutc())
+
+    @CachedProperty
+    def _client(self):
+        config = Config(
+            region_name=self._sso_region,
+            signature_version=botocore.UNSIGNED,
+        )
+        return self._client_creator('sso', config=config)
+
+    def _is_expired(self, credentials):
+        seconds = (credentials['_expiration'] - self._time_fetcher()).total_seconds()
+        return seconds < self._EXPIRY_WINDOW
+
+    def get_cached_credentials(self, start_url, account_id, role_name, access_token=None):
+        key = (start_url, account_id, role_name)
+        with self._lock:
+            credentials = self._cache.get(key)
+            if (credentials is None or self._is_expired(credentials)
+                    or (access_token is not None and credentials['_access_token'] != access_token)):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._format(credentials)
+
+    def fetch_credentials(self, start_url, account_id, role_name, access_token):
+        """Get credentials from the cache, or from the SSO API if needed."""
+        credentials = self.get_cached_credentials(start_url, account_id, role_name, access_token)
+        if credentials is not None:
+            return credentials
+        self.logger.debug("Getting role credentials for %s %s", account_id, role_name)
+        response = self._client.get_role_credentials(
+            roleName=role_name,
+            accountId=account_id,
+            accessToken=access_token,
+        )
+        role_credentials = response['roleCredentials']
+        credentials = {
+            'AccessKeyId': role_credentials['accessKeyId'],
+            'SecretAccessKey': role_credentials['secretAccessKey'],
+            'SessionToken': role_credentials['sessionToken'],
+            # the API returns milliseconds since the epoch
+            '_expiration': datetime.datetime.fromtimestamp(role_credentials['expiration'] / 1000, tzutc()),
+            '_access_token': access_token,
+        }
+        with self._lock:
+            self._cache[(start_url, account_id, role_name)] = credentials
+        return self._format(credentials)
+
+    def invalidate(self, start_url=None):
+        """Drop the cached credentials for start_url, or for all start URLs."""
+        with self._lock:
+            if start_url is None:
+                self._cache.clear()
+            else:
+                for key in [key for key in self._cache if key[0] == start_url]:
+                    del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _format(self, credentials):
+        return {
+            'Version': 1,
+            'AccessKeyId': credentials['AccessKeyId'],
+            'SecretAccessKey': credentials['SecretAccessKey'],
+            'SessionToken': credentials['SessionToken'],
+            'Expiration': credentials['_expiration'].isoformat(),
+        }
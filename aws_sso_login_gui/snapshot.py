@@ -0,0 +1,70 @@
+"""The app's state from its last run, to show at startup.
+
+Showing the real statuses takes a reload: reading the config, loading
+botocore, and reading every token. The snapshot has what's needed to show
+the instances before that's done: their start URLs and regions, whether
+they're enabled, and their last known expirations. It's also where the
+enabled setting is kept between runs.
+
+    {
+        "version": 1,
+        "instances": {
+            "<sso id>": {
+                "start_url": "...",
+                "region": "...",
+                "enabled": true,
+                "expiration": "<ISO 8601, or null>"
+            }
+        }
+    }
+"""
+import json
+import logging
+import datetime
+
+from .file_lock import atomic_write
+
+LOGGER = logging.getLogger("snapshot")
+
+VERSION = 1
+
+def load_snapshot(path):
+    """Returns the instances in the snapshot, or {} if there isn't a usable one."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        LOGGER.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return {}
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        LOGGER.warning("Ignoring snapshot %s with unknown version", path)
+        return {}
+    instances = {}
+    for sso_id, entry in data.get('instances', {}).items():
+        try:
+            expiration = entry.get('expiration')
+            if expiration:
+                expiration = datetime.datetime.fromisoformat(expiration)
+            instances[sso_id] = {
+                'start_url': entry['start_url'],
+                'region': entry['region'],
+                'enabled': bool(entry.get('enabled', True)),
+                'expiration': expiration or None,
+            }
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            LOGGER.warning("Ignoring bad snapshot entry for %s: %s", sso_id, e)
+    return instances
+
+def save_snapshot(path, instances):
+    """Write the snapshot; instances is in the form load_snapshot() returns."""
+    data = {
+        'version': VERSION,
+        'instances': {
+            sso_id: dict(entry, expiration=entry['expiration'].isoformat() if entry['expiration'] else None)
+            for sso_id, entry in instances.items()
+        },
+    }
+    # small, and rewritten often, so skip the fsync
+    atomic_write(path, json.dumps(data, indent=2, sort_keys=True) + '\n', fsync=False)
@@ -0,0 +1,45 @@
+"""Startup timing, for --startup-profile.
+
+This is imported first thing by __main__, so times are from (about) when
+the process started. mark() records the time since then and since the
+previous mark, along with the top-level packages imported in between,
+which is where most of the time at startup goes.
+"""
+import sys
+import time
+import threading
+
+_START = time.perf_counter()
+
+_LOCK = threading.Lock()
+_MARKS = []
+_LAST = [_START]
+_PACKAGES = set(name.split('.')[0] for name in list(sys.modules))
+
+def _thread_name():
+    if threading.current_thread() is threading.main_thread():
+        return 'main'
+    return 'worker'
+
+def mark(phase):
+    now = time.perf_counter()
+    with _LOCK:
+        packages = set(name.split('.')[0] for name in list(sys.modules))
+        imported = sorted(name for name in packages - _PACKAGES if not name.startswith('_'))
+        _PACKAGES.update(packages)
+        _MARKS.append((phase, _thread_name(), now - _START, now - _LAST[0], imported))
+        _LAST[0] = now
+
+def elapsed():
+    return time.perf_counter() - _START
+
+def report():
+    with _LOCK:
+        marks = list(_MARKS)
+    lines = ['{:>9} {:>9}  {:<7} {}'.format('total ms', 'phase ms', 'thread', 'phase')]
+    for phase, thread_name, total, delta, imported in marks:
+        line = '{:9.1f} {:9.1f}  {:<7} {}'.format(total * 1000, delta * 1000, thread_name, phase)
+        if imported:
+            line += ' (imported {})'.format(', '.join(imported))
+        lines.append(line)
+    return '\n'.join(lines)
@@ -22,11 +22,13 @@ import getpass
 import threading
 import json
 import subprocess
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from copy import deepcopy
 from hashlib import sha1
 import hashlib
 import webbrowser
+import contextlib
+import functools
 
 from dateutil.parser import parse
 from dateutil.tz import tzlocal
@@ -47,7 +49,12 @@ from botocore.utils import (
     tzutc
 )
 
-from botocore.exceptions import BotoCoreError
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .file_lock import FileLock, LockCancelled, atomic_write
+from .paths import get_token_dir
+from .clients import get_client_registry
+from .metrics import get_registry, LOGIN_DURATION_BUCKETS, COUNT_BUCKETS
 
 class SSOError(BotoCoreError):
     fmt = "An unspecified error happened when resolving SSO credentials"
@@ -60,6 +67,14 @@ class PendingAuthorizationExpiredError(SSOError):
     )
 
 
+class FetchCancelledError(SSOError):
+    fmt = "The token fetch was cancelled"
+
+
+class RenewalUnavailableError(SSOError):
+    fmt = "The token can't be renewed without logging in again"
+
+
 class SSOTokenLoadError(SSOError):
     fmt = "Error loading SSO Token: {error_msg}"
 
@@ -74,27 +89,188 @@ class UnauthorizedSSOTokenError(SSOError):
 LOGGER = logging.getLogger("token_fetcher")
 
 def on_pending_authorization(**kwargs):
-    LOGGER.debug('on_pending_auth', kwargs)
+    LOGGER.debug('on_pending_auth %s', kwargs)
     webbrowser.open(kwargs['verificationUriComplete'])
 
-def get_token_dir(home_dir):
-    return os.path.expanduser(os.path.join(home_dir, '.aws', 'sso', 'cache'))
+def log_pending_authorization(**kwargs):
+    # for when there's no browser to open, e.g. in headless mode
+    LOGGER.warning("Login required: go to %s and confirm the code %s (expires %s)",
+        kwargs['verificationUriComplete'], kwargs['userCode'], kwargs['expiresAt'])
 
-def get_token_fetcher_creator(session, on_pending_authorization, cache=None, home_dir=None):
+def get_token_fetcher_creator(session, on_pending_authorization, cache=None, home_dir=None, loop=None):
+    """With an AsyncLoop, creates AsyncSSOTokenFetchers that poll on it."""
     if cache is None:
         if home_dir is None:
             home_dir = '~'
         token_dir = get_token_dir(home_dir)
-        cache = JSONFileCache(token_dir)
+        cache = MemoryCachedJSONFileCache(token_dir)
+    fetcher_class = SSOTokenFetcher
+    kwargs = {}
+    if loop is not None:
+        from .async_token_fetcher import AsyncSSOTokenFetcher
+        fetcher_class = AsyncSSOTokenFetcher
+        kwargs['loop'] = loop
+    client_creator = get_client_registry(session).create_client
     def token_fetcher_creator(region):
-        return SSOTokenFetcher(
+        return fetcher_class(
             sso_region=region,
-            client_creator=session.create_client,
+            client_creator=client_creator,
             cache=cache,
             on_pending_authorization=on_pending_authorization,
+            **kwargs
         )
     return token_fetcher_creator
 
+_MISSING = object()
+
+class MemoryCachedJSONFileCache(object):
+    """JSONFileCache with an in-memory layer in front of it.
+
+    Parsed entries are kept in memory along with the inode, mtime and size
+    of the file they were read from, with their ``expiresAt`` parsed into a
+    datetime, as it is in the tokens the fetcher writes, so checking a
+    token doesn't parse its timestamp on every lookup. A lookup costs a single stat of the
+    cache file, and the file is only re-read when any of those has changed,
+    so tokens written by other tools are still picked up, even when an
+    atomic replace keeps the same mtime and size. At most ``max_size``
+    entries are kept, evicting the least recently used.
+
+    Writes replace the file atomically, so an interrupted write never leaves
+    a truncated token behind; older versions of botocore's JSONFileCache
+    write in place.
+    """
+    DEFAULT_MAX_SIZE = 256
+
+    def __init__(self, working_dir, max_size=None, file_cache=None):
+        self._working_dir = working_dir
+        if max_size is None:
+            max_size = self.DEFAULT_MAX_SIZE
+        self._max_size = max_size
+        if file_cache is None:
+            file_cache = JSONFileCache(working_dir)
+        self._file_cache = file_cache
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def working_dir(self):
+        return self._working_dir
+
+    def get_path(self, cache_key):
+        return os.path.join(self._working_dir, cache_key + '.json')
+
+    def _stat(self, cache_key):
+        try:
+            stat = os.stat(self.get_path(cache_key))
+        except OSError:
+            return None
+        # a replaced file is a new inode, even within the mtime resolution
+        return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _store(self, cache_key, file_stat, value):
+        self._entries[cache_key] = (file_stat, value)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, cache_key, default=None):
+        file_stat = self._stat(cache_key)
+        with self._lock:
+            if file_stat is None:
+                self._entries.pop(cache_key, None)
+                self.misses += 1
+                return default
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == file_stat:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        try:
+            value = self._parse_expiration(self._file_cache[cache_key])
+        except KeyError:
+            return default
+        with self._lock:
+            self._store(cache_key, file_stat, value)
+        return value
+
+    def _parse_expiration(self, value):
+        if not isinstance(value, dict) or not isinstance(value.get('expiresAt'), str):
+            return value
+        try:
+            expires_at = dateutil.parser.parse(value['expiresAt'])
+        except (ValueError, OverflowError):
+            # left for the fetcher to fail on, as it would without this layer
+            return value
+        return dict(value, expiresAt=expires_at)
+
+    def __getitem__(self, cache_key):
+        value = self.get(cache_key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(cache_key)
+        return value
+
+    def __contains__(self, cache_key):
+        return self.get(cache_key, _MISSING) is not _MISSING
+
+    def _dumps(self, value):
+        # the same format as JSONFileCache
+        return json.dumps(value, default=self._serialize_if_needed)
+
+    def _serialize_if_needed(self, value):
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y-%m-%dT%H:%M:%S%Z')
+        return value
+
+    def __setitem__(self, cache_key, value):
+        try:
+            contents = self._dumps(value)
+        except (TypeError, ValueError):
+            raise ValueError("Value cannot be cached, must be JSON serializable: {}".format(value))
+        atomic_write(self.get_path(cache_key), contents)
+        file_stat = self._stat(cache_key)
+        with self._lock:
+            if file_stat is None:
+                self._entries.pop(cache_key, None)
+            else:
+                self._store(cache_key, file_stat, value)
+
+    def invalidate(self, cache_key=None):
+        with self._lock:
+            if cache_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(cache_key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+# The kinds of step in SSOTokenFetcher._fetch_steps
+_CALL = 'call'
+_WRITE = 'write'
+_SLEEP = 'sleep'
+_LOCK = 'lock'
+
+class _CacheLock(FileLock):
+    def acquire(self):
+        try:
+            super().acquire()
+        except LockCancelled:
+            raise FetchCancelledError()
+
 class SSOTokenFetcher(object):
     # The device flow RFC defines the slow down delay to be an additional
     # 5 seconds:
@@ -105,11 +281,15 @@ class SSOTokenFetcher(object):
     _EXPIRY_WINDOW = 15 * 60
     _CLIENT_REGISTRATION_TYPE = 'public'
     _GRANT_TYPE = 'urn:ietf:params:oauth:grant-type:device_code'
+    _REFRESH_GRANT_TYPE = 'refresh_token'
+    # Refresh tokens are only issued to clients registered with scopes
+    _SCOPES = ['sso:account:access']
 
     def __init__(
             self, sso_region, client_creator, cache=None,
             on_pending_authorization=None,
             time_fetcher=None, sleep=None,
+            metrics=None,
     ):
         self._sso_region = sso_region
         self._client_creator = client_creator
@@ -119,17 +299,58 @@ class SSOTokenFetcher(object):
             time_fetcher = self._utc_now
         self._time_fetcher = time_fetcher
 
+        # set by shutdown(); the default sleep wakes up when it's set
+        self._cancelled = threading.Event()
+
         if sleep is None:
-            sleep = time.sleep
+            sleep = self._wait
         self._sleep = sleep
 
         if cache is None:
             cache = {}
         self._cache = cache
 
+        # fetches for different start urls can run concurrently
+        self._registration_lock = threading.Lock()
+
+        if metrics is None:
+            metrics = get_registry()
+        self._fetches = metrics.counter('sso_token_fetch_total',
+            'Token fetches, by where the token came from', ['source'])
+        self._device_flow_duration = metrics.histogram('sso_device_flow_duration_seconds',
+            'Time from starting a device authorization to its end', ['outcome'],
+            buckets=LOGIN_DURATION_BUCKETS)
+        self._device_flow_polls = metrics.histogram('sso_device_flow_polls',
+            'CreateToken calls per device authorization', buckets=COUNT_BUCKETS)
+        self._slow_downs = metrics.counter('sso_slow_down_total',
+            'SlowDownException responses while polling')
+        self._registration_cache = metrics.counter('sso_registration_cache_total',
+            'Client registration cache lookups', ['result'])
+        self._refresh_grants = metrics.counter('sso_refresh_grant_total',
+            'Token renewals using a refresh token', ['outcome'])
+
     def _utc_now(self):
         return datetime.datetime.now(tzutc())
 
+    def _wait(self, seconds):
+        if self._cancelled.wait(seconds):
+            raise FetchCancelledError()
+
+    def shutdown(self):
+        """Cancel fetches in progress and refuse new ones.
+
+        Device flows stop polling at their next wait. A fetch that has got
+        its token still writes it to the cache before returning."""
+        self._cancelled.set()
+
+    def _cache_get(self, cache_key):
+        # A single lookup, rather than a containment check followed by a
+        # read, so that a file-backed cache is only hit once.
+        try:
+            return self._cache[cache_key]
+        except KeyError:
+            return None
+
     def _parse_if_needed(self, value):
         if isinstance(value, datetime.datetime):
             return value
@@ -148,6 +369,16 @@ class SSOTokenFetcher(object):
         )
         return self._client_creator('sso-oidc', config=config)
 
+    def prewarm(self):
+        """Create the client on a background thread, ahead of the first fetch.
+
+        The first client of a session takes a while to create, loading
+        botocore's endpoint and service data."""
+        thread = threading.Thread(target=lambda: self._client,
+            name='prewarm-sso-oidc-{}'.format(self._sso_region), daemon=True)
+        thread.start()
+        return thread
+
     def _register_client(self):
         timestamp = datetime2timestamp(self._time_fetcher())
         response = self._client.register_client(
@@ -155,6 +386,7 @@ class SSOTokenFetcher(object):
             # user. For now we'll just use botocore-client with the timestamp.
             clientName='botocore-client-%s' % int(timestamp),
             clientType=self._CLIENT_REGISTRATION_TYPE,
+            scopes=self._SCOPES,
         )
         expires_at = response['clientSecretExpiresAt']
         expires_at = datetime.datetime.fromtimestamp(expires_at, tzutc())
@@ -162,6 +394,7 @@ class SSOTokenFetcher(object):
             'clientId': response['clientId'],
             'clientSecret': response['clientSecret'],
             'expiresAt': expires_at,
+            'scopes': self._SCOPES,
         }
         return registration
 
@@ -170,14 +403,20 @@ class SSOTokenFetcher(object):
         # 90 days, and can be shared. This is currently scoped to individual
         # tools and as such each tool has their own cached client id.
         cache_key = 'botocore-client-id-%s' % self._sso_region
-        if cache_key in self._cache:
-            registration = self._cache[cache_key]
-            if not self._is_expired(registration):
+        with self._registration_lock, self._cache_lock(cache_key):
+            registration = self._cache_get(cache_key)
+            # Registrations made without scopes (e.g., by older versions or
+            # other tools) can't be used to get refresh tokens.
+            if (registration is not None
+                    and not self._is_expired(registration)
+                    and registration.get('scopes') == self._SCOPES):
+                self._registration_cache.inc(result='hit')
                 return registration
 
-        registration = self._register_client()
-        self._cache[cache_key] = registration
-        return registration
+            self._registration_cache.inc(result='miss')
+            registration = self._register_client()
+            self._cache[cache_key] = registration
+            return registration
 
     def _authorize_client(self, start_url, registration):
         # NOTE: The authorization response is not cached. These responses are
@@ -200,85 +439,248 @@ class SSOTokenFetcher(object):
             authorization['interval'] = response['interval']
         return authorization
 
-    def _poll_for_token(self, start_url):
-        registration = self._registration()
+    def _poll_steps(self, start_url):
+        registration = yield _CALL, self._registration, ()
 
-        authorization = self._authorize_client(start_url, registration)
+        authorization = yield _CALL, self._authorize_client, (start_url, registration)
 
         if self._on_pending_authorization:
             # This callback can display the user code / verification URI
             # so the user knows the page to go to. Potentially, this call
             # back could even be used to auto open a browser.
-            self._on_pending_authorization(**authorization)
+            yield _CALL, functools.partial(self._on_pending_authorization, **authorization), ()
 
         interval = authorization.get('interval', self._DEFAULT_INTERVAL)
-        # NOTE: This loop currently relies on the service to either return
-        # a valid token or a ExpiredTokenException to break the loop. If this
-        # proves to be problematic it may be worth adding an additional
-        # mechanism to control timing this loop out.
-        while True:
-            try:
-                response = self._client.create_token(
-                    grantType=self._GRANT_TYPE,
-                    clientId=registration['clientId'],
-                    clientSecret=registration['clientSecret'],
-                    deviceCode=authorization['deviceCode'],
-                )
-                expires_in = datetime.timedelta(seconds=response['expiresIn'])
-                token = {
-                    'startUrl': start_url,
-                    'region': self._sso_region,
-                    'accessToken': response['accessToken'],
-                    'expiresAt': self._time_fetcher() + expires_in
-                }
-                return token
-            except self._client.exceptions.SlowDownException:
-                interval += self._SLOW_DOWN_DELAY
-            except self._client.exceptions.AuthorizationPendingException:
-                pass
-            except self._client.exceptions.ExpiredTokenException:
-                raise PendingAuthorizationExpiredError()
-            self._sleep(interval)
+        start_time = self._time_fetcher()
+        polls = 0
+        outcome = 'error'
+        try:
+            # NOTE: This loop currently relies on the service to either return
+            # a valid token or a ExpiredTokenException to break the loop. If this
+            # proves to be problematic it may be worth adding an additional
+            # mechanism to control timing this loop out.
+            while True:
+                if self._cancelled.is_set():
+                    raise FetchCancelledError()
+                try:
+                    polls += 1
+                    response = yield _CALL, functools.partial(self._client.create_token,
+                        grantType=self._GRANT_TYPE,
+                        clientId=registration['clientId'],
+                        clientSecret=registration['clientSecret'],
+                        deviceCode=authorization['deviceCode'],
+                    ), ()
+                    outcome = 'success'
+                    return self._token_from_response(start_url, response, registration)
+                except self._client.exceptions.SlowDownException:
+                    self._slow_downs.inc()
+                    interval += self._SLOW_DOWN_DELAY
+                except self._client.exceptions.AuthorizationPendingException:
+                    pass
+                except self._client.exceptions.ExpiredTokenException:
+                    outcome = 'expired'
+                    raise PendingAuthorizationExpiredError()
+                yield _SLEEP, interval
+        except FetchCancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            duration = (self._time_fetcher() - start_time).total_seconds()
+            self._device_flow_duration.observe(duration, outcome=outcome)
+            self._device_flow_polls.observe(polls)
+
+    def _token_from_response(self, start_url, response, registration, refresh_token=None):
+        expires_in = datetime.timedelta(seconds=response['expiresIn'])
+        token = {
+            'startUrl': start_url,
+            'region': self._sso_region,
+            'accessToken': response['accessToken'],
+            'expiresAt': self._time_fetcher() + expires_in
+        }
+        # The refresh token is bound to the client that obtained it, so the
+        # registration is stored alongside it, the same way botocore's
+        # SSOTokenProvider does. botocore ignores these fields when it loads
+        # the access token.
+        refresh_token = response.get('refreshToken', refresh_token)
+        if refresh_token:
+            token['refreshToken'] = refresh_token
+            token['clientId'] = registration['clientId']
+            token['clientSecret'] = registration['clientSecret']
+            token['registrationExpiresAt'] = registration['expiresAt']
+        return token
+
+    def _can_refresh(self, token):
+        if not all(key in token for key in ['refreshToken', 'clientId', 'clientSecret']):
+            return False
+        if 'registrationExpiresAt' in token:
+            registration_expiration = self._parse_if_needed(token['registrationExpiresAt'])
+            if registration_expiration <= self._time_fetcher():
+                return False
+        return True
+
+    def _refresh_token(self, start_url, token):
+        response = self._client.create_token(
+            grantType=self._REFRESH_GRANT_TYPE,
+            clientId=token['clientId'],
+            clientSecret=token['clientSecret'],
+            refreshToken=token['refreshToken'],
+        )
+        registration = {
+            'clientId': token['clientId'],
+            'clientSecret': token['clientSecret'],
+            'expiresAt': token.get('registrationExpiresAt'),
+        }
+        return self._token_from_response(start_url, response, registration,
+            refresh_token=token['refreshToken'])
+
+    def _attempt_refresh(self, start_url, token):
+        if not self._can_refresh(token):
+            return None
+        try:
+            LOGGER.debug("Refreshing token for %s using refresh token", start_url)
+            token = self._refresh_token(start_url, token)
+            self._refresh_grants.inc(outcome='success')
+            return token
+        except (ClientError, BotoCoreError) as e:
+            self._refresh_grants.inc(outcome='failure')
+            # e.g., the refresh token has been revoked or has expired
+            LOGGER.info("Token refresh for %s failed: %s", start_url, e)
+            return None
 
     def _get_cache_key(self, start_url):
         return hashlib.sha1(start_url.encode('utf-8')).hexdigest()
 
-    def _token(self, start_url, force_refresh):
+    def get_cache_key(self, start_url):
+        return self._get_cache_key(start_url)
+
+    def _cache_lock(self, cache_key):
+        # Other processes (like another copy of this app) share file-backed
+        # caches, so a lock file next to the cache entry serializes the
+        # check-then-fetch across processes as well as threads. In-memory
+        # caches aren't shared, and the refresh engine already ensures one
+        # fetch at a time per start URL.
+        working_dir = getattr(self._cache, 'working_dir', None)
+        if working_dir is None:
+            return contextlib.nullcontext()
+        # waiting on another process gives up on shutdown, like polling does
+        return _CacheLock(os.path.join(working_dir, cache_key + '.lock'), cancel_event=self._cancelled)
+
+    def _fetch_steps(self, start_url, force_refresh, renew):
+        """A fetch, as a generator of the steps it needs run.
+
+        It yields (_CALL, fn, args) for blocking calls, (_WRITE, fn, args)
+        for cache writes, which have to finish even if the fetch is
+        cancelled, (_SLEEP, seconds) between polls, and (_LOCK, lock) to
+        take the cache lock. It's sent each call's result, or has its
+        exception thrown in, and returns the refresh deadline. _run_steps
+        runs the steps in the calling thread; the async fetcher runs the
+        same steps on its loop.
+        """
+        if self._cancelled.is_set():
+            raise FetchCancelledError()
         cache_key = self._get_cache_key(start_url)
-        # Only obey the token cache if we are not forcing a refresh.
-        if not force_refresh and cache_key in self._cache:
-            token = self._cache[cache_key]
-            if not self._is_expired(token):
-                return token
-
-        token = self._poll_for_token(start_url)
-        self._cache[cache_key] = token
-
-        return self.refresh_deadline(start_url)
+        seen_token = yield _CALL, self._cache_get, (cache_key,)
+        lock = self._cache_lock(cache_key)
+        yield _LOCK, lock
+        try:
+            # If someone else fetched a token while we were waiting for the
+            # lock, use it rather than starting another device flow, even
+            # if we were asked to force a refresh.
+            token = yield _CALL, self._cache_get, (cache_key,)
+            if (token is not None and not self._is_expired(token)
+                    and (seen_token is None or token.get('accessToken') != seen_token.get('accessToken'))):
+                LOGGER.debug("Using token for %s fetched while waiting for the lock", start_url)
+                self._fetches.inc(source='lock_wait')
+                return self._refresh_deadline(token)
+
+            # Only obey the token cache if we are not forcing a refresh.
+            if not force_refresh and token is not None:
+                # When renewing ahead of time, the token is replaced even if
+                # it isn't in the expiry window yet.
+                if not renew and not self._is_expired(token):
+                    self._fetches.inc(source='cache')
+                    return self._refresh_deadline(token)
+                # Renew silently if we can, rather than sending the user
+                # through the device authorization flow again.
+                token = yield _CALL, self._attempt_refresh, (start_url, token)
+                if token is not None:
+                    yield _WRITE, self._cache.__setitem__, (cache_key, token)
+                    self._fetches.inc(source='refresh_token')
+                    return self._refresh_deadline(token)
+
+            # Nobody asked for a renewal, so it mustn't open a browser.
+            if renew and not force_refresh:
+                raise RenewalUnavailableError()
+
+            token = yield from self._poll_steps(start_url)
+            yield _WRITE, self._cache.__setitem__, (cache_key, token)
+            self._fetches.inc(source='device_flow')
+            return self._refresh_deadline(token)
+        finally:
+            lock.__exit__(None, None, None)
+
+    def _run_steps(self, steps):
+        result = error = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            result = error = None
+            try:
+                result = self._run_step(*step)
+            except Exception as e:
+                error = e
+
+    def _run_step(self, kind, *args):
+        if kind == _SLEEP:
+            self._sleep(*args)
+        elif kind == _LOCK:
+            args[0].__enter__()
+        else:
+            fn, fn_args = args
+            return fn(*fn_args)
+
+    def _refresh_deadline(self, token):
+        end_time = self._parse_if_needed(token['expiresAt'])
+        return end_time - datetime.timedelta(seconds=self._EXPIRY_WINDOW)
 
     def get_expiration(self, start_url):
-        cache_key = self._get_cache_key(start_url)
-        if cache_key in self._cache:
-            token = self._cache[cache_key]
+        token = self._cache_get(self._get_cache_key(start_url))
+        if token is not None:
             end_time = self._parse_if_needed(token['expiresAt'])
             return end_time
         return None
 
     def refresh_deadline(self, start_url):
-        cache_key = self._get_cache_key(start_url)
-        if cache_key in self._cache:
-            token = self._cache[cache_key]
-            end_time = self._parse_if_needed(token['expiresAt'])
-            seconds = total_seconds(end_time - self._time_fetcher())
-            return end_time - datetime.timedelta(seconds=self._EXPIRY_WINDOW)
+        token = self._cache_get(self._get_cache_key(start_url))
+        if token is not None:
+            return self._refresh_deadline(token)
+        return None
+
+    def get_refresh_status(self, start_url):
+        """Get (needs_refresh, refresh_deadline) from a single cache lookup."""
+        token = self._cache_get(self._get_cache_key(start_url))
+        if token is None:
+            return True, None
+        return self._is_expired(token), self._refresh_deadline(token)
+
+    def can_renew(self, start_url):
+        """Whether the token can be renewed with its refresh token, without a login."""
+        token = self._cache_get(self._get_cache_key(start_url))
+        return token is not None and self._can_refresh(token)
+
+    def get_access_token(self, start_url):
+        token = self._cache_get(self._get_cache_key(start_url))
+        if token is not None and not self._is_expired(token):
+            return token['accessToken']
         return None
 
     def needs_refresh(self, start_url):
-        cache_key = self._get_cache_key(start_url)
-        if cache_key in self._cache:
-            token = self._cache[cache_key]
+        token = self._cache_get(self._get_cache_key(start_url))
+        if token is not None:
             return self._is_expired(token)
         return True
 
-    def fetch_token(self, start_url, force_refresh=False):
-        return self._token(start_url, force_refresh)
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        return self._run_steps(self._fetch_steps(start_url, force_refresh, renew))
@@ -0,0 +1,155 @@
+import os
+import logging
+
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal, pyqtSlot
+
+LOGGER = logging.getLogger("watcher")
+
+class ConfigWatcher(QObject):
+    """Watches the AWS config files and the SSO token cache for changes.
+
+    Uses QFileSystemWatcher (inotify on Linux) rather than polling. Bursts
+    of events, like an editor saving a file or a tool writing a token, are
+    debounced into a single notification.
+
+    config_changed is emitted when the config or credentials file changes.
+    tokens_changed is emitted with the cache keys of the token cache files
+    that were created, modified, or deleted. Both are only emitted when a
+    file's stat has changed, so other files in the watched directories,
+    like lock files and the temp files of atomic writes, are ignored.
+    """
+    DEBOUNCE_MS = 250
+
+    config_changed = pyqtSignal()
+    tokens_changed = pyqtSignal(list)
+
+    def __init__(self, config_files, token_dir, debounce_ms=None, parent=None):
+        super().__init__(parent)
+        self._config_files = [os.path.abspath(path) for path in config_files]
+        self._token_dir = os.path.abspath(token_dir)
+
+        if debounce_ms is None:
+            debounce_ms = self.DEBOUNCE_MS
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(debounce_ms)
+        self._debounce_timer.timeout.connect(self._flush)
+
+        self._config_dirty = False
+        self._tokens_dirty = False
+        self._config_file_stats = {}
+        self._token_files = {}
+
+        self.logger = LOGGER.getChild("ConfigWatcher")
+
+    @pyqtSlot()
+    def start(self):
+        self._config_file_stats = self._stat_config_files()
+        self._token_files = self._scan_token_dir()
+        self._update_watches()
+
+    @pyqtSlot()
+    def stop(self):
+        self._debounce_timer.stop()
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+
+    def _update_watches(self):
+        # Files that are replaced rather than rewritten (and files that
+        # didn't exist yet) drop out of the watch, so the watches are
+        # re-established after every change. Parent directories are watched
+        # to catch files being created.
+        paths = set()
+        for path in self._config_files:
+            paths.add(os.path.dirname(path))
+            if os.path.isfile(path):
+                paths.add(path)
+        if os.path.isdir(self._token_dir):
+            paths.add(self._token_dir)
+            for name in self._token_files:
+                paths.add(os.path.join(self._token_dir, name))
+        else:
+            # watch for the cache directory being created
+            paths.add(os.path.dirname(self._token_dir))
+        paths = [path for path in paths if os.path.exists(path)]
+        watched = set(self._watcher.files() + self._watcher.directories())
+        missing = [path for path in paths if path not in watched]
+        if missing:
+            self._watcher.addPaths(missing)
+
+    def _stat_config_files(self):
+        config_file_stats = {}
+        for path in self._config_files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                config_file_stats[path] = None
+                continue
+            config_file_stats[path] = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return config_file_stats
+
+    def _scan_token_dir(self):
+        token_files = {}
+        try:
+            entries = os.scandir(self._token_dir)
+        except OSError:
+            return token_files
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                token_files[entry.name] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return token_files
+
+    def _is_config_path(self, path):
+        path = os.path.abspath(path)
+        return path in self._config_files or any(path == os.path.dirname(f) for f in self._config_files)
+
+    @pyqtSlot(str)
+    def _on_file_changed(self, path):
+        if os.path.dirname(os.path.abspath(path)) == self._token_dir:
+            self._tokens_dirty = True
+        else:
+            self._config_dirty = True
+        self._debounce_timer.start()
+
+    @pyqtSlot(str)
+    def _on_directory_changed(self, path):
+        path = os.path.abspath(path)
+        if path == self._token_dir or self._token_dir.startswith(path + os.sep):
+            self._tokens_dirty = True
+        if self._is_config_path(path):
+            self._config_dirty = True
+        self._debounce_timer.start()
+
+    def _flush(self):
+        if self._config_dirty:
+            self._config_dirty = False
+            config_file_stats = self._stat_config_files()
+            if config_file_stats != self._config_file_stats:
+                self._config_file_stats = config_file_stats
+                self.logger.debug("Config changed")
+                self.config_changed.emit()
+        if self._tokens_dirty:
+            self._tokens_dirty = False
+            token_files = self._scan_token_dir()
+            changed = set(token_files.keys()) ^ set(self._token_files.keys())
+            for name, file_stat in token_files.items():
+                if name in self._token_files and self._token_files[name] != file_stat:
+                    changed.add(name)
+            self._token_files = token_files
+            cache_keys = sorted(name[:-len('.json')] for name in changed)
+            if cache_keys:
+                self.logger.debug("Tokens changed: %s", cache_keys)
+                self.tokens_changed.emit(cache_keys)
+        self._update_watches()
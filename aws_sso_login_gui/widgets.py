@@ -4,7 +4,7 @@ import re
 import os
 import logging
 
-import dateutil
+import dateutil.tz
 
 from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import *
@@ -54,6 +54,10 @@ class SSOInstanceWidgets(QObject):
         self.logger.debug('update_status status=%s exp=%s', status, expiration)
         self.status_label.setText(status)
         self.status_label.setStyleSheet(status_to_style(status))
+        # the enabled setting can come from the snapshot rather than a click
+        self.checkbox.blockSignals(True)
+        self.checkbox.setChecked(status != STATUS_DISABLED)
+        self.checkbox.blockSignals(False)
         if status == STATUS_DISABLED:
             self.refresh_button.setEnabled(False)
             self.force_refresh_button.setEnabled(False)
@@ -72,9 +76,20 @@ class SSOInstanceWidgets(QObject):
             expiration_text = exp_dt_local.strftime('%Y-%m-%d %I:%M %p')
         self.expiration_label.setText(expiration_text)
 
+    def widgets(self):
+        return [
+            self.checkbox,
+            self.sso_id_label,
+            self.status_label,
+            self.expiration_label,
+            self.refresh_button,
+            self.force_refresh_button,
+        ]
+
     def decommision(self):
-        #TODO: disconnect?
-        pass
+        for widget in self.widgets():
+            widget.hide()
+            widget.deleteLater()
 
 class AWSSSOLoginWindow(QWidget):
 
@@ -99,13 +114,15 @@ class AWSSSOLoginWindow(QWidget):
         self.instances_grid_layout = None
 
         self.widget_index = {}
+        # sso id -> grid row
+        self._rows = {}
 
         self.needs_reload.connect(self.config.reload)
         self.needs_refresh.connect(self.config.refresh)
         self.instance_enabled.connect(self.config.set_enable)
         self.needs_import.connect(self.config.import_config)
 
-        self.config.reloaded.connect(self.on_reload)
+        self.config.instances_changed.connect(self.on_instances_changed)
         self.config.reload_status_update_finished.connect(self.on_reload_status_update_finished)
         self.config.status_changed.connect(self.on_status_changed)
         self.config.import_finished.connect(self.on_import_finished)
@@ -126,14 +143,7 @@ class AWSSSOLoginWindow(QWidget):
 
         self.logger = LOGGER.getChild("AWSSSOLoginWindow")
 
-    def on_reload(self, sso_instances):
-        self.logger.debug('on_reload ids=%s', sso_instances)
-
-        #TODO: reset grid
-        if self.instances_widget:
-            self.outer_layout.removeItem(self.outer_layout.itemAt(0))
-            self.instances_widget.hide()
-
+    def _create_instances_widget(self):
         self.instances_widget = QGroupBox("SSO instances")
         self.outer_layout.insertWidget(0, self.instances_widget)
 
@@ -141,8 +151,6 @@ class AWSSSOLoginWindow(QWidget):
 
         self.instances_widget.setLayout(self.instances_grid_layout)
 
-        missing_instances = set(self.widget_index.keys())
-
         timezone_name = datetime.datetime.now(dateutil.tz.gettz()).strftime('%Z')
 
         self.instances_grid_layout.addWidget(QLabel("Enabled"), 0, 0)
@@ -150,46 +158,79 @@ class AWSSSOLoginWindow(QWidget):
         self.instances_grid_layout.addWidget(QLabel("Status"),       0, 2)
         self.instances_grid_layout.addWidget(QLabel("Expiration ({})".format(timezone_name)),   0, 3)
 
-        for i, sso_id in enumerate(sso_instances):
-            sso_instance_widgets = SSOInstanceWidgets(sso_id)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.checkbox,             i+1, 0)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.sso_id_label,         i+1, 1)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.status_label,         i+1, 2)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.expiration_label,     i+1, 3)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.refresh_button,       i+1, 4)
-            self.instances_grid_layout.addWidget(sso_instance_widgets.force_refresh_button, i+1, 5)
-
-            def on_checkbox_change(check_state, sso_id=sso_id):
-                self.logger.debug('on_checkbox_change id=%s state=%s', sso_id, ['Unchecked', 'PartiallyChecked', 'Checked'][check_state])
-                enabled = check_state == 2
-                self.instance_enabled.emit(sso_id, enabled)
-            sso_instance_widgets.checkbox.stateChanged.connect(on_checkbox_change)
-
-            def on_click_refresh(value, sso_id=sso_id): # kwarg to capture current value of variable
-                self.logger.debug('on_click_refresh id=%s value=%s', sso_id, value)
-                self.needs_refresh.emit(sso_id)
-            sso_instance_widgets.refresh_button.clicked.connect(on_click_refresh)
-
-            def on_click_force_refresh(value, sso_id=sso_id): # kwarg to capture current value of variable
-                self.logger.debug('on_click_force_refresh id=%s value=%s', sso_id, value)
-                self.needs_refresh.emit(sso_id, True)
-            sso_instance_widgets.force_refresh_button.clicked.connect(on_click_force_refresh)
-
-            self.widget_index[sso_id] = sso_instance_widgets
-            missing_instances.discard(sso_id)
-
-        for sso_id in missing_instances:
-            sso_instance_widgets = self.widget_index.pop(sso_id)
+    def on_instances_changed(self, added, removed, changed):
+        self.logger.debug('on_instances_changed added=%s removed=%s changed=%s', added, removed, changed)
+
+        # Rows are patched in place rather than rebuilding the grid, so
+        # reloading doesn't flicker. Changed instances keep their widgets;
+        # their new status arrives through status_changed.
+        if not self.instances_widget:
+            self._create_instances_widget()
+
+        for sso_id in removed:
+            sso_instance_widgets = self.widget_index.pop(sso_id, None)
+            self._rows.pop(sso_id, None)
+            if not sso_instance_widgets:
+                continue
+            for widget in sso_instance_widgets.widgets():
+                self.instances_grid_layout.removeWidget(widget)
             sso_instance_widgets.decommision()
 
+        for sso_id in added:
+            if sso_id in self.widget_index:
+                continue
+            self._add_instance_widgets(sso_id)
+
+        self._lay_out_rows()
+
+    def _lay_out_rows(self):
+        # Keep the rows sorted by sso id, with no gaps left by removed
+        # instances. Only rows that have to move are touched.
+        for row, sso_id in enumerate(sorted(self.widget_index.keys()), start=1):
+            if self._rows.get(sso_id) == row:
+                continue
+            for column, widget in enumerate(self.widget_index[sso_id].widgets()):
+                self.instances_grid_layout.removeWidget(widget)
+                self.instances_grid_layout.addWidget(widget, row, column)
+            self._rows[sso_id] = row
+
+    def _add_instance_widgets(self, sso_id):
+        sso_instance_widgets = SSOInstanceWidgets(sso_id)
+
+        def on_checkbox_change(check_state, sso_id=sso_id):
+            self.logger.debug('on_checkbox_change id=%s state=%s', sso_id, ['Unchecked', 'PartiallyChecked', 'Checked'][check_state])
+            enabled = check_state == 2
+            self.instance_enabled.emit(sso_id, enabled)
+        sso_instance_widgets.checkbox.stateChanged.connect(on_checkbox_change)
+
+        def on_click_refresh(value, sso_id=sso_id): # kwarg to capture current value of variable
+            self.logger.debug('on_click_refresh id=%s value=%s', sso_id, value)
+            self.needs_refresh.emit(sso_id)
+        sso_instance_widgets.refresh_button.clicked.connect(on_click_refresh)
+
+        def on_click_force_refresh(value, sso_id=sso_id): # kwarg to capture current value of variable
+            self.logger.debug('on_click_force_refresh id=%s value=%s', sso_id, value)
+            self.needs_refresh.emit(sso_id, True)
+        sso_instance_widgets.force_refresh_button.clicked.connect(on_click_force_refresh)
+
+        self.widget_index[sso_id] = sso_instance_widgets
+
     def on_reload_status_update_finished(self):
         pass
 
     def on_status_changed(self, sso_id, status, expiration):
         self.logger.debug('on_status_changed id=%s status=%s exp=%s', sso_id, status, expiration)
-        sso_instance_widgets = self.widget_index[sso_id]
+        sso_instance_widgets = self.widget_index.get(sso_id)
+        if not sso_instance_widgets:
+            # removed by a reload while the status was in flight
+            return
         sso_instance_widgets.update_status(status, expiration)
 
+    def bring_to_front(self):
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
     def on_import_clicked(self):
         self.logger.debug("on_import_clicked")
         filename = QFileDialog.getOpenFileName(filter="INI files (*.ini)")[0]
@@ -0,0 +1,7 @@
+"""Benchmarks for aws_sso_login_gui.
+
+Run them all with ``python -m benchmarks run``, which writes the results as
+JSON; ``python -m benchmarks compare`` compares two result files. Each module
+can also be run on its own, e.g. ``python -m benchmarks.profile_scanner``.
+Nothing here touches the network or the real ~/.aws directory.
+"""
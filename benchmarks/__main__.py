@@ -0,0 +1,139 @@
+"""Run the benchmarks, writing the results as JSON, and compare results.
+
+    python -m benchmarks run [--quick] [--output FILE] [NAME ...]
+    python -m benchmarks compare OLD_FILE NEW_FILE
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import importlib
+import subprocess
+
+from .common import get_qt_app
+
+BENCHMARKS = [
+    'profile_scanner',
+    'reload',
+    'status',
+    'config_import',
+    'widgets',
+    'token_lock',
+    'token_fetcher',
+    'shutdown',
+    'clients',
+    'startup',
+]
+
+# smaller runs for a quick check
+QUICK_KWARGS = {
+    'profile_scanner': {'num_profiles': 1000, 'repeat': 3},
+    'reload': {'sizes': (10, 100, 1000), 'repeat': 3},
+    'status': {'sizes': (10, 100), 'repeat': 3},
+    'config_import': {'existing_profiles': 1000, 'import_sizes': (10, 100), 'repeat': 2, 'max_sequential': 10},
+    'widgets': {'sizes': (10, 100), 'repeat': 2},
+    'token_lock': {'processes': 8, 'urls': 2},
+    'token_fetcher': {'urls': 50},
+    'shutdown': {'sizes': (1, 10), 'repeat': 2},
+    'clients': {'repeat': 2, 'logins': 8},
+    'startup': {'repeat': 2},
+}
+
+def get_metadata():
+    metadata = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    try:
+        metadata['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    try:
+        import botocore
+        from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+        metadata['botocore'] = botocore.__version__
+        metadata['qt'] = QT_VERSION_STR
+        metadata['pyqt'] = PYQT_VERSION_STR
+    except ImportError:
+        pass
+    return metadata
+
+def run(names, quick=False):
+    if 'widgets' in names:
+        # the one Qt application per process has to support widgets
+        get_qt_app(widgets=True)
+    results = {}
+    for name in names:
+        print('Running {}'.format(name), file=sys.stderr)
+        module = importlib.import_module('.' + name, __package__)
+        kwargs = QUICK_KWARGS.get(name, {}) if quick else {}
+        results[name] = module.run(**kwargs)
+    return {
+        'metadata': get_metadata(),
+        'quick': quick,
+        'results': results,
+    }
+
+def compare(old, new, threshold):
+    """Print the change in median times, returning the regressions."""
+    regressions = []
+    for name, new_results in new['results'].items():
+        old_results = old['results'].get(name, {})
+        for key, new_result in new_results.items():
+            old_result = old_results.get(key)
+            if not (isinstance(new_result, dict) and isinstance(old_result, dict)
+                    and 'median' in new_result and 'median' in old_result):
+                continue
+            ratio = new_result['median'] / old_result['median'] if old_result['median'] else float('inf')
+            flag = ''
+            if ratio > threshold:
+                flag = ' REGRESSION'
+                regressions.append((name, key, ratio))
+            print('{:<16} {:<32} {:10.3f} ms -> {:10.3f} ms  x{:.2f}{}'.format(
+                name, key, old_result['median'] * 1000, new_result['median'] * 1000, ratio, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('names', nargs='*', metavar='NAME',
+        help='benchmarks to run (default: all of {})'.format(', '.join(BENCHMARKS)))
+    run_parser.add_argument('--quick', action='store_true', help='use smaller sizes')
+    run_parser.add_argument('--output', '-o', metavar='FILE', help='write JSON here instead of stdout')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=1.25,
+        help='flag medians that got slower by more than this factor')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        return 1 if regressions else 0
+
+    names = args.names or BENCHMARKS
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(', '.join(unknown)))
+    output = json.dumps(run(names, quick=args.quick), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
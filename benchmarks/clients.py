@@ -0,0 +1,85 @@
+"""Benchmark botocore client creation for the token fetchers.
+
+Times the first login of a session with and without creating the client
+ahead of time, and counts the clients created when many logins in one
+region start at once, with and without the shared ClientRegistry. Logins
+go to the local SSO emulator.
+"""
+import sys
+import argparse
+import threading
+import functools
+
+import botocore.session
+
+from aws_sso_login_gui.clients import ClientRegistry
+from .emulator import SSOEmulator
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher
+
+from .common import measure, format_result
+
+def get_fetcher(client_creator, endpoint_url, region='us-east-1'):
+    return SSOTokenFetcher(
+        sso_region=region,
+        client_creator=functools.partial(client_creator, endpoint_url=endpoint_url),
+        cache={},
+    )
+
+def count_clients(emulator, logins, shared):
+    session = botocore.session.Session()
+    if shared:
+        registry = ClientRegistry(session)
+        client_creator = registry.create_client
+    else:
+        client_creator = session.create_client
+    created = []
+    def counting_client_creator(*args, **kwargs):
+        client = client_creator(*args, **kwargs)
+        if all(client is not other for other in created):
+            created.append(client)
+        return client
+    barrier = threading.Barrier(logins)
+    def login(i):
+        # a fetcher per login, as when several instances in a new region
+        # are refreshed at once right after a reload
+        fetcher = get_fetcher(counting_client_creator, emulator.endpoint_url)
+        barrier.wait()
+        fetcher.fetch_token('https://instance-{}.awsapps.com/start'.format(i))
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(created)
+
+def run(repeat=5, logins=16):
+    results = {}
+    with SSOEmulator() as emulator:
+        fetchers = []
+        def setup(prewarm):
+            # a new session each time, so the first client pays the full cost
+            registry = ClientRegistry(botocore.session.Session())
+            fetchers[:] = [get_fetcher(registry.create_client, emulator.endpoint_url)]
+            if prewarm:
+                fetchers[0].prewarm().join()
+        login = lambda: fetchers[0].fetch_token('https://instance.awsapps.com/start')
+        results['first_login_cold'] = measure(login, repeat=repeat, setup=lambda: setup(False))
+        results['first_login_prewarmed'] = measure(login, repeat=repeat, setup=lambda: setup(True))
+        results['clients_created_direct'] = count_clients(emulator, logins, shared=False)
+        results['clients_created_shared'] = count_clients(emulator, logins, shared=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--logins', type=int, default=16)
+    args = parser.parse_args()
+
+    for name, result in run(repeat=args.repeat, logins=args.logins).items():
+        if isinstance(result, dict):
+            print(format_result(name, result))
+        else:
+            print('{:<40} {}'.format(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
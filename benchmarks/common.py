@@ -0,0 +1,105 @@
+import os
+import time
+import shutil
+import tempfile
+import contextlib
+import statistics
+
+def generate_config(num_profiles, num_sso_instances=None, extra_lines=3):
+    """Generate the contents of a config file with SSO profiles.
+
+    Profiles are spread across ``num_sso_instances`` start URLs, with a few
+    non-SSO settings each, and a nested s3 block every so often so that
+    parsers have to deal with continuation lines."""
+    if num_sso_instances is None:
+        num_sso_instances = max(1, num_profiles // 50)
+    lines = ['[default]\n', 'region = us-east-1\n', '\n']
+    for i in range(num_profiles):
+        instance = i % num_sso_instances
+        lines.append('[profile profile-{}]\n'.format(i))
+        lines.append('sso_start_url = {}\n'.format(get_start_url(instance)))
+        lines.append('sso_region = us-east-1\n')
+        lines.append('sso_account_id = {:012d}\n'.format(i))
+        lines.append('sso_role_name = Role{}\n'.format(i % 7))
+        for j in range(extra_lines):
+            lines.append('setting_{} = value_{}\n'.format(j, j))
+        if i % 10 == 0:
+            lines.append('s3 =\n')
+            lines.append('    max_concurrent_requests = 20\n')
+            lines.append('    sso_region = not-a-profile-setting\n')
+        lines.append('\n')
+    return ''.join(lines)
+
+@contextlib.contextmanager
+def temp_home():
+    """A temporary directory laid out like a home directory with ~/.aws."""
+    home_dir = tempfile.mkdtemp(prefix='aws-sso-login-gui-bench-')
+    try:
+        os.makedirs(os.path.join(home_dir, '.aws', 'sso', 'cache'))
+        yield home_dir
+    finally:
+        shutil.rmtree(home_dir, ignore_errors=True)
+
+def write_config(home_dir, contents, name='config'):
+    path = os.path.join(home_dir, '.aws', name)
+    with open(path, 'w') as f:
+        f.write(contents)
+    return path
+
+def measure(fn, repeat=5, setup=None):
+    """Run fn repeat times, returning timing stats in seconds."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+        'max': max(times),
+    }
+
+def format_result(name, result):
+    return '{:<40} min {:9.3f} ms   median {:9.3f} ms'.format(
+        name, result['min'] * 1000, result['median'] * 1000)
+
+def get_qt_app(widgets=False):
+    """Get the Qt application, creating it if needed.
+
+    Only one can exist per process, so if any benchmark in a run needs
+    widgets, the first one created has to be a QApplication."""
+    from PyQt5 import QtCore
+    app = QtCore.QCoreApplication.instance()
+    if widgets:
+        from PyQt5 import QtWidgets
+        if app is None:
+            os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+            app = QtWidgets.QApplication([])
+        elif not isinstance(app, QtWidgets.QApplication):
+            raise RuntimeError("A QCoreApplication already exists; widgets need a QApplication")
+    elif app is None:
+        app = QtCore.QCoreApplication([])
+    return app
+
+def get_start_url(i):
+    return 'https://instance-{}.awsapps.com/start'.format(i)
+
+def write_tokens(home_dir, start_urls, expires_in=8 * 3600):
+    """Write token cache entries for the start URLs, like a login would."""
+    import json
+    import hashlib
+    token_dir = os.path.join(home_dir, '.aws', 'sso', 'cache')
+    expires_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + expires_in))
+    for start_url in start_urls:
+        cache_key = hashlib.sha1(start_url.encode('utf-8')).hexdigest()
+        with open(os.path.join(token_dir, cache_key + '.json'), 'w') as f:
+            json.dump({
+                'startUrl': start_url,
+                'region': 'us-east-1',
+                'accessToken': 'token',
+                'expiresAt': expires_at,
+            }, f)
+    return token_dir
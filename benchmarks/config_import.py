@@ -0,0 +1,101 @@
+"""Compare importing profiles one at a time with the batch config writer.
+
+Also times Config.import_config, which reads the file to import, writes
+the profiles and reloads.
+"""
+import os
+import sys
+import argparse
+
+from aws_sso_login_gui import fakes
+from aws_sso_login_gui.config import Config
+from aws_sso_login_gui.config_file_writer import write_values, write_profiles
+from aws_sso_login_gui.profile_scanner import ProfileScanner
+
+from .common import generate_config, temp_home, write_config, measure, format_result, get_qt_app
+
+class FileSession(object):
+    """Stands in for a botocore session, which the writer only uses for paths."""
+    def __init__(self, home_dir):
+        self._vars = {
+            'config_file': os.path.join(home_dir, '.aws', 'config'),
+            'credentials_file': os.path.join(home_dir, '.aws', 'credentials'),
+        }
+
+    def get_config_variable(self, name):
+        return self._vars[name]
+
+def generate_import(num_profiles):
+    return {
+        'imported-{}'.format(i): {
+            'sso_start_url': 'https://imported.awsapps.com/start',
+            'sso_region': 'us-west-2',
+            'sso_account_id': '{:012d}'.format(i),
+            'sso_role_name': 'Imported',
+        }
+        for i in range(num_profiles)
+    }
+
+def import_one_at_a_time(session, profiles):
+    for profile_name, values in profiles.items():
+        write_values(session, profile_name, values)
+
+def import_batch(session, profiles):
+    write_profiles(session, profiles)
+
+def write_import_file(home_dir, profiles):
+    path = os.path.join(home_dir, 'import.ini')
+    with open(path, 'w') as f:
+        for profile_name, values in profiles.items():
+            f.write('[profile {}]\n'.format(profile_name))
+            for key, value in values.items():
+                f.write('{} = {}\n'.format(key, value))
+    return path
+
+def run(existing_profiles=5000, import_sizes=(10, 100, 1000), repeat=3, max_sequential=1000):
+    app = get_qt_app()
+    results = {}
+    with temp_home() as home_dir:
+        session = FileSession(home_dir)
+        contents = generate_config(existing_profiles)
+        def reset():
+            write_config(home_dir, contents)
+        scanner = ProfileScanner()
+        config = Config(lambda: scanner.scan(session.get_config_variable('config_file')),
+            fakes.get_token_fetcher_creator(on_pending_authorization=lambda **kwargs: None),
+            session_fetcher=lambda: session)
+        for num_profiles in import_sizes:
+            profiles = generate_import(num_profiles)
+            if num_profiles <= max_sequential:
+                results['sequential_{}'.format(num_profiles)] = measure(
+                    lambda: import_one_at_a_time(session, profiles), repeat=repeat, setup=reset)
+            results['batch_{}'.format(num_profiles)] = measure(
+                lambda: import_batch(session, profiles), repeat=repeat, setup=reset)
+            import_file = write_import_file(home_dir, profiles)
+            def reset_and_reload():
+                reset()
+                config.reload()
+            results['import_config_{}'.format(num_profiles)] = measure(
+                lambda: config.import_config(import_file), repeat=repeat, setup=reset_and_reload)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--existing-profiles', type=int, default=5000)
+    parser.add_argument('--imports', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-sequential', type=int, default=1000,
+        help="skip the one-at-a-time import above this many profiles")
+    args = parser.parse_args()
+
+    results = run(
+        existing_profiles=args.existing_profiles,
+        import_sizes=args.imports,
+        repeat=args.repeat,
+        max_sequential=args.max_sequential)
+    print('importing into a config with {} profiles'.format(args.existing_profiles))
+    for name, result in results.items():
+        print(format_result(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
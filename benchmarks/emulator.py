@@ -0,0 +1,336 @@
+"""A local stand-in for the sso-oidc and sso (portal) APIs.
+
+Unlike the app's FakeTokenFetcher, which replaces SSOTokenFetcher
+wholesale, this lets the real fetcher run: botocore clients are pointed at
+it with ``endpoint_url``, and it speaks the same rest-json protocol as the real
+services, including the AuthorizationPending, SlowDown, and ExpiredToken
+errors of the device flow.
+
+Logins are approved by a scripted user. By default each one is approved
+``approval_delay`` seconds after it's started; with an approval delay of
+None, nothing is approved until approve() is called with its user code.
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+import collections
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LOGGER = logging.getLogger("emulator")
+
+class SSOEmulator(object):
+    def __init__(self,
+            host='127.0.0.1', port=0,
+            latency=0,
+            approval_delay=0,
+            interval=1,
+            pending_rate=0,
+            slow_down_rate=0,
+            expired_rate=0,
+            authorization_lifetime=600,
+            token_lifetime=8 * 3600,
+            role_credentials_lifetime=3600,
+            issue_refresh_tokens=True,
+            time_fetcher=None,
+            rng=None):
+        self._host = host
+        self._port = port
+        self.latency = latency
+        self.approval_delay = approval_delay
+        self.interval = interval
+        # chances of a create_token call for an approved login still being
+        # told to wait, being told to slow down, or of a login expiring
+        self.pending_rate = pending_rate
+        self.slow_down_rate = slow_down_rate
+        self.expired_rate = expired_rate
+        self.authorization_lifetime = authorization_lifetime
+        self.token_lifetime = token_lifetime
+        self.role_credentials_lifetime = role_credentials_lifetime
+        self.issue_refresh_tokens = issue_refresh_tokens
+
+        if time_fetcher is None:
+            time_fetcher = time.time
+        self._time_fetcher = time_fetcher
+
+        if rng is None:
+            rng = random.Random()
+        self._rng = rng
+
+        self._lock = threading.Lock()
+        self._clients = {}
+        # device code -> authorization
+        self._authorizations = {}
+        self._user_codes = {}
+        self._access_tokens = set()
+        self._refresh_tokens = {}
+
+        self.counts = collections.Counter()
+
+        self._server = None
+        self._thread = None
+
+        self.logger = LOGGER.getChild("SSOEmulator")
+
+    @property
+    def endpoint_url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        emulator = self
+        class Handler(_Handler):
+            pass
+        Handler.emulator = emulator
+        self._server = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._server.daemon_threads = True
+        # lots of clients connect at once in load tests
+        self._server.request_queue_size = 1024
+        self._thread = threading.Thread(target=self._server.serve_forever,
+            name='sso-emulator', daemon=True)
+        self._thread.start()
+        self.logger.debug("Listening on %s", self.endpoint_url)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def approve(self, user_code):
+        """Approve a pending login, as the user would in the browser."""
+        with self._lock:
+            authorization = self._user_codes.get(user_code)
+            if authorization is None:
+                raise KeyError(user_code)
+            authorization['approved'] = True
+
+    def pending_user_codes(self):
+        with self._lock:
+            return [code for code, auth in self._user_codes.items() if not auth['approved']]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def handle(self, method, path, query, headers, body):
+        """Returns (status, body, headers)."""
+        if self.latency:
+            time.sleep(self.latency)
+        routes = {
+            ('POST', '/client/register'): self._register_client,
+            ('POST', '/device_authorization'): self._start_device_authorization,
+            ('POST', '/token'): self._create_token,
+            ('GET', '/federation/credentials'): self._get_role_credentials,
+        }
+        route = routes.get((method, path))
+        if route is None:
+            return _error(404, 'ResourceNotFoundException', 'No route for {} {}'.format(method, path))
+        self._count(route.__name__.lstrip('_'))
+        try:
+            return 200, route(query, headers, body), {}
+        except _APIError as e:
+            self._count(e.code)
+            return _error(e.status, e.code, e.message)
+
+    def _register_client(self, query, headers, body):
+        client_id = 'client-' + uuid.uuid4().hex
+        client_secret = uuid.uuid4().hex
+        now = int(self._time_fetcher())
+        with self._lock:
+            self._clients[client_id] = {
+                'secret': client_secret,
+                'scopes': body.get('scopes'),
+            }
+        return {
+            'clientId': client_id,
+            'clientSecret': client_secret,
+            'clientIdIssuedAt': now,
+            'clientSecretExpiresAt': now + 90 * 24 * 3600,
+        }
+
+    def _check_client(self, body):
+        client = self._clients.get(body.get('clientId'))
+        if client is None or client['secret'] != body.get('clientSecret'):
+            raise _APIError(400, 'InvalidClientException', 'invalid_client')
+        return client
+
+    def _start_device_authorization(self, query, headers, body):
+        now = self._time_fetcher()
+        device_code = uuid.uuid4().hex
+        with self._lock:
+            self._check_client(body)
+            user_code = '{:04X}-{:04X}'.format(self._rng.getrandbits(16), self._rng.getrandbits(16))
+            authorization = {
+                'deviceCode': device_code,
+                'userCode': user_code,
+                'clientId': body['clientId'],
+                'startUrl': body.get('startUrl'),
+                'createdAt': now,
+                'expiresAt': now + self.authorization_lifetime,
+                'approved': False,
+                'expired': self._rng.random() < self.expired_rate,
+            }
+            self._authorizations[device_code] = authorization
+            self._user_codes[user_code] = authorization
+        return {
+            'deviceCode': device_code,
+            'userCode': user_code,
+            'verificationUri': 'https://device.sso.example.com/',
+            'verificationUriComplete': 'https://device.sso.example.com/?user_code=' + user_code,
+            'expiresIn': self.authorization_lifetime,
+            'interval': self.interval,
+        }
+
+    def _issue_token(self, client, client_id, refresh_token=None):
+        access_token = 'access-' + uuid.uuid4().hex
+        response = {
+            'accessToken': access_token,
+            'tokenType': 'Bearer',
+            'expiresIn': self.token_lifetime,
+        }
+        self._access_tokens.add(access_token)
+        if self.issue_refresh_tokens and client['scopes']:
+            if refresh_token is None:
+                refresh_token = 'refresh-' + uuid.uuid4().hex
+            self._refresh_tokens[refresh_token] = client_id
+            response['refreshToken'] = refresh_token
+        return response
+
+    def _create_token(self, query, headers, body):
+        now = self._time_fetcher()
+        with self._lock:
+            client = self._check_client(body)
+            grant_type = body.get('grantType')
+            if grant_type == 'refresh_token':
+                refresh_token = body.get('refreshToken')
+                if self._refresh_tokens.get(refresh_token) != body['clientId']:
+                    raise _APIError(400, 'InvalidGrantException', 'invalid_grant')
+                self.counts['token_refreshed'] += 1
+                return self._issue_token(client, body['clientId'], refresh_token=refresh_token)
+            authorization = self._authorizations.get(body.get('deviceCode'))
+            if authorization is None or authorization['clientId'] != body['clientId']:
+                raise _APIError(400, 'InvalidGrantException', 'invalid_grant')
+            if authorization['expired'] or now >= authorization['expiresAt']:
+                raise _APIError(400, 'ExpiredTokenException', 'expired_token')
+            approved = authorization['approved'] or (self.approval_delay is not None
+                and now >= authorization['createdAt'] + self.approval_delay)
+            if not approved or self._rng.random() < self.pending_rate:
+                if self._rng.random() < self.slow_down_rate:
+                    raise _APIError(400, 'SlowDownException', 'slow_down')
+                raise _APIError(400, 'AuthorizationPendingException', 'authorization_pending')
+            # device codes can only be exchanged once
+            del self._authorizations[body['deviceCode']]
+            self._user_codes.pop(authorization['userCode'], None)
+            self.counts['token_issued'] += 1
+            return self._issue_token(client, body['clientId'])
+
+    def _get_role_credentials(self, query, headers, body):
+        access_token = headers.get('x-amz-sso_bearer_token')
+        with self._lock:
+            if access_token not in self._access_tokens:
+                raise _APIError(401, 'UnauthorizedException', 'Session token not found or invalid')
+        expiration = int((self._time_fetcher() + self.role_credentials_lifetime) * 1000)
+        return {
+            'roleCredentials': {
+                'accessKeyId': 'ASIA' + uuid.uuid4().hex[:16].upper(),
+                'secretAccessKey': uuid.uuid4().hex,
+                'sessionToken': uuid.uuid4().hex,
+                'expiration': expiration,
+            }
+        }
+
+class _APIError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+def _error(status, code, message):
+    headers = {'x-amzn-ErrorType': code}
+    body = {'error': message, 'error_description': message, 'message': message}
+    return status, body, headers
+
+class _Handler(BaseHTTPRequestHandler):
+    emulator = None
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = {}
+        if length:
+            body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        status, response_body, response_headers = self.emulator.handle(method, url.path, query, headers, body)
+        data = json.dumps(response_body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args)
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.emulator', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, metavar='SECONDS')
+    parser.add_argument('--approval-delay', type=float, default=5, metavar='SECONDS')
+    parser.add_argument('--interval', type=int, default=1, metavar='SECONDS')
+    parser.add_argument('--pending-rate', type=float, default=0)
+    parser.add_argument('--slow-down-rate', type=float, default=0)
+    parser.add_argument('--expired-rate', type=float, default=0)
+    parser.add_argument('--token-lifetime', type=int, default=8 * 3600, metavar='SECONDS')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    emulator = SSOEmulator(port=args.port,
+        latency=args.latency,
+        approval_delay=args.approval_delay,
+        interval=args.interval,
+        pending_rate=args.pending_rate,
+        slow_down_rate=args.slow_down_rate,
+        expired_rate=args.expired_rate,
+        token_lifetime=args.token_lifetime)
+    with emulator:
+        LOGGER.info("Listening on %s", emulator.endpoint_url)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Compare loading SSO profiles through a botocore session with ProfileScanner."""
+import os
+import sys
+import argparse
+
+import botocore.session
+
+from aws_sso_login_gui.profile_scanner import ProfileScanner
+
+from .common import generate_config, temp_home, write_config, measure, format_result
+
+def load_with_session(config_file):
+    session = botocore.session.Session(session_vars={
+        'config_file': (None, None, config_file, None),
+        'credentials_file': (None, None, config_file + '-missing', None),
+    })
+    return session.full_config['profiles']
+
+def run(num_profiles=5000, repeat=5):
+    results = {}
+    with temp_home() as home_dir:
+        config_file = write_config(home_dir, generate_config(num_profiles))
+
+        profiles = load_with_session(config_file)
+        scanned = ProfileScanner().scan(config_file)
+        # sanity check that the scanner agrees with botocore
+        for name, values in profiles.items():
+            expected = {k: v for k, v in values.items() if k.startswith('sso_')}
+            if scanned.get(name) != expected:
+                raise AssertionError("Mismatch for profile {}: {} != {}".format(name, scanned.get(name), expected))
+
+        results['botocore_session'] = measure(lambda: load_with_session(config_file), repeat=repeat)
+
+        scanner = ProfileScanner()
+        results['scanner_cold'] = measure(lambda: scanner.scan(config_file), repeat=repeat, setup=scanner.invalidate)
+
+        scanner.scan(config_file)
+        results['scanner_warm'] = measure(lambda: scanner.scan(config_file), repeat=repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--profiles', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(num_profiles=args.profiles, repeat=args.repeat)
+    print('{} profiles'.format(args.profiles))
+    for name, result in results.items():
+        print(format_result(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
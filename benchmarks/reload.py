@@ -0,0 +1,45 @@
+"""Benchmark Config.reload over synthetic configs of different sizes."""
+import sys
+import argparse
+
+from aws_sso_login_gui import fakes
+from aws_sso_login_gui.config import Config
+from aws_sso_login_gui.profile_scanner import ProfileScanner
+
+from .common import generate_config, temp_home, write_config, measure, format_result, get_qt_app
+
+def create_config(config_file):
+    scanner = ProfileScanner()
+    token_fetcher_creator = fakes.get_token_fetcher_creator(on_pending_authorization=lambda **kwargs: None)
+    return Config(lambda: scanner.scan(config_file), token_fetcher_creator)
+
+def run(sizes=(10, 100, 1000, 10000), repeat=5):
+    app = get_qt_app()
+    results = {}
+    with temp_home() as home_dir:
+        for num_profiles in sizes:
+            # about 50 profiles per SSO instance
+            config_file = write_config(home_dir, generate_config(num_profiles))
+
+            configs = []
+            def setup():
+                configs[:] = [create_config(config_file)]
+            results['reload_initial_{}'.format(num_profiles)] = measure(
+                lambda: configs[0].reload(), repeat=repeat, setup=setup)
+
+            config = create_config(config_file)
+            config.reload()
+            results['reload_unchanged_{}'.format(num_profiles)] = measure(config.reload, repeat=repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, result in run(sizes=args.sizes, repeat=args.repeat).items():
+        print(format_result(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Benchmark the time to exit with logins in progress.
+
+Runs a Config on a worker thread with the real token fetcher against the
+local SSO emulator, with nobody approving the logins. Once a device flow is
+pending for every instance, it times stopping the worker thread the way the
+app does when it quits. It also checks that the token cache has no partial
+or leftover temporary files afterwards.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import types
+import logging
+import argparse
+import statistics
+
+import botocore.session
+from PyQt5 import QtCore
+
+from aws_sso_login_gui import token_fetcher
+from aws_sso_login_gui.app import stop_worker_thread
+from aws_sso_login_gui.async_token_fetcher import AsyncLoop
+from aws_sso_login_gui.config import Config
+from .emulator import SSOEmulator
+from aws_sso_login_gui.metrics import MetricsRegistry
+from aws_sso_login_gui.profile_scanner import ProfileScanner
+
+from .common import generate_config, temp_home, write_config, get_qt_app
+from .token_fetcher import get_client_creator
+
+def check_token_cache(token_dir):
+    """Returns the number of temp files and of unreadable cache files."""
+    temp_files = glob.glob(os.path.join(token_dir, '.*.tmp')) + glob.glob(os.path.join(token_dir, '*.tmp'))
+    corrupt = 0
+    for path in glob.glob(os.path.join(token_dir, '*.json')):
+        try:
+            with open(path) as f:
+                json.load(f)
+        except ValueError:
+            corrupt += 1
+    return len(temp_files), corrupt
+
+def time_shutdown(instances, interval, async_fetcher, timeout):
+    with SSOEmulator(approval_delay=None, interval=interval) as emulator, temp_home() as home_dir:
+        config_file = write_config(home_dir, generate_config(instances, instances))
+        session = types.SimpleNamespace(create_client=get_client_creator(
+            botocore.session.Session(), emulator.endpoint_url, instances))
+        loop = AsyncLoop().start() if async_fetcher else None
+        token_fetcher_creator = token_fetcher.get_token_fetcher_creator(session,
+            on_pending_authorization=lambda **kwargs: None, home_dir=home_dir, loop=loop)
+        scanner = ProfileScanner()
+        config = Config(lambda: scanner.scan(config_file), token_fetcher_creator,
+            max_refresh_workers=instances, proactive_renewal=False, metrics=MetricsRegistry())
+        thread = QtCore.QThread()
+        config.moveToThread(thread)
+        thread.started.connect(config.reload)
+        thread.start()
+        for i in range(instances):
+            QtCore.QMetaObject.invokeMethod(config, 'refresh', QtCore.Qt.QueuedConnection,
+                QtCore.Q_ARG(str, 'instance-{}'.format(i)))
+        deadline = time.monotonic() + 30
+        while len(emulator.pending_user_codes()) < instances:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Logins didn't start")
+            time.sleep(0.01)
+
+        start = time.perf_counter()
+        finished = stop_worker_thread(config, thread, timeout=timeout)
+        if loop:
+            finished = loop.stop(timeout=1) and finished
+        elapsed = time.perf_counter() - start
+
+        temp_files, corrupt = check_token_cache(token_fetcher.get_token_dir(home_dir))
+        return elapsed, finished, temp_files, corrupt
+
+def run(sizes=(1, 10, 50), interval=5, repeat=3, timeout=5):
+    # importing the app module turns on debug logging
+    logging.getLogger().setLevel(logging.WARNING)
+    app = get_qt_app()
+    results = {}
+    for async_fetcher in [False, True]:
+        for instances in sizes:
+            times = []
+            clean = True
+            for _ in range(repeat):
+                elapsed, finished, temp_files, corrupt = time_shutdown(instances, interval, async_fetcher, timeout)
+                times.append(elapsed)
+                clean = clean and finished and not temp_files and not corrupt
+            name = 'shutdown_{}{}'.format('async_' if async_fetcher else '', instances)
+            results[name] = {
+                'repeat': repeat,
+                'min': min(times),
+                'median': statistics.median(times),
+                'max': max(times),
+                'clean': clean,
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--interval', type=int, default=5, metavar='SECONDS',
+        help='the polling interval the emulator asks for')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=5, metavar='SECONDS')
+    args = parser.parse_args()
+
+    results = run(sizes=args.sizes, interval=args.interval, repeat=args.repeat, timeout=args.timeout)
+    for name, result in results.items():
+        print('{:<40} min {:9.3f} ms   median {:9.3f} ms   clean {}'.format(
+            name, result['min'] * 1000, result['median'] * 1000, result['clean']))
+
+if __name__ == '__main__':
+    sys.exit(main())
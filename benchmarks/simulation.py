@@ -0,0 +1,487 @@
+"""A discrete-event simulation of token lifecycles on a virtual clock.
+
+This runs days of logins, proactive renewals, failures and reloads across
+thousands of SSO instances in seconds, to tune the expiry window and the
+renewal policy offline. It drives the real Config, and through it the real
+SSOInstances and SSOTokenFetcher, against a simulated sso-oidc client, with
+their time_fetcher set to the virtual clock. Nothing runs the Qt event
+loop: the clock is moved from one due deadline or simulated event to the
+next, and the timers are fired with Config.update_timers().
+
+Refreshes go through a synchronous stand-in for RefreshEngine. Each fetch
+is run to completion when it starts, with the fetcher's polling sleeps
+advancing the clock, which is then set back; its result is delivered at
+the virtual time it finished. Instances only share the client
+registration, so running fetches eagerly doesn't change the outcome.
+"""
+import sys
+import json
+import time
+import heapq
+import random
+import logging
+import argparse
+import datetime
+import functools
+import itertools
+import collections
+
+from botocore.utils import tzutc
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from aws_sso_login_gui.config import Config, STATUS_EXPIRED, STATUS_REFRESH_FAILED
+from aws_sso_login_gui.refresh import RENEW, REFRESH
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, RenewalUnavailableError
+from aws_sso_login_gui.metrics import MetricsRegistry
+
+from .common import get_qt_app
+class VirtualClock(object):
+    def __init__(self, now):
+        self._now = now
+
+    def now(self):
+        return self._now
+
+    def set(self, now):
+        self._now = now
+
+    def sleep(self, seconds):
+        self._now += datetime.timedelta(seconds=seconds)
+
+class SimulationParameters(object):
+    """The knobs of a simulation. Times are in seconds."""
+    def __init__(self,
+            instances=1000,
+            duration=7 * 24 * 3600,
+            token_lifetime=8 * 3600,
+            expiry_window=SSOTokenFetcher._EXPIRY_WINDOW,
+            proactive_renewal=True,
+            renewal_lead_time=None,
+            renewal_jitter=2 * 60,
+            min_renewal_interval=60,
+            reload_interval=3600,
+            poll_interval=5,
+            authorization_lifetime=600,
+            user_response_mean=60,
+            user_login_delay_mean=30 * 60,
+            refresh_failure_rate=0.01,
+            network_failure_rate=0.001,
+            slow_down_rate=0.0,
+            issue_refresh_tokens=True,
+            seed=0):
+        self.instances = instances
+        self.duration = duration
+        self.token_lifetime = token_lifetime
+        self.expiry_window = expiry_window
+        self.proactive_renewal = proactive_renewal
+        self.renewal_lead_time = renewal_lead_time
+        self.renewal_jitter = renewal_jitter
+        self.min_renewal_interval = min_renewal_interval
+        self.reload_interval = reload_interval
+        self.poll_interval = poll_interval
+        self.authorization_lifetime = authorization_lifetime
+        # how long the user takes to approve a login in the browser
+        self.user_response_mean = user_response_mean
+        # how long the user takes to notice an expired instance and log in
+        self.user_login_delay_mean = user_login_delay_mean
+        self.refresh_failure_rate = refresh_failure_rate
+        self.network_failure_rate = network_failure_rate
+        self.slow_down_rate = slow_down_rate
+        self.issue_refresh_tokens = issue_refresh_tokens
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+class SimulatedOIDCClient(object):
+    """Stands in for an sso-oidc client, on the virtual clock."""
+    class exceptions(object):
+        class SlowDownException(Exception):
+            pass
+        class AuthorizationPendingException(Exception):
+            pass
+        class ExpiredTokenException(Exception):
+            pass
+
+    def __init__(self, clock, params, rng, counters):
+        self._clock = clock
+        self._params = params
+        self._rng = rng
+        self._counters = counters
+        self._pending = {}
+        self._ids = itertools.count()
+
+    def _timestamp(self):
+        return self._clock.now().timestamp()
+
+    def _maybe_fail(self):
+        if self._rng.random() < self._params.network_failure_rate:
+            self._counters['network_failures'] += 1
+            raise EndpointConnectionError(endpoint_url='https://oidc.simulated')
+
+    def register_client(self, **kwargs):
+        self._counters['registrations'] += 1
+        return {
+            'clientId': 'client',
+            'clientSecret': 'secret',
+            'clientSecretExpiresAt': int(self._timestamp()) + 90 * 24 * 3600,
+        }
+
+    def start_device_authorization(self, **kwargs):
+        self._maybe_fail()
+        self._counters['device_authorizations'] += 1
+        device_code = str(next(self._ids))
+        now = self._timestamp()
+        approve_at = now + self._rng.expovariate(1 / self._params.user_response_mean)
+        self._pending[device_code] = (approve_at, now + self._params.authorization_lifetime)
+        return {
+            'deviceCode': device_code,
+            'userCode': 'user-code',
+            'verificationUri': 'https://device.simulated',
+            'verificationUriComplete': 'https://device.simulated/?user_code=user-code',
+            'expiresIn': self._params.authorization_lifetime,
+            'interval': self._params.poll_interval,
+        }
+
+    def _token_response(self):
+        response = {
+            'accessToken': 'access-{}'.format(next(self._ids)),
+            'expiresIn': self._params.token_lifetime,
+        }
+        if self._params.issue_refresh_tokens:
+            response['refreshToken'] = 'refresh'
+        return response
+
+    def create_token(self, grantType, deviceCode=None, **kwargs):
+        self._maybe_fail()
+        if grantType == SSOTokenFetcher._REFRESH_GRANT_TYPE:
+            self._counters['refresh_grants'] += 1
+            if self._rng.random() < self._params.refresh_failure_rate:
+                self._counters['refresh_grant_failures'] += 1
+                raise ClientError({'Error': {'Code': 'InvalidGrantException', 'Message': 'invalid_grant'}}, 'CreateToken')
+            return self._token_response()
+        self._counters['polls'] += 1
+        approve_at, expires_at = self._pending[deviceCode]
+        now = self._timestamp()
+        if now >= expires_at:
+            del self._pending[deviceCode]
+            raise self.exceptions.ExpiredTokenException()
+        if now < approve_at:
+            if self._rng.random() < self._params.slow_down_rate:
+                self._counters['slow_downs'] += 1
+                raise self.exceptions.SlowDownException()
+            raise self.exceptions.AuthorizationPendingException()
+        del self._pending[deviceCode]
+        return self._token_response()
+
+class SimulatedRefreshEngine(QObject):
+    """Stands in for RefreshEngine, running fetches on the virtual clock."""
+    finished = pyqtSignal(str)
+
+    def __init__(self, clock, schedule, counters):
+        super().__init__()
+        self._clock = clock
+        self._schedule = schedule
+        self._counters = counters
+        self._in_flight = {}
+
+        self.max_concurrent_fetches = 0
+        self._recent_starts = collections.deque()
+        self.max_fetch_starts_per_minute = 0
+        self.fetch_durations = []
+
+    def is_refreshing(self, sso_id):
+        return sso_id in self._in_flight
+
+    def submit(self, sso_id, fn, callback=None, strength=REFRESH):
+        if sso_id in self._in_flight:
+            # the simulated user only clicks on expired instances, so there's
+            # never a stronger request to follow up with
+            if callback:
+                self._in_flight[sso_id].append(callback)
+            return
+        self._in_flight[sso_id] = [callback] if callback else []
+        start = self._clock.now()
+        self._record_start(start)
+        if strength == RENEW:
+            self._counters['renewals'] += 1
+        try:
+            result, exception = fn(), None
+        except Exception as e:
+            result, exception = None, e
+        finished = max(self._clock.now(), start)
+        self._clock.set(start)
+        self.fetch_durations.append((finished - start).total_seconds())
+        self._schedule(finished, functools.partial(self._deliver, sso_id, result, exception))
+
+    def _record_start(self, now):
+        self._counters['fetches'] += 1
+        self.max_concurrent_fetches = max(self.max_concurrent_fetches, len(self._in_flight))
+        self._recent_starts.append(now)
+        minute_ago = now - datetime.timedelta(minutes=1)
+        while self._recent_starts[0] <= minute_ago:
+            self._recent_starts.popleft()
+        self.max_fetch_starts_per_minute = max(self.max_fetch_starts_per_minute, len(self._recent_starts))
+
+    def _deliver(self, sso_id, result, exception):
+        if isinstance(exception, RenewalUnavailableError):
+            self._counters['renewals_unavailable'] += 1
+        elif exception:
+            self._counters['fetch_failures'] += 1
+        for callback in self._in_flight.pop(sso_id):
+            callback(result, exception)
+        self.finished.emit(sso_id)
+
+class Simulation(object):
+    START_TIME = datetime.datetime(2020, 1, 1, tzinfo=tzutc())
+    REGION = 'us-east-1'
+
+    def __init__(self, params=None):
+        if params is None:
+            params = SimulationParameters()
+        self.params = params
+        self._rng = random.Random(params.seed)
+        self.counters = collections.Counter()
+        # kept apart from the app's metrics
+        self.metrics = MetricsRegistry()
+
+        # the schedulers' timers need an application, though its event loop
+        # is never run
+        self._app = get_qt_app()
+
+        self._clock = VirtualClock(self.START_TIME)
+        self._end = self.START_TIME + datetime.timedelta(seconds=params.duration)
+        self._events = []
+        self._seq = itertools.count()
+
+        self._cache = {}
+        client = SimulatedOIDCClient(self._clock, params, self._rng, self.counters)
+        self._fetcher = SSOTokenFetcher(
+            sso_region=self.REGION,
+            client_creator=lambda *args, **kwargs: client,
+            cache=self._cache,
+            time_fetcher=self._clock.now,
+            sleep=self._clock.sleep,
+            metrics=self.metrics,
+        )
+        self._fetcher._EXPIRY_WINDOW = params.expiry_window
+        self.engine = SimulatedRefreshEngine(self._clock, self._push, self.counters)
+
+        self._profiles = {
+            'profile-{}'.format(i): {
+                'sso_start_url': 'https://instance-{}.awsapps.com/start'.format(i),
+                'sso_region': self.REGION,
+            }
+            for i in range(params.instances)
+        }
+        lead_time = params.renewal_lead_time
+        if lead_time is not None:
+            lead_time = datetime.timedelta(seconds=lead_time)
+        self.config = Config(lambda: self._profiles, lambda region: self._fetcher,
+            time_fetcher=self._clock.now,
+            proactive_renewal=params.proactive_renewal,
+            renewal_lead_time=lead_time,
+            renewal_jitter=datetime.timedelta(seconds=params.renewal_jitter),
+            metrics=self.metrics,
+            refresh_engine=self.engine,
+            rng=self._rng)
+        self.config.MIN_RENEWAL_INTERVAL = datetime.timedelta(seconds=params.min_renewal_interval)
+        self.config.status_changed.connect(self._on_status_changed)
+        self.config.refresh_finished.connect(self._update_token)
+
+        # the user's clicks on instances they've noticed are expired
+        self._pending_clicks = set()
+        # (refresh deadline, expiration, since) of each instance's token
+        self._tokens = {}
+        self.window_seconds = 0.0
+        self.unusable_seconds = 0.0
+
+    def _push(self, when, fn):
+        heapq.heappush(self._events, (when, next(self._seq), fn))
+
+    def _seed_tokens(self):
+        # Start in a steady state, with tokens of random ages, rather than
+        # with everyone logging in at once.
+        now = self._clock.now()
+        lifetime = datetime.timedelta(seconds=self.params.token_lifetime)
+        registration = self._fetcher._registration()
+        for profile in self._profiles.values():
+            start_url = profile['sso_start_url']
+            token = {
+                'startUrl': start_url,
+                'region': self.REGION,
+                'accessToken': 'seed',
+                'expiresAt': now + lifetime * self._rng.random(),
+            }
+            if self.params.issue_refresh_tokens:
+                token.update({
+                    'refreshToken': 'refresh',
+                    'clientId': registration['clientId'],
+                    'clientSecret': registration['clientSecret'],
+                    'registrationExpiresAt': registration['expiresAt'],
+                })
+            self._cache[self._fetcher.get_cache_key(start_url)] = token
+
+    def run(self):
+        start = time.perf_counter()
+        self._seed_tokens()
+        self.config.reload()
+        for sso_id in self.config.sso_instances:
+            self._update_token(sso_id)
+        if self.params.reload_interval:
+            self._push(self._after(self.params.reload_interval), self._on_reload)
+        while True:
+            when = self._next_event_time()
+            if when is None or when >= self._end:
+                break
+            if when > self._clock.now():
+                self._clock.set(when)
+            self.config.update_timers()
+            while self._events and self._events[0][0] <= self._clock.now():
+                _, _, fn = heapq.heappop(self._events)
+                self.counters['events'] += 1
+                fn()
+        self._clock.set(self._end)
+        for sso_id in list(self._tokens):
+            self._close_token(sso_id)
+        return self.results(time.perf_counter() - start)
+
+    def _after(self, seconds):
+        return self._clock.now() + datetime.timedelta(seconds=seconds)
+
+    def _next_event_time(self):
+        times = [self._events[0][0]] if self._events else []
+        deadline = self.config.next_deadline()
+        if deadline is not None:
+            times.append(deadline)
+        return min(times) if times else None
+
+    def _update_token(self, sso_id):
+        # account for the last token once it's been replaced
+        start_url = self.config.sso_instances[sso_id].start_url
+        expiration = self._fetcher.get_expiration(start_url)
+        token = self._tokens.get(sso_id)
+        if token is not None and token[1] == expiration:
+            return
+        self._close_token(sso_id)
+        if expiration is not None:
+            self._tokens[sso_id] = (self._fetcher.refresh_deadline(start_url), expiration, self._clock.now())
+
+    def _close_token(self, sso_id):
+        token = self._tokens.pop(sso_id, None)
+        if token is None:
+            return
+        deadline, expiration, since = token
+        now = self._clock.now()
+        self.window_seconds += max(0, (now - max(deadline, since)).total_seconds())
+        self.unusable_seconds += max(0, (now - max(expiration, since)).total_seconds())
+
+    def _on_status_changed(self, sso_id, status, expiration):
+        # the user gets to an instance that shows as needing a login after a
+        # while; it may have been renewed by then
+        if status in [STATUS_EXPIRED, STATUS_REFRESH_FAILED] and sso_id not in self._pending_clicks:
+            self._pending_clicks.add(sso_id)
+            delay = self._rng.expovariate(1 / self.params.user_login_delay_mean)
+            self._push(self._after(delay), functools.partial(self._on_user_click, sso_id))
+
+    def _on_user_click(self, sso_id):
+        self._pending_clicks.discard(sso_id)
+        if self.config.sso_instances[sso_id].get_status() not in [STATUS_EXPIRED, STATUS_REFRESH_FAILED]:
+            return
+        # this only turns into a login, a device flow, without a usable
+        # refresh token
+        self.counters['user_refreshes'] += 1
+        self.config.refresh(sso_id)
+
+    def _on_reload(self):
+        # a reload checks the status of every instance
+        self.config.reload()
+        self.counters['reloads'] += 1
+        self.counters['status_checks'] += len(self.config.sso_instances)
+        self._push(self._after(self.params.reload_interval), self._on_reload)
+
+    def results(self, wall_time=None):
+        instance_seconds = self.params.instances * self.params.duration
+        durations = sorted(self.engine.fetch_durations)
+        counters = dict(self.counters)
+        # each login by the user is a device flow; other fetches use the
+        # refresh token
+        counters['user_logins'] = counters.get('device_authorizations', 0)
+        return {
+            'parameters': self.params.to_dict(),
+            'wall_time': wall_time,
+            'counters': counters,
+            'expiry_window_fraction': self.window_seconds / instance_seconds,
+            'unusable_fraction': self.unusable_seconds / instance_seconds,
+            'unusable_hours': self.unusable_seconds / 3600,
+            'max_concurrent_fetches': self.engine.max_concurrent_fetches,
+            'max_fetch_starts_per_minute': self.engine.max_fetch_starts_per_minute,
+            'fetch_duration_median': durations[len(durations) // 2] if durations else None,
+            'fetch_duration_max': durations[-1] if durations else None,
+            'metrics': self.metrics.snapshot(),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.simulation', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=1000)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--token-lifetime', type=float, default=8, metavar='HOURS')
+    parser.add_argument('--expiry-window', type=float, default=SSOTokenFetcher._EXPIRY_WINDOW / 60, metavar='MINUTES')
+    parser.add_argument('--no-proactive-renewal', action='store_true')
+    parser.add_argument('--renewal-lead-time', type=float, metavar='MINUTES')
+    parser.add_argument('--renewal-jitter', type=float, default=2, metavar='MINUTES')
+    parser.add_argument('--user-login-delay', type=float, default=30, metavar='MINUTES',
+        help='mean time for the user to log in to an expired instance')
+    parser.add_argument('--user-response', type=float, default=1, metavar='MINUTES',
+        help='mean time for the user to approve a login in the browser')
+    parser.add_argument('--refresh-failure-rate', type=float, default=0.01)
+    parser.add_argument('--network-failure-rate', type=float, default=0.001)
+    parser.add_argument('--no-refresh-tokens', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    # the simulated failures would be logged as errors
+    logging.disable(logging.ERROR)
+
+    params = SimulationParameters(
+        instances=args.instances,
+        duration=args.days * 24 * 3600,
+        token_lifetime=args.token_lifetime * 3600,
+        expiry_window=args.expiry_window * 60,
+        proactive_renewal=not args.no_proactive_renewal,
+        renewal_lead_time=args.renewal_lead_time * 60 if args.renewal_lead_time is not None else None,
+        renewal_jitter=args.renewal_jitter * 60,
+        user_login_delay_mean=args.user_login_delay * 60,
+        user_response_mean=args.user_response * 60,
+        refresh_failure_rate=args.refresh_failure_rate,
+        network_failure_rate=args.network_failure_rate,
+        issue_refresh_tokens=not args.no_refresh_tokens,
+        seed=args.seed)
+    results = Simulation(params).run()
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    counters = results['counters']
+    print('{} instances over {} days, simulated in {:.2f} s'.format(args.instances, args.days, results['wall_time']))
+    print('fetches {fetches}, renewals {renewals}, user refreshes {user_refreshes}, failures {failures}'.format(
+        fetches=counters.get('fetches', 0),
+        renewals=counters.get('renewals', 0),
+        user_refreshes=counters.get('user_refreshes', 0),
+        failures=counters.get('fetch_failures', 0)))
+    print('refresh grants {}, user logins (device flows) {}, polls {}'.format(
+        counters.get('refresh_grants', 0),
+        counters.get('user_logins', 0),
+        counters.get('polls', 0)))
+    print('time in expiry window {:.3%}, time with an unusable token {:.3%} ({:.1f} instance-hours)'.format(
+        results['expiry_window_fraction'], results['unusable_fraction'], results['unusable_hours']))
+    print('max concurrent fetches {}, max fetch starts per minute {}'.format(
+        results['max_concurrent_fetches'], results['max_fetch_starts_per_minute']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Benchmark cold start of the app.
+
+Launches the app in a fresh process with --startup-profile, which exits once
+the first statuses are shown, and reads the time to each phase from its
+report: when the window is shown, when the statuses from the last run's
+snapshot are, and when the first real statuses (which need botocore,
+loaded on the worker thread) are. The budget is for showing the
+window, which shouldn't wait on anything slow.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from .common import generate_config, temp_home, write_config
+
+WINDOW_BUDGET = 0.25
+
+PHASES = {
+    'window_shown': 'show window and tray icon',
+    'snapshot_shown': 'snapshot shown',
+    'first_status': 'first status shown',
+}
+
+def parse_report(output):
+    times = {}
+    for line in output.splitlines():
+        parts = line.split(None, 3)
+        if len(parts) < 4:
+            continue
+        try:
+            total = float(parts[0]) / 1000
+        except ValueError:
+            continue
+        for name, phase in PHASES.items():
+            if parts[3].startswith(phase):
+                times[name] = total
+    return times
+
+def launch(home_dir, headless=False):
+    """Returns the phase times from the report, and the time until the process exited."""
+    command = [sys.executable, '-m', 'aws_sso_login_gui', '--home-dir', home_dir,
+        '--startup-profile', '--no-ipc', '--no-proactive-renewal', '--log-level', 'INFO']
+    if headless:
+        # nobody to log in, and no network to do it with
+        command.append('--test-token-fetcher')
+        command.append('--headless')
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen',
+        AWS_SSO_LOGIN_GUI_SOCKET=os.path.join(home_dir, 'socket'))
+    start = time.perf_counter()
+    process = subprocess.run(command, env=env, capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError("App exited with {}:\n{}".format(process.returncode, process.stderr))
+    times = parse_report(process.stderr)
+    times['process'] = elapsed
+    return times
+
+def run(instances=10, repeat=5):
+    results = {}
+    with temp_home() as home_dir:
+        write_config(home_dir, generate_config(instances, instances))
+        # so there's a snapshot from the last run to show
+        launch(home_dir)
+        for headless in [False, True]:
+            runs = [launch(home_dir, headless=headless) for _ in range(repeat)]
+            prefix = 'headless_' if headless else ''
+            for name in sorted(runs[0]):
+                times = [times[name] for times in runs]
+                results[prefix + name] = {
+                    'repeat': repeat,
+                    'min': min(times),
+                    'median': statistics.median(times),
+                    'max': max(times),
+                }
+        results['window_shown']['within_budget'] = results['window_shown']['median'] <= WINDOW_BUDGET
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--instances', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(instances=args.instances, repeat=args.repeat)
+    for name, result in results.items():
+        print('{:<40} min {:9.3f} ms   median {:9.3f} ms'.format(
+            name, result['min'] * 1000, result['median'] * 1000))
+    print('window shown within {:.0f} ms budget: {}'.format(
+        WINDOW_BUDGET * 1000, results['window_shown']['within_budget']))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Benchmark updating instance status with cold and warm token caches.
+
+Uses the real SSOTokenFetcher reading token files from a temporary cache
+directory. Cold runs drop the in-memory token cache first.
+"""
+import sys
+import argparse
+
+import botocore.session
+
+from aws_sso_login_gui.config import SSOInstance, get_sso_id
+from aws_sso_login_gui.token_fetcher import get_token_fetcher_creator
+
+from .common import temp_home, measure, format_result, get_qt_app, get_start_url, write_tokens
+
+def run(sizes=(10, 100, 1000), repeat=5):
+    app = get_qt_app()
+    results = {}
+    session = botocore.session.Session()
+    for num_instances in sizes:
+        with temp_home() as home_dir:
+            start_urls = [get_start_url(i) for i in range(num_instances)]
+            write_tokens(home_dir, start_urls)
+            token_fetcher = get_token_fetcher_creator(session, on_pending_authorization=None,
+                home_dir=home_dir)('us-east-1')
+            cache = token_fetcher._cache
+            instances = [SSOInstance(get_sso_id(start_url), start_url, 'us-east-1', token_fetcher)
+                for start_url in start_urls]
+            def update_all():
+                for instance in instances:
+                    instance.get_status(update=True)
+            results['get_status_cold_{}'.format(num_instances)] = measure(
+                update_all, repeat=repeat, setup=cache.invalidate)
+            update_all()
+            results['get_status_warm_{}'.format(num_instances)] = measure(update_all, repeat=repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, result in run(sizes=args.sizes, repeat=args.repeat).items():
+        print(format_result(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Load test the real SSOTokenFetcher against the local SSO emulator.
+
+Logs in to many start URLs at once, the way the refresh engine would, with
+no network access needed. Emulator settings control the latency and how
+often the device flow has to keep polling. With ``--async``, the logins
+poll as coroutines on one asyncio loop instead of a thread each.
+"""
+import sys
+import time
+import asyncio
+import threading
+import argparse
+import functools
+import statistics
+import concurrent.futures
+
+import botocore.session
+from botocore.config import Config
+
+from .emulator import SSOEmulator
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, MemoryCachedJSONFileCache, get_token_dir
+from aws_sso_login_gui.async_token_fetcher import AsyncSSOTokenFetcher, AsyncLoop
+
+from .common import temp_home
+
+def get_client_creator(session, endpoint_url, max_pool_connections):
+    def client_creator(service_name, config=None):
+        pool_config = Config(max_pool_connections=max_pool_connections)
+        config = config.merge(pool_config) if config else pool_config
+        return session.create_client(service_name, config=config, endpoint_url=endpoint_url)
+    return client_creator
+
+class ThreadCounter(object):
+    """Samples the number of threads, keeping the peak."""
+    def __init__(self, interval=0.01):
+        self._interval = interval
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self.peak = 0
+
+    def _sample(self):
+        while not self._done.wait(self._interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+
+def run(urls=200, workers=None, latency=0.01, approval_delay=1, interval=1,
+        pending_rate=0, slow_down_rate=0, time_scale=0.1, async_fetcher=False):
+    if workers is None:
+        workers = 16 if async_fetcher else urls
+    start_urls = ['https://instance-{}.awsapps.com/start'.format(i) for i in range(urls)]
+    emulator = SSOEmulator(
+        latency=latency,
+        # the fetcher's sleeps are scaled, so the user's speed is too
+        approval_delay=approval_delay * time_scale,
+        interval=interval,
+        pending_rate=pending_rate,
+        slow_down_rate=slow_down_rate)
+    with emulator, temp_home() as home_dir:
+        kwargs = dict(
+            sso_region='us-east-1',
+            client_creator=get_client_creator(botocore.session.Session(), emulator.endpoint_url, workers),
+            cache=MemoryCachedJSONFileCache(get_token_dir(home_dir)),
+        )
+        if async_fetcher:
+            # the workers are the loop's executor, for the botocore calls
+            loop = AsyncLoop(max_workers=workers).start()
+            async def sleep(seconds):
+                await asyncio.sleep(seconds * time_scale)
+            fetcher = AsyncSSOTokenFetcher(loop=loop, sleep=sleep, **kwargs)
+            async def login(start_url):
+                start = time.perf_counter()
+                await fetcher.fetch_token_async(start_url)
+                return time.perf_counter() - start
+            async def login_all():
+                return await asyncio.gather(*[login(start_url) for start_url in start_urls])
+            start = time.perf_counter()
+            with ThreadCounter() as thread_counter:
+                login_times = loop.submit(login_all()).result()
+            elapsed = time.perf_counter() - start
+            loop.stop()
+        else:
+            fetcher = SSOTokenFetcher(sleep=lambda seconds: time.sleep(seconds * time_scale), **kwargs)
+            def login(start_url):
+                start = time.perf_counter()
+                fetcher.fetch_token(start_url)
+                return time.perf_counter() - start
+            start = time.perf_counter()
+            with ThreadCounter() as thread_counter, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                login_times = list(executor.map(login, start_urls))
+            elapsed = time.perf_counter() - start
+        stats = emulator.stats()
+    login_times.sort()
+    return {
+        'urls': urls,
+        'async': async_fetcher,
+        'workers': workers,
+        'peak_threads': thread_counter.peak,
+        'elapsed': elapsed,
+        'logins_per_second': urls / elapsed,
+        'login_median': statistics.median(login_times),
+        'login_p95': login_times[int(0.95 * (len(login_times) - 1))],
+        'create_token_calls_per_login': stats.get('create_token', 0) / urls,
+        'emulator': stats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--urls', type=int, default=200)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--latency', type=float, default=0.01, metavar='SECONDS',
+        help='latency of each emulator request')
+    parser.add_argument('--approval-delay', type=float, default=1, metavar='SECONDS')
+    parser.add_argument('--interval', type=int, default=1, metavar='SECONDS',
+        help='the polling interval the emulator asks for')
+    parser.add_argument('--pending-rate', type=float, default=0)
+    parser.add_argument('--slow-down-rate', type=float, default=0)
+    parser.add_argument('--time-scale', type=float, default=0.1,
+        help='scale the polling sleeps and approval delay by this')
+    parser.add_argument('--async', dest='async_fetcher', action='store_true',
+        help='use the asyncio token fetcher')
+    args = parser.parse_args()
+
+    result = run(
+        urls=args.urls,
+        workers=args.workers,
+        latency=args.latency,
+        approval_delay=args.approval_delay,
+        interval=args.interval,
+        pending_rate=args.pending_rate,
+        slow_down_rate=args.slow_down_rate,
+        time_scale=args.time_scale,
+        async_fetcher=args.async_fetcher)
+    print('{} logins with {} workers in {:.3f} s ({:.1f}/s), {} threads'.format(
+        result['urls'], result['workers'], result['elapsed'], result['logins_per_second'], result['peak_threads']))
+    print('login time median {:.3f} s, p95 {:.3f} s'.format(result['login_median'], result['login_p95']))
+    print('create_token calls per login: {:.2f}'.format(result['create_token_calls_per_login']))
+    print('emulator calls: {}'.format(result['emulator']))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Stress the token cache lock with many processes logging in at once.
+
+Each process runs a real SSOTokenFetcher against a fake sso-oidc client that
+records every device authorization it starts. With the lock, there should
+be exactly one authorization per start URL, however many processes ask.
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, MemoryCachedJSONFileCache, get_token_dir
+
+from .common import temp_home
+
+class FakeOIDCClient(object):
+    """Stands in for an sso-oidc client; authorizations are logged to a file."""
+    class exceptions(object):
+        class SlowDownException(Exception):
+            pass
+        class AuthorizationPendingException(Exception):
+            pass
+        class ExpiredTokenException(Exception):
+            pass
+
+    def __init__(self, log_path, delay):
+        self._log_path = log_path
+        self._delay = delay
+
+    def _log(self, line):
+        # O_APPEND writes of a single line don't interleave
+        fd = os.open(self._log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, (line + '\n').encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def register_client(self, **kwargs):
+        self._log('register')
+        return {
+            'clientId': 'client-{}'.format(os.getpid()),
+            'clientSecret': 'secret',
+            'clientSecretExpiresAt': int(time.time()) + 90 * 24 * 3600,
+        }
+
+    def start_device_authorization(self, startUrl, **kwargs):
+        self._log('authorize {}'.format(startUrl))
+        return {
+            'deviceCode': 'device-code',
+            'userCode': 'user-code',
+            'verificationUri': 'https://device.example.com',
+            'verificationUriComplete': 'https://device.example.com/?code=user-code',
+            'expiresIn': 600,
+            'interval': 1,
+        }
+
+    def create_token(self, **kwargs):
+        # the user taking a while to approve
+        time.sleep(self._delay)
+        return {
+            'accessToken': 'token-{}'.format(os.getpid()),
+            'expiresIn': 8 * 3600,
+        }
+
+def _worker(home_dir, log_path, start_urls, delay, barrier):
+    client = FakeOIDCClient(log_path, delay)
+    fetcher = SSOTokenFetcher(
+        sso_region='us-east-1',
+        client_creator=lambda *args, **kwargs: client,
+        cache=MemoryCachedJSONFileCache(get_token_dir(home_dir)),
+    )
+    barrier.wait()
+    for start_url in start_urls:
+        fetcher.fetch_token(start_url)
+
+def run(processes=16, urls=4, delay=0.2):
+    start_urls = ['https://instance-{}.awsapps.com/start'.format(i) for i in range(urls)]
+    with temp_home() as home_dir:
+        log_path = os.path.join(home_dir, 'calls.log')
+        barrier = multiprocessing.Barrier(processes)
+        workers = []
+        for i in range(processes):
+            # vary the order so processes contend on different urls
+            offset = i % urls
+            urls_for_worker = start_urls[offset:] + start_urls[:offset]
+            workers.append(multiprocessing.Process(target=_worker,
+                args=(home_dir, log_path, urls_for_worker, delay, barrier)))
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        with open(log_path) as f:
+            calls = f.read().splitlines()
+    authorizations = {start_url: calls.count('authorize {}'.format(start_url)) for start_url in start_urls}
+    return {
+        'processes': processes,
+        'elapsed': elapsed,
+        'registrations': calls.count('register'),
+        'authorizations': authorizations,
+        'failed_processes': sum(1 for worker in workers if worker.exitcode != 0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=16)
+    parser.add_argument('--urls', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.2,
+        help='seconds each fake login takes')
+    args = parser.parse_args()
+
+    result = run(processes=args.processes, urls=args.urls, delay=args.delay)
+    print('{} processes, {} start URLs: {:.3f} s'.format(result['processes'], args.urls, result['elapsed']))
+    print('registrations: {}'.format(result['registrations']))
+    for start_url, count in result['authorizations'].items():
+        print('{:<45} {} authorization(s)'.format(start_url, count))
+    ok = (result['failed_processes'] == 0
+        and result['registrations'] == 1
+        and all(count == 1 for count in result['authorizations'].values()))
+    if not ok:
+        print('FAILED: expected one registration and one authorization per start URL')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Benchmark the window's handling of reloads and status changes.
+
+Runs under the offscreen Qt platform unless QT_QPA_PLATFORM is set.
+"""
+import sys
+import argparse
+import datetime
+
+from .common import measure, format_result, get_qt_app
+
+def run(sizes=(10, 100, 1000), repeat=3):
+    app = get_qt_app(widgets=True)
+
+    from PyQt5.QtGui import QIcon
+    from aws_sso_login_gui import fakes
+    from aws_sso_login_gui.config import Config, STATUS_VALID, STATUS_EXPIRED
+    from aws_sso_login_gui.widgets import AWSSSOLoginWindow
+
+    config = Config(lambda: {}, fakes.get_token_fetcher_creator(on_pending_authorization=lambda **kwargs: None))
+    expiration = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=8)).isoformat()
+
+    results = {}
+    for num_instances in sizes:
+        sso_ids = ['instance-{}'.format(i) for i in range(num_instances)]
+
+        windows = []
+        def new_window():
+            for window in windows:
+                window.deleteLater()
+            windows[:] = [AWSSSOLoginWindow(QIcon(), config)]
+            windows[0].show()
+            app.processEvents()
+        def add_all():
+            windows[0].on_instances_changed(sso_ids, [], [])
+            app.processEvents()
+        results['on_instances_changed_{}'.format(num_instances)] = measure(
+            add_all, repeat=repeat, setup=new_window)
+
+        statuses = [STATUS_VALID, STATUS_EXPIRED]
+        def update_all():
+            status = statuses.pop()
+            statuses.insert(0, status)
+            for sso_id in sso_ids:
+                windows[0].on_status_changed(sso_id, status, expiration if status == STATUS_VALID else '')
+            app.processEvents()
+        results['on_status_changed_{}'.format(num_instances)] = measure(update_all, repeat=repeat)
+        for window in windows:
+            window.deleteLater()
+        app.processEvents()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for name, result in run(sizes=args.sizes, repeat=args.repeat).items():
+        print(format_result(name, result))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from PyQt5.QtCore import QCoreApplication
+
+@pytest.fixture(scope='session')
+def qt_app():
+    # one per process, so it has to be a QApplication for the widget tests
+    app = QCoreApplication.instance()
+    if app is None:
+        from PyQt5.QtWidgets import QApplication
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        app = QApplication([])
+    return app
+
+@pytest.fixture
+def process_events(qt_app):
+    """Run the event loop until condition() is true, or fail after timeout seconds."""
+    import time
+    def process_events(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("Timed out waiting on the event loop")
+            qt_app.processEvents()
+            time.sleep(0.001)
+    return process_events
+
+@pytest.fixture
+def sso_oidc():
+    """An sso-oidc client with a botocore Stubber on it, as (client, stubber)."""
+    import botocore.session
+    from botocore.stub import Stubber
+    client = botocore.session.Session().create_client('sso-oidc', region_name='us-east-1',
+        aws_access_key_id='x', aws_secret_access_key='x')
+    with Stubber(client) as stubber:
+        yield client, stubber
@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import concurrent.futures
+
+import pytest
+
+from aws_sso_login_gui.async_token_fetcher import AsyncLoop, AsyncSSOTokenFetcher
+from aws_sso_login_gui.token_fetcher import MemoryCachedJSONFileCache
+from aws_sso_login_gui.file_lock import FileLock
+from aws_sso_login_gui.metrics import MetricsRegistry
+
+START_URL = 'https://instance.awsapps.com/start'
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+@pytest.fixture
+def loop():
+    # one executor thread, so a fetch tying it up would block everything
+    loop = AsyncLoop(max_workers=1, name='test-asyncio').start()
+    yield loop
+    loop.stop(timeout=5)
+
+def get_fetcher(loop, tmp_path):
+    fetcher = AsyncSSOTokenFetcher('us-east-1', None, loop=loop,
+        cache=MemoryCachedJSONFileCache(str(tmp_path)),
+        time_fetcher=lambda: NOW,
+        metrics=MetricsRegistry())
+    cache_key = fetcher.get_cache_key(START_URL)
+    fetcher._cache[cache_key] = {
+        'startUrl': START_URL,
+        'accessToken': 'token',
+        'expiresAt': (NOW + datetime.timedelta(hours=1)).isoformat(),
+    }
+    return fetcher, FileLock(fetcher._cache_lock(cache_key).path)
+
+def run_in_executor(loop):
+    async def call():
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: 'ran')
+    return loop.submit(call())
+
+def test_waiting_on_lock_does_not_hold_executor_threads(loop, tmp_path):
+    fetcher, lock = get_fetcher(loop, tmp_path)
+    with lock:
+        futures = [fetcher.submit_fetch(START_URL) for _ in range(3)]
+        assert run_in_executor(loop).result(timeout=2) == 'ran'
+        assert not any(future.done() for future in futures)
+    for future in futures:
+        assert future.result(timeout=2) == NOW + datetime.timedelta(minutes=45)
+
+def test_cancelled_wait_on_lock_does_not_take_it(loop, tmp_path):
+    fetcher, lock = get_fetcher(loop, tmp_path)
+    with lock:
+        future = fetcher.submit_fetch(START_URL)
+        assert run_in_executor(loop).result(timeout=2) == 'ran'
+        future.cancel()
+        with pytest.raises(concurrent.futures.CancelledError):
+            future.result(timeout=2)
+    # nobody is left holding it
+    assert lock.try_acquire()
+    lock.release()
+
+def test_rejected_refresh_token_falls_back_to_logging_in(loop, sso_oidc):
+    from .test_token_fetcher import get_token, add_device_flow
+    client, stubber = sso_oidc
+    logins = []
+    fetcher = AsyncSSOTokenFetcher('us-east-1', lambda *args, **kwargs: client, loop=loop,
+        cache={},
+        on_pending_authorization=lambda **kwargs: logins.append(kwargs),
+        time_fetcher=lambda: NOW,
+        sleep=lambda interval: asyncio.sleep(0),
+        metrics=MetricsRegistry())
+    cache_key = fetcher.get_cache_key(START_URL)
+    fetcher._cache[cache_key] = get_token(expires_in=datetime.timedelta(minutes=5))
+    stubber.add_client_error('create_token', 'InvalidGrantException')
+    add_device_flow(stubber)
+    fetcher.submit_fetch(START_URL).result(timeout=5)
+    stubber.assert_no_pending_responses()
+    assert len(logins) == 1
+    assert fetcher._cache[cache_key]['accessToken'] == 'device-flow-token'
@@ -0,0 +1,137 @@
+import copy
+
+import pytest
+
+from aws_sso_login_gui.config_file_writer import ConfigFileWriter, SectionNotFoundError
+
+def update_whole_file(writer, contents, new_values):
+    """The update_config of aws-cli, working on the whole file."""
+    new_values = copy.deepcopy(new_values)
+    section_name = new_values.pop('__section__', 'default')
+    lines = contents.splitlines(True)
+    try:
+        writer._update_section_contents(lines, section_name, new_values)
+    except SectionNotFoundError:
+        # aws-cli ran the new header onto an unterminated last line
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        section = ['[%s]\n' % section_name]
+        writer._insert_new_values(line_number=0, contents=section, new_values=new_values)
+        lines.extend(section)
+    return ''.join(lines)
+
+CASES = {
+    'repeated_sections': (
+        '[profile a]\n'
+        'region = us-east-1\n'
+        '\n'
+        '[profile b]\n'
+        'region = us-east-1\n'
+        '\n'
+        '[profile a]\n'
+        'output = json\n',
+        [
+            {'__section__': 'profile a', 'region': 'eu-west-1', 'output': 'text'},
+            {'__section__': 'profile b', 'output': 'yaml'},
+            {'__section__': 'profile a', 'sso_region': 'us-east-2'},
+        ],
+    ),
+    'new_sections': (
+        '[profile a]\n'
+        'region = us-east-1\n',
+        [
+            {'__section__': 'profile b', 'region': 'eu-west-1'},
+            {'region': 'us-west-2'},
+            {'__section__': 'profile b', 'output': 'json'},
+            {'__section__': 'profile c', 's3': {'max_concurrent_requests': '20'}},
+        ],
+    ),
+    'nested_s3': (
+        '[profile a]\n'
+        'region = us-east-1\n'
+        's3 =\n'
+        '    max_concurrent_requests = 10\n'
+        '    max_queue_size = 100\n'
+        '[profile b]\n'
+        's3 =\n'
+        '    max_concurrent_requests = 10\n'
+        'region = us-east-1\n'
+        '[profile c]\n'
+        's3 =\n'
+        '    addressing_style = path\n',
+        [
+            {'__section__': 'profile a', 's3': {'max_concurrent_requests': '20', 'use_accelerate_endpoint': 'true'}},
+            {'__section__': 'profile b', 's3': {'max_queue_size': '1000'}, 'output': 'json'},
+            {'__section__': 'profile c', 's3': {'addressing_style': 'virtual', 'max_queue_size': '10'}},
+            {'__section__': 'profile a', 'output': 'text'},
+        ],
+    ),
+    'no_trailing_newline': (
+        '[profile a]\n'
+        'region = us-east-1',
+        [
+            {'__section__': 'profile a', 'output': 'json'},
+            {'__section__': 'profile b', 'region': 'eu-west-1'},
+        ],
+    ),
+    'no_trailing_newline_new_section': (
+        '[profile a]\n'
+        'region = us-east-1',
+        [
+            {'__section__': 'profile b', 'region': 'eu-west-1'},
+            {'__section__': 'profile a', 'region': 'us-west-2'},
+        ],
+    ),
+    'quoted_headers': (
+        '[profile "my profile"]\n'
+        'region = us-east-1\n'
+        '\n'
+        '[profile other]\n'
+        'region = us-east-1\n',
+        [
+            {'__section__': 'profile my profile', 'region': 'eu-west-1', 'output': 'json'},
+            {'__section__': 'profile other', 'output': 'text'},
+        ],
+    ),
+    'comments': (
+        '# [profile a]\n'
+        '[profile a]\n'
+        '# region = eu-west-1\n'
+        'region = us-east-1\n'
+        '; a comment\n',
+        [
+            {'__section__': 'profile a', 'region': 'us-west-2', 'output': 'json'},
+        ],
+    ),
+    'empty': (
+        '',
+        [
+            {'__section__': 'profile a', 'region': 'us-east-1'},
+            {'__section__': 'profile a', 'output': 'json'},
+        ],
+    ),
+}
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_batch_matches_sequential_updates(tmp_path, name):
+    contents, updates = CASES[name]
+
+    expected = contents
+    for new_values in updates:
+        expected = update_whole_file(ConfigFileWriter(), expected, new_values)
+
+    sequential_path = str(tmp_path / 'sequential')
+    batch_path = str(tmp_path / 'batch')
+    if contents:
+        for path in [sequential_path, batch_path]:
+            with open(path, 'w') as f:
+                f.write(contents)
+
+    for new_values in copy.deepcopy(updates):
+        ConfigFileWriter().update_config(new_values, sequential_path)
+    ConfigFileWriter().update_config_batch(copy.deepcopy(updates), batch_path)
+
+    with open(sequential_path) as f:
+        assert f.read() == expected
+    with open(batch_path) as f:
+        assert f.read() == expected
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import socket
+import threading
+
+import pytest
+
+from aws_sso_login_gui import credential_process
+from aws_sso_login_gui.ipc import SERVER_NAME_ENV_VAR
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="uses a Unix socket path")
+
+CREDENTIALS = {
+    'Version': 1,
+    'AccessKeyId': 'AKID',
+    'SecretAccessKey': 'secret',
+    'SessionToken': 'token',
+    'Expiration': '2020-01-01T00:00:00+00:00',
+}
+
+def serve(server_name, result):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(server_name)
+    server.listen(1)
+    server.settimeout(2)
+    def run():
+        try:
+            connection, _ = server.accept()
+        except OSError:
+            return
+        with connection:
+            request = json.loads(connection.makefile('rb').readline())
+            connection.sendall(json.dumps({'id': request['id'], 'result': result}).encode('utf-8') + b'\n')
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return server
+
+def run_main(monkeypatch, server_name):
+    monkeypatch.setenv(SERVER_NAME_ENV_VAR, server_name)
+    monkeypatch.setattr(sys, 'argv', ['aws-sso-login-gui-credential-process', '--profile', 'p', '--timeout', '2'])
+    return credential_process.main()
+
+def test_prints_credentials(monkeypatch, capsys, tmp_path):
+    server_name = str(tmp_path / 'ipc.sock')
+    with serve(server_name, CREDENTIALS):
+        assert run_main(monkeypatch, server_name) == 0
+    assert json.loads(capsys.readouterr().out) == CREDENTIALS
+
+def test_refuses_server_others_could_have_replaced(monkeypatch, capsys, tmp_path):
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    os.chmod(str(shared_dir), 0o1777)
+    server_name = str(shared_dir / 'ipc.sock')
+    with serve(server_name, CREDENTIALS):
+        assert run_main(monkeypatch, server_name) == 1
+    assert capsys.readouterr().out == ''
+
+def test_refuses_unexpected_response(monkeypatch, capsys, tmp_path):
+    server_name = str(tmp_path / 'ipc.sock')
+    with serve(server_name, {'Version': 1, 'AccessKeyId': 'AKID'}):
+        assert run_main(monkeypatch, server_name) == 1
+    assert capsys.readouterr().out == ''
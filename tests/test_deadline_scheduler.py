@@ -0,0 +1,107 @@
+import datetime
+
+from aws_sso_login_gui.config import DeadlineScheduler
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+def minutes(n):
+    return NOW + datetime.timedelta(minutes=n)
+
+def get_scheduler():
+    clock = [NOW]
+    fired = []
+    scheduler = DeadlineScheduler(fired.append, time_fetcher=lambda: clock[0])
+    return scheduler, clock, fired
+
+def test_schedule(qt_app):
+    scheduler, clock, fired = get_scheduler()
+    scheduler.schedule('b', minutes(2))
+    scheduler.schedule('a', minutes(1))
+    assert len(scheduler) == 2
+    assert 'a' in scheduler
+    assert scheduler.deadline('a') == minutes(1)
+    assert scheduler.next_deadline() == minutes(1)
+
+    scheduler.rescan()
+    assert fired == []
+    clock[0] = minutes(1)
+    scheduler.rescan()
+    assert fired == ['a']
+    assert 'a' not in scheduler
+    assert scheduler.next_deadline() == minutes(2)
+    clock[0] = minutes(2)
+    scheduler.rescan()
+    assert fired == ['a', 'b']
+    assert len(scheduler) == 0
+    assert scheduler.next_deadline() is None
+
+def test_cancel(qt_app):
+    scheduler, clock, fired = get_scheduler()
+    scheduler.schedule('a', minutes(1))
+    scheduler.schedule('b', minutes(2))
+    scheduler.cancel('a')
+    # cancelling what isn't scheduled is fine
+    scheduler.cancel('c')
+    assert 'a' not in scheduler
+    assert scheduler.deadline('a') is None
+    assert scheduler.next_deadline() == minutes(2)
+    clock[0] = minutes(3)
+    scheduler.rescan()
+    assert fired == ['b']
+
+def test_reschedule(qt_app):
+    scheduler, clock, fired = get_scheduler()
+    scheduler.schedule('a', minutes(1))
+    scheduler.schedule('a', minutes(3))
+    assert len(scheduler) == 1
+    assert scheduler.deadline('a') == minutes(3)
+    clock[0] = minutes(2)
+    scheduler.rescan()
+    assert fired == []
+    # earlier again
+    scheduler.schedule('a', minutes(1))
+    scheduler.rescan()
+    assert fired == ['a']
+    clock[0] = minutes(4)
+    scheduler.rescan()
+    # the old entries are dead
+    assert fired == ['a']
+
+def test_clear(qt_app):
+    scheduler, clock, fired = get_scheduler()
+    scheduler.schedule('a', minutes(1))
+    scheduler.schedule('b', minutes(2))
+    scheduler.clear()
+    assert len(scheduler) == 0
+    assert scheduler.next_deadline() is None
+    clock[0] = minutes(3)
+    scheduler.rescan()
+    assert fired == []
+    scheduler.schedule('a', minutes(4))
+    clock[0] = minutes(4)
+    scheduler.rescan()
+    assert fired == ['a']
+
+def test_clock_jump_fires_overdue_keys_in_order(qt_app):
+    scheduler, clock, fired = get_scheduler()
+    for key, n in [('c', 30), ('a', 10), ('d', 600), ('b', 20)]:
+        scheduler.schedule(key, minutes(n))
+    scheduler.cancel('b')
+    # e.g. waking up from sleep
+    clock[0] = minutes(60)
+    scheduler.rescan()
+    assert fired == ['a', 'c']
+    assert scheduler.next_deadline() == minutes(600)
+
+def test_callback_can_reschedule(qt_app):
+    clock = [NOW]
+    fired = []
+    def callback(key):
+        fired.append(key)
+        scheduler.schedule(key, clock[0] + datetime.timedelta(minutes=1))
+    scheduler = DeadlineScheduler(callback, time_fetcher=lambda: clock[0])
+    scheduler.schedule('a', minutes(1))
+    clock[0] = minutes(1)
+    scheduler.rescan()
+    assert fired == ['a']
+    assert scheduler.deadline('a') == minutes(2)
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+
+import pytest
+
+from aws_sso_login_gui.file_lock import FileLock, LockCancelled, LockTimeout, atomic_write
+from aws_sso_login_gui.config_file_writer import ConfigFileWriter
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, MemoryCachedJSONFileCache, FetchCancelledError
+from aws_sso_login_gui.metrics import MetricsRegistry
+
+def test_lock_times_out(tmp_path):
+    path = str(tmp_path / 'test.lock')
+    with FileLock(path):
+        with pytest.raises(LockTimeout):
+            FileLock(path, timeout=0.1).acquire()
+
+def test_waiting_on_lock_is_cancelled(tmp_path):
+    path = str(tmp_path / 'test.lock')
+    cancelled = threading.Event()
+    errors = []
+    def wait():
+        try:
+            FileLock(path, cancel_event=cancelled).acquire()
+        except LockCancelled as e:
+            errors.append(e)
+    with FileLock(path):
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.1)
+        cancelled.set()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+    assert len(errors) == 1
+
+def test_fetcher_shutdown_cancels_waiting_on_cache_lock(tmp_path):
+    fetcher = SSOTokenFetcher('us-east-1', None, cache=MemoryCachedJSONFileCache(str(tmp_path)),
+        metrics=MetricsRegistry())
+    lock = fetcher._cache_lock('key')
+    errors = []
+    def wait():
+        try:
+            with fetcher._cache_lock('key'):
+                pass
+        except FetchCancelledError as e:
+            errors.append(e)
+    with FileLock(lock._path):
+        thread = threading.Thread(target=wait)
+        thread.start()
+        time.sleep(0.1)
+        fetcher.shutdown()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+    assert len(errors) == 1
+
+@pytest.mark.skipif(os.name == 'nt', reason="syncs the directory on POSIX only")
+def test_atomic_write_syncs_directory(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    def record_fsync(fd):
+        synced.append(os.fstat(fd).st_ino)
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', record_fsync)
+    filename = str(tmp_path / 'config')
+    atomic_write(filename, 'contents')
+    with open(filename) as f:
+        assert f.read() == 'contents'
+    # the temp file, then the directory the rename happened in
+    assert synced[-1] == os.stat(str(tmp_path)).st_ino
+
+@pytest.mark.skipif(os.name == 'nt', reason="uses a symlink")
+def test_config_lock_is_next_to_real_file(tmp_path):
+    os.mkdir(str(tmp_path / 'real'))
+    filename = str(tmp_path / 'real' / 'config')
+    link = str(tmp_path / 'config')
+    os.symlink(filename, link)
+    writer = ConfigFileWriter()
+    assert writer._get_lock_filename(link) == writer._get_lock_filename(filename)
+    writer.update_config({'__section__': 'profile test', 'region': 'us-east-1'}, link)
+    assert os.path.exists(filename + '.lock')
+    assert not os.path.exists(link + '.lock')
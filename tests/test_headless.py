@@ -0,0 +1,71 @@
+import datetime
+
+from aws_sso_login_gui.config import Config, STATUS_VALID, STATUS_EXPIRED, STATUS_REFRESHING
+from aws_sso_login_gui.headless import HeadlessRunner
+from aws_sso_login_gui.token_fetcher import FetchCancelledError
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+START_URL = 'https://instance.awsapps.com/start'
+
+class CancelledTokenFetcher(object):
+    """No token, and fetches that are cancelled, like after shutdown()."""
+    def __init__(self):
+        self.fetches = 0
+
+    def get_cache_key(self, start_url):
+        return 'cache-key'
+
+    def get_refresh_status(self, start_url):
+        return True, None
+
+    def get_expiration(self, start_url):
+        return None
+
+    def can_renew(self, start_url):
+        return False
+
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        self.fetches += 1
+        raise FetchCancelledError()
+
+def test_cancelled_refresh_is_not_retried(qt_app, process_events):
+    token_fetcher = CancelledTokenFetcher()
+    profiles = {'profile': {'sso_start_url': START_URL, 'sso_region': 'us-east-1'}}
+    config = Config(lambda: profiles, lambda region: token_fetcher, time_fetcher=lambda: NOW)
+    runner = HeadlessRunner(config)
+    finished = []
+    config.refresh_finished.connect(finished.append)
+
+    config.reload()
+    process_events(lambda: finished)
+    assert config.sso_instances['instance'].get_status() == STATUS_EXPIRED
+    # give a retry the chance to start
+    for _ in range(10):
+        qt_app.processEvents()
+    assert token_fetcher.fetches == 1
+    assert not config.is_refreshing('instance')
+    config.shutdown(1)
+
+def test_only_expirations_are_refreshed(qt_app):
+    profiles = {'profile': {'sso_start_url': START_URL, 'sso_region': 'us-east-1'}}
+    config = Config(lambda: profiles, lambda region: CancelledTokenFetcher(), time_fetcher=lambda: NOW)
+    runner = HeadlessRunner(config)
+    refreshes = []
+    runner.needs_refresh.disconnect()
+    runner.needs_refresh.connect(refreshes.append)
+
+    expiration = (NOW + datetime.timedelta(hours=1)).isoformat()
+    runner.on_status_changed('instance', STATUS_EXPIRED, '')
+    assert refreshes == ['instance']
+    runner.on_status_changed('instance', STATUS_REFRESHING, '')
+    runner.on_status_changed('instance', STATUS_EXPIRED, '')
+    assert refreshes == ['instance']
+    runner.on_status_changed('instance', STATUS_VALID, expiration)
+    runner.on_status_changed('instance', STATUS_EXPIRED, '')
+    assert refreshes == ['instance', 'instance']
+
+    # a removed instance that comes back starts over
+    runner.on_status_changed('instance', STATUS_REFRESHING, '')
+    runner.on_instances_changed([], ['instance'], [])
+    runner.on_status_changed('instance', STATUS_EXPIRED, '')
+    assert refreshes == ['instance', 'instance', 'instance']
@@ -0,0 +1,94 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from aws_sso_login_gui import ipc
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="uses a Unix socket path")
+
+def test_default_socket_is_not_in_a_shared_directory(monkeypatch, tmp_path):
+    monkeypatch.delenv(ipc.SERVER_NAME_ENV_VAR, raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    server_name = ipc.get_server_name()
+    assert server_name.startswith(str(tmp_path) + os.sep)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'run'))
+    assert ipc.get_server_name() == str(tmp_path / 'run' / 'aws-sso-login-gui' / 'ipc.sock')
+
+def test_server_dir_is_private(tmp_path):
+    server_dir = tmp_path / 'ipc'
+    ipc.make_server_dir(str(server_dir / 'ipc.sock'))
+    assert os.stat(str(server_dir)).st_mode & 0o777 == 0o700
+
+def test_server_refuses_dir_others_can_write_to(tmp_path):
+    server_dir = tmp_path / 'ipc'
+    server_dir.mkdir()
+    os.chmod(str(server_dir), 0o1777)
+    with pytest.raises(ipc.UntrustedServer):
+        ipc.make_server_dir(str(server_dir / 'ipc.sock'))
+
+def serve_once(server_name, response=b'{"id": 1, "result": "ok"}\n'):
+    """A bare socket server that answers one request, and records what it got."""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(server_name)
+    server.listen(1)
+    server.settimeout(2)
+    received = []
+    def run():
+        try:
+            connection, _ = server.accept()
+        except OSError:
+            # timed out, or closed by the test
+            return
+        with connection:
+            connection.settimeout(1)
+            try:
+                received.append(connection.recv(1024))
+                connection.sendall(response)
+            except OSError:
+                pass
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return server, thread, received
+
+def test_client_talks_to_own_server(tmp_path):
+    server_name = str(tmp_path / 'ipc.sock')
+    server, thread, received = serve_once(server_name)
+    with server:
+        with ipc.IPCClient(server_name, timeout=2) as client:
+            assert client.request('status') == 'ok'
+        thread.join()
+    assert received
+
+def test_client_refuses_socket_others_can_replace(tmp_path):
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    os.chmod(str(shared_dir), 0o1777)
+    server_name = str(shared_dir / 'ipc.sock')
+    server, thread, received = serve_once(server_name)
+    with server:
+        with pytest.raises(ipc.UntrustedServer):
+            ipc.IPCClient(server_name, timeout=2).connect()
+        with pytest.raises(ipc.UntrustedServer):
+            ipc.is_server_running(server_name)
+        server.close()
+        thread.join()
+    # nothing was sent
+    assert not any(received)
+
+def test_client_refuses_server_run_by_another_user(tmp_path, monkeypatch):
+    server_name = str(tmp_path / 'ipc.sock')
+    server, thread, received = serve_once(server_name)
+    real_getuid = os.getuid
+    with server:
+        # the directory checks pass as the other user, so it's the peer check that refuses
+        monkeypatch.setattr(ipc, 'check_server_dir', lambda server_name: None)
+        monkeypatch.setattr(os, 'getuid', lambda: real_getuid() + 1)
+        with pytest.raises(ipc.UntrustedServer):
+            ipc.IPCClient(server_name, timeout=2).connect()
+        monkeypatch.undo()
+        server.close()
+        thread.join()
+    assert not any(received)
@@ -0,0 +1,89 @@
+import os
+import socket
+
+import pytest
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from aws_sso_login_gui.ipc_server import IPCServer
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="uses a Unix socket path")
+
+class StubConfig(QObject):
+    refresh_finished = pyqtSignal(str)
+
+def start(server):
+    events = []
+    server.started.connect(lambda: events.append('started'))
+    server.already_running.connect(lambda: events.append('already_running'))
+    server.start()
+    return events
+
+def test_second_instance_defers_to_first(qt_app, tmp_path):
+    server_name = str(tmp_path / 'test.sock')
+    config = StubConfig()
+    first = IPCServer(config, server_name=server_name)
+    second = IPCServer(config, server_name=server_name)
+    try:
+        assert start(first) == ['started']
+        assert start(second) == ['already_running']
+        # and didn't take the socket from the first
+        assert not second._server.isListening()
+        assert first._server.isListening()
+        assert os.path.exists(server_name)
+    finally:
+        first.stop()
+        second.stop()
+
+def test_stale_socket_is_replaced(qt_app, tmp_path):
+    server_name = str(tmp_path / 'test.sock')
+    # left by an instance that crashed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(server_name)
+    stale.close()
+    server = IPCServer(StubConfig(), server_name=server_name)
+    try:
+        assert start(server) == ['started']
+        assert server._server.isListening()
+    finally:
+        server.stop()
+
+def test_name_held_by_untrusted_server_is_not_an_instance(qt_app, tmp_path):
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    os.chmod(str(shared_dir), 0o1777)
+    server_name = str(shared_dir / 'test.sock')
+    squatter = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    squatter.bind(server_name)
+    squatter.listen(1)
+    server = IPCServer(StubConfig(), server_name=server_name)
+    try:
+        # runs on without the socket, rather than handing over to it
+        assert start(server) == ['started']
+        assert not server._server.isListening()
+        squatter.settimeout(0)
+        with pytest.raises(BlockingIOError):
+            squatter.accept()
+    finally:
+        server.stop()
+        squatter.close()
+
+def test_launch_does_not_forward_to_untrusted_server(tmp_path, monkeypatch):
+    import argparse
+    from aws_sso_login_gui import app, ipc
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    os.chmod(str(shared_dir), 0o1777)
+    server_name = str(shared_dir / 'test.sock')
+    monkeypatch.setenv(ipc.SERVER_NAME_ENV_VAR, server_name)
+    squatter = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    squatter.bind(server_name)
+    squatter.listen(1)
+    try:
+        args = argparse.Namespace(import_file=str(tmp_path / 'secret-settings'), reload=False)
+        assert app.forward_to_running_instance(None, args) is None
+        squatter.settimeout(0)
+        with pytest.raises(BlockingIOError):
+            squatter.accept()
+    finally:
+        squatter.close()
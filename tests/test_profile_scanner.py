@@ -0,0 +1,106 @@
+import pytest
+
+import botocore.configloader
+
+from aws_sso_login_gui.profile_scanner import ProfileScanner, SSO_KEYS
+
+CASES = {
+    'continuation_lines': (
+        '[profile a]\n'
+        'sso_start_url = https://a.awsapps.com/start\n'
+        '  continued\n'
+        '\n'
+        '  after a blank line\n'
+        'sso_region = us-east-1\n'
+        'description = not an sso key\n'
+        '  sso_role_name = not an option\n'
+    ),
+    'nested_s3': (
+        '[profile a]\n'
+        's3 =\n'
+        '    max_concurrent_requests = 20\n'
+        '    sso_region = not-a-profile-setting\n'
+        'sso_region = us-east-1\n'
+        '[profile b]\n'
+        'sso_region = us-west-2\n'
+        's3 =\n'
+        '  sso_role_name = nested\n'
+    ),
+    'comments': (
+        '# [profile commented]\n'
+        '[profile a]\n'
+        '# sso_region = commented\n'
+        '  ; sso_role_name = commented\n'
+        'sso_start_url = https://a.awsapps.com/start\n'
+        '# between a value and its continuation\n'
+        '  continued\n'
+        'sso_region = us-east-1 # not a comment\n'
+    ),
+    'quoted_profile_headers': (
+        '[profile "my profile"]\n'
+        'sso_region = us-east-1\n'
+        "[profile 'b c']\n"
+        'sso_region = us-east-2\n'
+        '[profile  d ]\n'
+        'sso_region = us-west-1\n'
+        '[ profile e]\n'
+        'sso_region = us-west-2\n'
+        '[profile f g]\n'
+        'sso_region = eu-west-1\n'
+        '[profilex]\n'
+        'sso_region = eu-west-2\n'
+        '[sso-session s]\n'
+        'sso_region = eu-west-3\n'
+        '[default]\n'
+        'sso_region = eu-north-1\n'
+    ),
+    'colon_delimiters': (
+        '[default]\n'
+        'sso_region: us-east-1\n'
+        'sso_start_url : https://a.awsapps.com/start?x=1\n'
+        'sso_role_name= Role:Admin\n'
+        'sso_account_id:123456789012\n'
+    ),
+    'mixed_case_keys': (
+        '[profile a]\n'
+        'SSO_Region = us-east-1\n'
+        'Sso_Start_Url=https://a.awsapps.com/start\n'
+        'sso_ROLE_name = Role\n'
+        'SSO_ACCOUNT_ID = 123456789012\n'
+    ),
+    'indented_options': (
+        '[profile a]\n'
+        '  sso_region = us-east-1\n'
+        '  sso_role_name = Role\n'
+        '    continued\n'
+    ),
+    'profiles_without_sso_keys': (
+        '[default]\n'
+        'region = us-east-1\n'
+        '[profile a]\n'
+        'output = json\n'
+    ),
+}
+
+def botocore_profiles(path):
+    profiles = botocore.configloader.load_config(path)['profiles']
+    return {
+        name: {key: value for key, value in profile.items() if key in SSO_KEYS}
+        for name, profile in profiles.items()
+    }
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_scan_lines_matches_botocore(tmp_path, name):
+    contents = CASES[name]
+    path = tmp_path / 'config'
+    path.write_text(contents)
+    assert ProfileScanner().scan_lines(contents.splitlines(True)) == botocore_profiles(str(path))
+
+def test_scan_caches_until_the_file_changes(tmp_path):
+    path = tmp_path / 'config'
+    path.write_text('[profile a]\nsso_region = us-east-1\n')
+    scanner = ProfileScanner()
+    profiles = scanner.scan(str(path))
+    assert scanner.scan(str(path)) is profiles
+    path.write_text('[profile a]\nsso_region = eu-central-1\n')
+    assert scanner.scan(str(path)) == {'a': {'sso_region': 'eu-central-1'}}
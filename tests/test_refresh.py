@@ -0,0 +1,82 @@
+import concurrent.futures
+
+from aws_sso_login_gui.refresh import RefreshEngine, RENEW, REFRESH, FORCE_REFRESH
+
+class Fetches(object):
+    """Futures the test finishes by hand, in the order they were started."""
+    def __init__(self):
+        self.futures = []
+
+    def start(self, name):
+        def start():
+            future = concurrent.futures.Future()
+            future.name = name
+            self.futures.append(future)
+            return future
+        return start
+
+def record(results, name):
+    return lambda result, exception: results.append((name, result, exception))
+
+def test_weaker_request_attaches(qt_app, process_events):
+    engine = RefreshEngine()
+    fetches = Fetches()
+    results = []
+    engine.submit_future('id', fetches.start('refresh'), record(results, 'a'), strength=REFRESH)
+    engine.submit_future('id', fetches.start('renew'), record(results, 'b'), strength=RENEW)
+    engine.submit_future('id', fetches.start('refresh'), record(results, 'c'), strength=REFRESH)
+    assert len(fetches.futures) == 1
+    fetches.futures[0].set_result('token')
+    process_events(lambda: not engine.is_refreshing('id'))
+    assert results == [('a', 'token', None), ('b', 'token', None), ('c', 'token', None)]
+    assert engine.stats()['coalesced'] == 2
+
+def test_stronger_request_runs_after_fetch_in_flight(qt_app, process_events):
+    engine = RefreshEngine()
+    fetches = Fetches()
+    results = []
+    finished = []
+    engine.finished.connect(finished.append)
+    engine.submit_future('id', fetches.start('renew'), record(results, 'renewal'), strength=RENEW)
+    engine.submit_future('id', fetches.start('refresh'), record(results, 'click'), strength=REFRESH)
+    engine.submit_future('id', fetches.start('force'), record(results, 'force click'), strength=FORCE_REFRESH)
+    assert len(fetches.futures) == 1
+    error = Exception("can't renew")
+    fetches.futures[0].set_exception(error)
+    process_events(lambda: results)
+    assert results == [('renewal', None, error)]
+    # the strongest request queued is the one that runs, for both
+    assert [future.name for future in fetches.futures] == ['renew', 'force']
+    assert engine.is_refreshing('id')
+    assert finished == []
+    fetches.futures[1].set_result('token')
+    process_events(lambda: not engine.is_refreshing('id'))
+    assert results[1:] == [('click', 'token', None), ('force click', 'token', None)]
+    assert finished == ['id']
+    assert engine.stats()['queued'] == 2
+
+def test_same_callback_gets_only_the_stronger_result(qt_app, process_events):
+    engine = RefreshEngine()
+    fetches = Fetches()
+    results = []
+    callback = record(results, 'instance')
+    engine.submit_future('id', fetches.start('renew'), callback, strength=RENEW)
+    engine.submit_future('id', fetches.start('refresh'), callback, strength=REFRESH)
+    fetches.futures[0].set_exception(Exception("can't renew"))
+    process_events(lambda: len(fetches.futures) == 2)
+    assert results == []
+    fetches.futures[1].set_result('token')
+    process_events(lambda: results)
+    assert results == [('instance', 'token', None)]
+
+def test_cancel_drops_queued_fetch(qt_app, process_events):
+    engine = RefreshEngine()
+    fetches = Fetches()
+    results = []
+    engine.submit_future('id', fetches.start('renew'), record(results, 'renewal'), strength=RENEW)
+    engine.submit_future('id', fetches.start('refresh'), record(results, 'click'), strength=REFRESH)
+    assert engine.cancel('id')
+    process_events(lambda: not engine.is_refreshing('id'))
+    assert len(fetches.futures) == 1
+    assert [name for name, _, exception in results
+        if isinstance(exception, concurrent.futures.CancelledError)] == ['renewal', 'click']
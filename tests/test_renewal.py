@@ -0,0 +1,152 @@
+import random
+import threading
+import datetime
+
+import pytest
+
+from aws_sso_login_gui.config import Config, get_renewal_time
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, RenewalUnavailableError
+from aws_sso_login_gui.metrics import MetricsRegistry
+
+START_URL = 'https://instance.awsapps.com/start'
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+def test_jitter_never_schedules_renewal_in_the_past():
+    rng = random.Random(0)
+    jitter = datetime.timedelta(minutes=2)
+    for seconds_left in [0, 1, 30, 59, 60, 119, 600]:
+        deadline = NOW + datetime.timedelta(seconds=seconds_left)
+        for _ in range(100):
+            renewal_time = get_renewal_time(NOW, deadline + datetime.timedelta(minutes=15), deadline,
+                jitter=jitter, rng=rng)
+            assert renewal_time >= NOW
+            # and at most half of the time left is given up to jitter
+            assert renewal_time >= NOW + (deadline - NOW) / 2
+
+def test_jitter_is_applied_with_time_to_spare():
+    deadline = NOW + datetime.timedelta(hours=1)
+    times = set(get_renewal_time(NOW, deadline, deadline, jitter=datetime.timedelta(minutes=2),
+        rng=random.Random(seed)) for seed in range(10))
+    assert len(times) > 1
+    assert all(deadline - datetime.timedelta(minutes=2) <= t <= deadline for t in times)
+
+def get_fetcher(client, token=None):
+    def on_pending_authorization(**kwargs):
+        raise AssertionError("A renewal started a device flow")
+    fetcher = SSOTokenFetcher('us-east-1', lambda *args, **kwargs: client,
+        cache={},
+        on_pending_authorization=on_pending_authorization,
+        time_fetcher=lambda: NOW,
+        metrics=MetricsRegistry())
+    if token is not None:
+        fetcher._cache[fetcher.get_cache_key(START_URL)] = token
+    return fetcher
+
+def test_renewal_without_refresh_token_does_not_log_in(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher = get_fetcher(client, {
+        'startUrl': START_URL,
+        'accessToken': 'token',
+        'expiresAt': NOW + datetime.timedelta(minutes=20),
+    })
+    assert not fetcher.can_renew(START_URL)
+    with pytest.raises(RenewalUnavailableError):
+        fetcher.fetch_token(START_URL, renew=True)
+
+def test_failed_renewal_does_not_log_in(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher = get_fetcher(client, {
+        'startUrl': START_URL,
+        'accessToken': 'token',
+        'expiresAt': NOW + datetime.timedelta(minutes=20),
+        'refreshToken': 'refresh-token',
+        'clientId': 'client-id',
+        'clientSecret': 'client-secret',
+        'registrationExpiresAt': NOW + datetime.timedelta(days=30),
+    })
+    assert fetcher.can_renew(START_URL)
+    stubber.add_client_error('create_token', 'InvalidGrantException')
+    with pytest.raises(RenewalUnavailableError):
+        fetcher.fetch_token(START_URL, renew=True)
+    stubber.assert_no_pending_responses()
+
+class RenewalTokenFetcher(object):
+    """A valid token that renewal can't replace, counting renewal attempts."""
+    def __init__(self, renewable):
+        self.renewable = renewable
+        self.renewals = 0
+
+    def get_cache_key(self, start_url):
+        return 'cache-key'
+
+    def needs_refresh(self, start_url):
+        return False
+
+    def get_expiration(self, start_url):
+        return NOW + datetime.timedelta(minutes=30)
+
+    def refresh_deadline(self, start_url):
+        return NOW + datetime.timedelta(minutes=15)
+
+    def get_refresh_status(self, start_url):
+        return self.needs_refresh(start_url), self.refresh_deadline(start_url)
+
+    def can_renew(self, start_url):
+        return self.renewable
+
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        assert renew
+        self.renewals += 1
+        raise RenewalUnavailableError()
+
+def get_config(token_fetcher):
+    profiles = {'profile': {'sso_start_url': START_URL, 'sso_region': 'us-east-1'}}
+    config = Config(lambda: profiles, lambda region: token_fetcher,
+        time_fetcher=lambda: NOW, renewal_jitter=datetime.timedelta(0))
+    config.reload()
+    return config
+
+def test_no_renewal_without_refresh_token(qt_app):
+    config = get_config(RenewalTokenFetcher(renewable=False))
+    assert 'instance' not in config._renewal_scheduler
+
+def test_failed_renewal_is_not_retried_for_the_same_token(qt_app):
+    token_fetcher = RenewalTokenFetcher(renewable=True)
+    config = get_config(token_fetcher)
+    assert 'instance' in config._renewal_scheduler
+    # without a refresh engine running it, the renewal is synchronous
+    config.sso_instances['instance']._refresh_engine = None
+    config._on_renewal_due('instance')
+    assert token_fetcher.renewals == 1
+    # the token is left alone, and still good
+    assert config.sso_instances['instance'].get_status() == 'valid'
+    assert 'instance' not in config._renewal_scheduler
+    config.shutdown(1)
+
+class BlockingRenewalTokenFetcher(RenewalTokenFetcher):
+    """Renewals block until released, then fail; other fetches log in."""
+    def __init__(self):
+        super().__init__(renewable=True)
+        self.release = threading.Event()
+        self.fetches = []
+
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        self.fetches.append('renew' if renew else 'refresh')
+        if renew:
+            self.release.wait(5)
+            raise RenewalUnavailableError()
+        return NOW + datetime.timedelta(hours=8)
+
+def test_click_during_renewal_is_not_lost(process_events):
+    token_fetcher = BlockingRenewalTokenFetcher()
+    config = get_config(token_fetcher)
+    config._on_renewal_due('instance')
+    config.refresh('instance')
+    token_fetcher.release.set()
+    process_events(lambda: not config.is_refreshing('instance'))
+    assert token_fetcher.fetches == ['renew', 'refresh']
+    instance = config.sso_instances['instance']
+    assert instance.get_status() == 'valid'
+    assert instance.expiration == NOW + datetime.timedelta(hours=8)
+    config.shutdown(1)
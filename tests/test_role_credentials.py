@@ -0,0 +1,212 @@
+import datetime
+import threading
+
+import botocore.session
+from botocore.stub import Stubber
+
+from aws_sso_login_gui.config import Config, STATUS_VALID
+from aws_sso_login_gui.role_credentials import RoleCredentialsFetcher
+
+START_URL = 'https://instance.awsapps.com/start'
+SSO_ID = 'instance'
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+def credentials_response(expires_in=3600, key='AKID'):
+    expiration = NOW + datetime.timedelta(seconds=expires_in)
+    return {'roleCredentials': {
+        'accessKeyId': key,
+        'secretAccessKey': 'secret',
+        'sessionToken': 'session',
+        'expiration': int(expiration.timestamp() * 1000),
+    }}
+
+def get_stubbed_fetcher(clock):
+    client = botocore.session.Session().create_client('sso', region_name='us-east-1',
+        aws_access_key_id='x', aws_secret_access_key='x')
+    stubber = Stubber(client)
+    fetcher = RoleCredentialsFetcher('us-east-1',
+        client_creator=lambda *args, **kwargs: client,
+        time_fetcher=lambda: clock[0])
+    return fetcher, stubber
+
+def expect_call(stubber, access_token='token', **kwargs):
+    stubber.add_response('get_role_credentials', credentials_response(**kwargs), {
+        'roleName': 'Role', 'accountId': '123456789012', 'accessToken': access_token,
+    })
+
+def test_credentials_are_cached():
+    clock = [NOW]
+    fetcher, stubber = get_stubbed_fetcher(clock)
+    expect_call(stubber)
+    with stubber:
+        first = fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'token')
+        second = fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'token')
+    stubber.assert_no_pending_responses()
+    assert first == second
+    assert first['AccessKeyId'] == 'AKID'
+    assert first['Version'] == 1
+    assert fetcher.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+def test_credentials_in_expiry_window_are_fetched_again():
+    clock = [NOW]
+    fetcher, stubber = get_stubbed_fetcher(clock)
+    expect_call(stubber, key='OLD')
+    expect_call(stubber, key='NEW')
+    with stubber:
+        assert fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'token')['AccessKeyId'] == 'OLD'
+        # 20 minute window on a 60 minute lifetime
+        clock[0] = NOW + datetime.timedelta(minutes=41)
+        assert fetcher.get_cached_credentials(START_URL, '123456789012', 'Role') is None
+        assert fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'token')['AccessKeyId'] == 'NEW'
+    stubber.assert_no_pending_responses()
+
+def test_credentials_from_another_access_token_are_not_used():
+    clock = [NOW]
+    fetcher, stubber = get_stubbed_fetcher(clock)
+    expect_call(stubber, access_token='old-token', key='OLD')
+    expect_call(stubber, access_token='new-token', key='NEW')
+    with stubber:
+        fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'old-token')
+        credentials = fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'new-token')
+    stubber.assert_no_pending_responses()
+    assert credentials['AccessKeyId'] == 'NEW'
+
+def test_invalidate():
+    clock = [NOW]
+    fetcher, stubber = get_stubbed_fetcher(clock)
+    expect_call(stubber)
+    with stubber:
+        fetcher.fetch_credentials(START_URL, '123456789012', 'Role', 'token')
+    fetcher.invalidate('https://other.awsapps.com/start')
+    assert fetcher.get_cached_credentials(START_URL, '123456789012', 'Role') is not None
+    fetcher.invalidate(START_URL)
+    assert fetcher.get_cached_credentials(START_URL, '123456789012', 'Role') is None
+
+class StubTokenFetcher(object):
+    """A token fetcher with a valid token, whose fetches block until released."""
+    def __init__(self):
+        self.access_token = 'token'
+        self.expiration = NOW + datetime.timedelta(hours=8)
+        self.release = threading.Event()
+
+    def get_cache_key(self, start_url):
+        return 'cache-key'
+
+    def get_access_token(self, start_url):
+        return self.access_token
+
+    def needs_refresh(self, start_url):
+        return self.access_token is None
+
+    def refresh_deadline(self, start_url):
+        return self.expiration
+
+    def get_refresh_status(self, start_url):
+        return self.needs_refresh(start_url), self.refresh_deadline(start_url)
+
+    def get_expiration(self, start_url):
+        return self.expiration
+
+    def fetch_token(self, start_url, force_refresh=False, renew=False):
+        self.release.wait(5)
+        return self.expiration
+
+class BlockingSSOClient(object):
+    """Counts GetRoleCredentials calls, which block until released."""
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def get_role_credentials(self, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        return credentials_response(expires_in=8 * 3600)
+
+def get_config(token_fetcher, client, **kwargs):
+    profiles = {'profile': {
+        'sso_start_url': START_URL,
+        'sso_region': 'us-east-1',
+        'sso_account_id': '123456789012',
+        'sso_role_name': 'Role',
+    }}
+    def role_credentials_fetcher_creator(region):
+        return RoleCredentialsFetcher(region, client_creator=lambda *args, **kwargs: client,
+            time_fetcher=lambda: NOW)
+    config = Config(lambda: profiles, lambda region: token_fetcher,
+        time_fetcher=lambda: NOW,
+        proactive_renewal=False,
+        role_credentials_fetcher_creator=role_credentials_fetcher_creator,
+        **kwargs)
+    config.reload()
+    assert config.sso_instances[SSO_ID].get_status() == STATUS_VALID
+    return config
+
+def test_concurrent_requests_share_one_fetch(process_events):
+    client = BlockingSSOClient()
+    config = get_config(StubTokenFetcher(), client)
+    results = []
+    callback = lambda credentials, exception: results.append((credentials, exception))
+    config.get_role_credentials('profile', callback)
+    config.get_role_credentials('profile', lambda *args: callback(*args))
+    client.release.set()
+    process_events(lambda: len(results) == 2)
+    assert client.calls == 1
+    assert results[0] == results[1]
+    assert results[0][1] is None
+    config.shutdown(1)
+
+def test_role_credentials_dont_wait_on_logins(process_events):
+    token_fetcher = StubTokenFetcher()
+    client = BlockingSSOClient()
+    client.release.set()
+    # with every refresh worker taken
+    config = get_config(token_fetcher, client, max_refresh_workers=1)
+    # a login that's waiting on the user
+    config.refresh(SSO_ID, True)
+    # the token is still valid while the new one is fetched
+    results = []
+    config.get_role_credentials('profile', lambda *args: results.append(args))
+    process_events(lambda: results)
+    assert results[0][1] is None
+    assert config.is_refreshing(SSO_ID)
+    token_fetcher.release.set()
+    process_events(lambda: not config.is_refreshing(SSO_ID))
+    config.shutdown(1)
+
+def test_token_change_invalidates_cached_credentials(process_events):
+    token_fetcher = StubTokenFetcher()
+    client = BlockingSSOClient()
+    client.release.set()
+    config = get_config(token_fetcher, client)
+    results = []
+    config.get_role_credentials('profile', lambda *args: results.append(args))
+    process_events(lambda: len(results) == 1)
+    # logged out, e.g. the token was deleted from the cache
+    token_fetcher.access_token = None
+    config.update_token_status(['cache-key'])
+    fetcher = config._role_credentials_fetchers['us-east-1']
+    assert fetcher.stats()['size'] == 0
+    # and logged in again
+    token_fetcher.access_token = 'new-token'
+    config.update_token_status(['cache-key'])
+    config.get_role_credentials('profile', lambda *args: results.append(args))
+    process_events(lambda: len(results) == 2)
+    assert client.calls == 2
+    config.shutdown(1)
+
+def test_force_refresh_invalidates_cached_credentials(process_events):
+    token_fetcher = StubTokenFetcher()
+    token_fetcher.release.set()
+    client = BlockingSSOClient()
+    client.release.set()
+    config = get_config(token_fetcher, client)
+    results = []
+    config.get_role_credentials('profile', lambda *args: results.append(args))
+    process_events(lambda: len(results) == 1)
+    fetcher = config._role_credentials_fetchers['us-east-1']
+    assert fetcher.stats()['size'] == 1
+    config.refresh(SSO_ID, True)
+    assert fetcher.stats()['size'] == 0
+    process_events(lambda: not config.is_refreshing(SSO_ID))
+    config.shutdown(1)
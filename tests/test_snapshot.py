@@ -0,0 +1,126 @@
+import datetime
+
+from aws_sso_login_gui.config import Config, STATUS_VALID, STATUS_EXPIRED, STATUS_DISABLED
+from aws_sso_login_gui.paths import get_snapshot_path
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+def start_url(name):
+    return 'https://{}.awsapps.com/start'.format(name)
+
+class StubTokenFetcher(object):
+    """Tokens that don't change, with their refresh deadlines by start URL."""
+    def __init__(self, deadlines):
+        self.deadlines = deadlines
+
+    def get_cache_key(self, start_url):
+        return start_url
+
+    def get_refresh_status(self, start_url):
+        deadline = self.deadlines.get(start_url)
+        return deadline is None or deadline <= NOW, deadline
+
+    def get_expiration(self, start_url):
+        return self.deadlines.get(start_url)
+
+    def can_renew(self, start_url):
+        return False
+
+class Recorder(object):
+    def __init__(self, config):
+        self.instances_changed = []
+        self.statuses = []
+        config.instances_changed.connect(lambda *args: self.instances_changed.append(args))
+        config.status_changed.connect(lambda *args: self.statuses.append(args))
+
+    def clear(self):
+        self.instances_changed.clear()
+        self.statuses.clear()
+
+def get_config(path, names, deadlines, region='us-east-1'):
+    profiles = {
+        'profile-{}'.format(name): {'sso_start_url': start_url(name), 'sso_region': region}
+        for name in names
+    }
+    token_fetcher = StubTokenFetcher({start_url(name): deadline for name, deadline in deadlines.items()})
+    return Config(lambda: profiles, lambda region: token_fetcher,
+        time_fetcher=lambda: NOW, proactive_renewal=False, snapshot_path=path)
+
+def hours(n):
+    return NOW + datetime.timedelta(hours=n)
+
+def test_reload_after_restore_only_emits_differences(tmp_path, qt_app):
+    path = str(tmp_path / 'snapshot.json')
+    config = get_config(path, ['a', 'b', 'c'], {'a': hours(8), 'c': hours(4)})
+    config.reload()
+    config.save_snapshot()
+
+    # the next run: c is gone, d is new, b was logged in by another tool,
+    # and c's token expired
+    config = get_config(path, ['a', 'b', 'd'], {'a': hours(8), 'b': hours(6)})
+    recorder = Recorder(config)
+    config.restore_snapshot()
+    assert recorder.instances_changed == [(['a', 'b', 'c'], [], [])]
+    assert recorder.statuses == [
+        ('a', STATUS_VALID, hours(8).isoformat()),
+        ('b', STATUS_EXPIRED, ''),
+        ('c', STATUS_VALID, hours(4).isoformat()),
+    ]
+
+    recorder.clear()
+    config.reload()
+    assert recorder.instances_changed == [(['d'], ['c'], [])]
+    assert sorted(recorder.statuses) == [
+        ('b', STATUS_VALID, hours(6).isoformat()),
+        ('d', STATUS_EXPIRED, ''),
+    ]
+
+def test_changed_region_is_emitted_after_restore(tmp_path, qt_app):
+    path = str(tmp_path / 'snapshot.json')
+    config = get_config(path, ['a'], {'a': hours(8)})
+    config.reload()
+    config.save_snapshot()
+
+    config = get_config(path, ['a'], {'a': hours(8)}, region='eu-west-1')
+    recorder = Recorder(config)
+    config.restore_snapshot()
+    recorder.clear()
+    config.reload()
+    assert recorder.instances_changed == [([], [], ['a'])]
+    assert recorder.statuses == [('a', STATUS_VALID, hours(8).isoformat())]
+
+def test_enabled_setting_survives_restart(tmp_path, qt_app):
+    path = str(tmp_path / 'snapshot.json')
+    config = get_config(path, ['a', 'b'], {'a': hours(8), 'b': hours(8)})
+    config.reload()
+    config.set_enable('a', False)
+    config.shutdown(0)
+
+    config = get_config(path, ['a', 'b'], {'a': hours(8), 'b': hours(8)})
+    recorder = Recorder(config)
+    config.restore_snapshot()
+    assert recorder.statuses == [
+        ('a', STATUS_DISABLED, ''),
+        ('b', STATUS_VALID, hours(8).isoformat()),
+    ]
+    recorder.clear()
+    config.reload()
+    assert not config.sso_instances['a'].enabled
+    assert config.sso_instances['b'].enabled
+    assert recorder.statuses == []
+
+    # re-enabling is remembered too
+    config.set_enable('a', True)
+    config.shutdown(0)
+    config = get_config(path, ['a', 'b'], {'a': hours(8), 'b': hours(8)})
+    config.reload()
+    assert config.sso_instances['a'].enabled
+
+def test_snapshot_is_in_the_app_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    path = get_snapshot_path()
+    assert path == str(tmp_path / 'data' / 'aws-sso-login-gui' / 'snapshot.json')
+    assert get_snapshot_path('~') == path
+    assert get_snapshot_path(str(tmp_path / 'other')) != path
+    assert '.aws' not in path
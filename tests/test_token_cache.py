@@ -0,0 +1,47 @@
+import os
+import json
+import datetime
+
+from aws_sso_login_gui.token_fetcher import MemoryCachedJSONFileCache, SSOTokenFetcher
+from aws_sso_login_gui.config import SSOInstance, STATUS_VALID
+
+START_URL = 'https://instance.awsapps.com/start'
+
+def write(path, value, mtime_ns):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f)
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    os.replace(tmp_path, path)
+
+def test_replaced_file_with_same_mtime_and_size_is_reread(tmp_path):
+    cache = MemoryCachedJSONFileCache(str(tmp_path))
+    path = cache.get_path('key')
+    mtime_ns = 1600000000 * 10**9
+    write(path, {'accessToken': 'aaaa'}, mtime_ns)
+    assert cache['key'] == {'accessToken': 'aaaa'}
+    assert cache['key'] == {'accessToken': 'aaaa'}
+    assert cache.hits == 1
+    # another process replaces it within the mtime resolution
+    write(path, {'accessToken': 'bbbb'}, mtime_ns)
+    assert cache['key'] == {'accessToken': 'bbbb'}
+
+def test_expiration_is_parsed_once(tmp_path):
+    cache = MemoryCachedJSONFileCache(str(tmp_path))
+    write(cache.get_path('key'), {'accessToken': 'aaaa', 'expiresAt': '2020-01-01T08:00:00UTC'}, 1600000000 * 10**9)
+    expires_at = cache['key']['expiresAt']
+    assert expires_at == datetime.datetime(2020, 1, 1, 8, tzinfo=datetime.timezone.utc)
+    assert cache['key']['expiresAt'] is expires_at
+
+def test_status_update_is_one_lookup(tmp_path, qt_app):
+    now = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    cache = MemoryCachedJSONFileCache(str(tmp_path))
+    fetcher = SSOTokenFetcher('us-east-1', client_creator=None, cache=cache, time_fetcher=lambda: now)
+    cache[fetcher.get_cache_key(START_URL)] = {
+        'startUrl': START_URL,
+        'accessToken': 'aaaa',
+        'expiresAt': now + datetime.timedelta(hours=8),
+    }
+    instance = SSOInstance('instance', START_URL, 'us-east-1', fetcher, time_fetcher=lambda: now)
+    assert instance.get_status(update=True) == STATUS_VALID
+    assert cache.hits + cache.misses == 1
@@ -0,0 +1,143 @@
+import datetime
+
+import pytest
+
+from botocore.stub import ANY
+
+from aws_sso_login_gui.token_fetcher import SSOTokenFetcher, RenewalUnavailableError
+from aws_sso_login_gui.metrics import MetricsRegistry
+
+START_URL = 'https://instance.awsapps.com/start'
+
+NOW = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+def get_fetcher(client, token):
+    logins = []
+    fetcher = SSOTokenFetcher('us-east-1', lambda *args, **kwargs: client,
+        cache={},
+        on_pending_authorization=lambda **kwargs: logins.append(kwargs),
+        time_fetcher=lambda: NOW,
+        sleep=lambda interval: None,
+        metrics=MetricsRegistry())
+    fetcher._cache[fetcher.get_cache_key(START_URL)] = token
+    return fetcher, logins
+
+def get_token(expires_in, registration_expires_in=datetime.timedelta(days=30)):
+    return {
+        'startUrl': START_URL,
+        'region': 'us-east-1',
+        'accessToken': 'old-token',
+        'expiresAt': NOW + expires_in,
+        'refreshToken': 'refresh-token',
+        'clientId': 'client-id',
+        'clientSecret': 'client-secret',
+        'registrationExpiresAt': NOW + registration_expires_in,
+    }
+
+def add_refresh(stubber, response):
+    stubber.add_response('create_token', response, {
+        'grantType': 'refresh_token',
+        'clientId': 'client-id',
+        'clientSecret': 'client-secret',
+        'refreshToken': 'refresh-token',
+    })
+
+def add_device_flow(stubber):
+    stubber.add_response('register_client', {
+        'clientId': 'new-client-id',
+        'clientSecret': 'new-client-secret',
+        'clientSecretExpiresAt': int((NOW + datetime.timedelta(days=90)).timestamp()),
+    }, {'clientName': ANY, 'clientType': 'public', 'scopes': ['sso:account:access']})
+    stubber.add_response('start_device_authorization', {
+        'deviceCode': 'device-code',
+        'userCode': 'user-code',
+        'verificationUri': 'https://device.sso.us-east-1.amazonaws.com/',
+        'verificationUriComplete': 'https://device.sso.us-east-1.amazonaws.com/?user_code=user-code',
+        'expiresIn': 600,
+        'interval': 1,
+    }, {'clientId': 'new-client-id', 'clientSecret': 'new-client-secret', 'startUrl': START_URL})
+    stubber.add_client_error('create_token', 'AuthorizationPendingException')
+    stubber.add_response('create_token', {
+        'accessToken': 'device-flow-token',
+        'expiresIn': 8 * 3600,
+        'refreshToken': 'new-refresh-token',
+    }, {
+        'grantType': 'urn:ietf:params:oauth:grant-type:device_code',
+        'clientId': 'new-client-id',
+        'clientSecret': 'new-client-secret',
+        'deviceCode': 'device-code',
+    })
+
+def get_cached_token(fetcher):
+    return fetcher._cache[fetcher.get_cache_key(START_URL)]
+
+def test_expired_token_is_refreshed_without_logging_in(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=5)))
+    add_refresh(stubber, {'accessToken': 'new-token', 'expiresIn': 8 * 3600})
+    deadline = fetcher.fetch_token(START_URL)
+    stubber.assert_no_pending_responses()
+    assert logins == []
+    token = get_cached_token(fetcher)
+    assert token['accessToken'] == 'new-token'
+    assert token['expiresAt'] == NOW + datetime.timedelta(hours=8)
+    assert deadline == token['expiresAt'] - datetime.timedelta(minutes=15)
+    # without a new refresh token in the response, the old one is kept
+    assert token['refreshToken'] == 'refresh-token'
+    assert token['clientId'] == 'client-id'
+
+def test_refresh_token_is_replaced_when_rotated(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=20)))
+    add_refresh(stubber, {'accessToken': 'new-token', 'expiresIn': 8 * 3600, 'refreshToken': 'rotated'})
+    fetcher.fetch_token(START_URL, renew=True)
+    stubber.assert_no_pending_responses()
+    assert logins == []
+    assert get_cached_token(fetcher)['refreshToken'] == 'rotated'
+
+@pytest.mark.parametrize('error_code', ['InvalidGrantException', 'ExpiredTokenException'])
+def test_rejected_refresh_token_falls_back_to_logging_in(sso_oidc, error_code):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=5)))
+    stubber.add_client_error('create_token', error_code)
+    add_device_flow(stubber)
+    fetcher.fetch_token(START_URL)
+    stubber.assert_no_pending_responses()
+    assert len(logins) == 1
+    token = get_cached_token(fetcher)
+    assert token['accessToken'] == 'device-flow-token'
+    assert token['refreshToken'] == 'new-refresh-token'
+    assert token['clientId'] == 'new-client-id'
+
+def test_rejected_refresh_token_does_not_log_in_to_renew(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=20)))
+    stubber.add_client_error('create_token', 'InvalidGrantException')
+    with pytest.raises(RenewalUnavailableError):
+        fetcher.fetch_token(START_URL, renew=True)
+    stubber.assert_no_pending_responses()
+    assert logins == []
+    assert get_cached_token(fetcher)['accessToken'] == 'old-token'
+
+def test_expired_registration_is_not_used_to_refresh(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=5),
+        registration_expires_in=datetime.timedelta(seconds=-1)))
+    assert not fetcher.can_renew(START_URL)
+    # straight to logging in, with a new registration
+    add_device_flow(stubber)
+    fetcher.fetch_token(START_URL)
+    stubber.assert_no_pending_responses()
+    assert len(logins) == 1
+    token = get_cached_token(fetcher)
+    assert token['clientId'] == 'new-client-id'
+    assert token['registrationExpiresAt'] == NOW + datetime.timedelta(days=90)
+
+def test_expired_registration_is_not_renewed(sso_oidc):
+    client, stubber = sso_oidc
+    fetcher, logins = get_fetcher(client, get_token(expires_in=datetime.timedelta(minutes=20),
+        registration_expires_in=datetime.timedelta(seconds=-1)))
+    with pytest.raises(RenewalUnavailableError):
+        fetcher.fetch_token(START_URL, renew=True)
+    stubber.assert_no_pending_responses()
+    assert logins == []
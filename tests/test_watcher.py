@@ -0,0 +1,45 @@
+import os
+import time
+
+from aws_sso_login_gui.watcher import ConfigWatcher
+from aws_sso_login_gui.file_lock import FileLock, atomic_write
+
+def wait(qt_app, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        qt_app.processEvents()
+        time.sleep(0.01)
+
+def test_own_lock_and_temp_files_are_ignored(qt_app, process_events, tmp_path):
+    config_dir = tmp_path / '.aws'
+    token_dir = config_dir / 'sso' / 'cache'
+    os.makedirs(str(token_dir))
+    config_file = str(config_dir / 'config')
+    atomic_write(config_file, '[default]\n')
+
+    watcher = ConfigWatcher([config_file], str(token_dir), debounce_ms=10)
+    config_changes = []
+    token_changes = []
+    watcher.config_changed.connect(lambda: config_changes.append(True))
+    watcher.tokens_changed.connect(token_changes.append)
+    watcher.start()
+    try:
+        # what the config writer and token fetcher leave next to their files
+        with FileLock(config_file + '.lock'):
+            pass
+        with FileLock(str(token_dir / 'key.lock')):
+            pass
+        with open(str(config_dir / '.config.1.2.tmp'), 'w') as f:
+            f.write('partial')
+        os.remove(str(config_dir / '.config.1.2.tmp'))
+        wait(qt_app, 0.3)
+        assert config_changes == []
+        assert token_changes == []
+
+        atomic_write(config_file, '[default]\nregion = us-east-1\n')
+        process_events(lambda: config_changes)
+        atomic_write(str(token_dir / 'key.json'), '{}')
+        process_events(lambda: token_changes)
+        assert token_changes == [['key']]
+    finally:
+        watcher.stop()
@@ -0,0 +1,32 @@
+from PyQt5.QtGui import QIcon
+
+from aws_sso_login_gui import fakes
+from aws_sso_login_gui.config import Config
+from aws_sso_login_gui.widgets import AWSSSOLoginWindow
+
+def get_rows(window):
+    layout = window.instances_grid_layout
+    rows = []
+    for row in range(1, layout.rowCount()):
+        item = layout.itemAtPosition(row, 1)
+        if item is not None:
+            rows.append(item.widget().text())
+    return rows
+
+def test_rows_stay_sorted_without_gaps(qt_app):
+    config = Config(lambda: {}, fakes.get_token_fetcher_creator(on_pending_authorization=lambda **kwargs: None))
+    window = AWSSSOLoginWindow(QIcon(), config)
+    try:
+        window.on_instances_changed(['b', 'd'], [], [])
+        assert get_rows(window) == ['b', 'd']
+        window.on_instances_changed(['c', 'a'], [], [])
+        assert get_rows(window) == ['a', 'b', 'c', 'd']
+        window.on_instances_changed([], ['b'], [])
+        assert get_rows(window) == ['a', 'c', 'd']
+        assert window.instances_grid_layout.itemAtPosition(4, 1) is None
+        window.on_instances_changed(['e'], ['a'], [])
+        assert get_rows(window) == ['c', 'd', 'e']
+        assert window.instances_grid_layout.itemAtPosition(4, 1) is None
+    finally:
+        window.deleteLater()
+        qt_app.processEvents()